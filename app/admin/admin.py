@@ -3,6 +3,7 @@ import warnings
 from flask import Flask
 from flask_admin import Admin
 
+from app import response_cache  # noqa: F401 pylint: disable=unused-import
 from app.admin.views import (
     CharacteristicView,
     OrderItemView,
@@ -14,8 +15,8 @@ from app.admin.views import (
     ShippingAddressView,
     UserView,
 )
-from app.db import models
-from app.db.database import get_session
+from app.db import models, search  # noqa: F401 pylint: disable=unused-import
+from app.db.database import get_routing_session
 
 
 def create_app() -> Flask:
@@ -23,7 +24,8 @@ def create_app() -> Flask:
     app.secret_key = 'very_secret_key'
     admin = Admin(app)
 
-    session = get_session()()
+    # the list views read from the replicas, the edits go to the primary
+    session = get_routing_session()()
     with warnings.catch_warnings():
         warnings.filterwarnings('ignore', 'Fields missing from ruleset', UserWarning)
         admin.add_view(CharacteristicView(models.Characteristic, session))
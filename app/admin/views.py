@@ -1,7 +1,20 @@
+from typing import Any
+
 from flask_admin.contrib.sqla import ModelView
 
+from app.db import crud
+
+
+class ReferenceModelView(ModelView):
+    # categories and characteristics are cached by the API, see crud.reference_cache
+    def after_model_change(self, form: Any, model: Any, is_created: bool) -> None:
+        crud.invalidate_reference(model)
+
+    def after_model_delete(self, model: Any) -> None:
+        crud.invalidate_reference(model)
 
-class CharacteristicView(ModelView):
+
+class CharacteristicView(ReferenceModelView):
     can_delete = False
 
     form_create_rules = ['name']
@@ -12,7 +25,7 @@ class ProductCharacteristicView(ModelView):
     can_delete = False
 
 
-class ProductCategoryView(ModelView):
+class ProductCategoryView(ReferenceModelView):
     can_delete = False
 
     form_create_rules = ['name', 'description']
@@ -45,8 +58,10 @@ class OrderView(ModelView):
 class ShippingAddressView(ModelView):
     can_delete = False
     can_create = False
+    # an address is shared by all the orders shipping to it
+    can_edit = False
 
-    form_excluded_columns = ['orders']
+    column_exclude_list = ['content_hash']
 
 
 class OrderItemView(ModelView):
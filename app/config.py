@@ -10,6 +10,89 @@ basedir = Path(__file__).resolve().parent.parent
 class Settings(BaseSettings):
 
     SQLALCHEMY_DATABASE_URI: str = f'sqlite:///{basedir / "data.db"}'
+    # serve the API from the event loop through an asyncio driver
+    # (aiosqlite / asyncpg) instead of the threadpool
+    SQLALCHEMY_ASYNC: bool = False
+
+    # connection pool (ignored for in-memory sqlite, which uses a single connection),
+    # sized for the 40 threadpool workers running the sync endpoints
+    SQLALCHEMY_POOL_SIZE: int = 20
+    SQLALCHEMY_MAX_OVERFLOW: int = 20
+    SQLALCHEMY_POOL_RECYCLE: int = 3600
+    SQLALCHEMY_POOL_PRE_PING: bool = True
+
+    # read replicas (URLs, a JSON list) for the GET requests and the admin's
+    # list views. A client reads from the primary for REPLICA_STICKINESS
+    # seconds (the replication lag tolerated) after its writes; a failing
+    # replica is left out for REPLICA_RETRY_AFTER seconds.
+    SQLALCHEMY_REPLICA_URIS: list[str] = []
+    REPLICA_STICKINESS: float = 5
+    REPLICA_RETRY_AFTER: float = 30
+
+    # SQLite profile (app.db.pragmas), set on every connection
+    SQLITE_JOURNAL_MODE: str = 'wal'
+    SQLITE_SYNCHRONOUS: str = 'normal'
+    # milliseconds a connection waits for a lock before "database is locked"
+    SQLITE_BUSY_TIMEOUT: int = 5000
+    # negative: KiB, i.e. 64 MB of page cache per connection
+    SQLITE_CACHE_SIZE: int = -64000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_TEMP_STORE: str = 'memory'
+    # one writer connection (BEGIN IMMEDIATE) queueing the write requests,
+    # the reads on a pool of read-only connections
+    SQLITE_SERIALIZE_WRITES: bool = True
+
+    # how long the total of a filtered product listing may be served stale
+    PRODUCT_COUNT_CACHE_TTL: float = 60
+    PRODUCT_COUNT_CACHE_SIZE: int = 1024
+    # categories and characteristics looked up by id
+    REFERENCE_CACHE_TTL: float = 300
+    REFERENCE_CACHE_SIZE: int = 1024
+    # seconds between two recounts of the facet counts (app.db.facets), which
+    # are otherwise kept up to date by the writes; 0 turns the recount off
+    FACET_RECONCILE_INTERVAL: float = 3600
+    # seconds before the characteristic index (app.db.characteristic_index)
+    # is reloaded, to see the characteristics written by other processes
+    CHARACTERISTIC_INDEX_TTL: float = 300
+    # serialized product responses; set the Redis URL to share the cache (and
+    # its invalidation) between the API workers and the admin app
+    RESPONSE_CACHE_REDIS_URL: str = ''
+    RESPONSE_CACHE_TTL: int = 60
+    RESPONSE_CACHE_SIZE: int = 1024
+    # render the product and order responses with the compiled serializers and
+    # orjson instead of validating them through pydantic
+    FAST_SERIALIZATION: bool = True
+
+    # orders are paid by background workers through the gateway: 'fake' (the
+    # local stand-in below) or the import path of a gateway class
+    PAYMENT_GATEWAY: str = 'fake'
+    PAYMENT_GATEWAY_LATENCY: float = 0.5
+    PAYMENT_SUCCESS_RATE: float = 0.8
+    # 0 leaves the payments to the webhook
+    PAYMENT_WORKERS: int = 32
+    PAYMENT_POLL_INTERVAL: float = 0.5
+    # a charge which raises is retried after PAYMENT_RETRY_DELAY seconds,
+    # doubled at every attempt; the order fails after PAYMENT_MAX_ATTEMPTS
+    PAYMENT_RETRY_DELAY: float = 1
+    PAYMENT_MAX_ATTEMPTS: int = 5
+    # a worker claims an order before charging it; its claim expires (and the
+    # order is charged again, with the same idempotency key) after this long
+    PAYMENT_CLAIM_TIMEOUT: float = 60
+    # the webhook is disabled while there's no secret
+    PAYMENT_WEBHOOK_SECRET: str = ''
+
+    # per-request metrics on /metrics (Prometheus), optionally logged as JSON
+    METRICS_ENABLED: bool = True
+    METRICS_LOG: bool = False
+
+    # development and staging: log the statements slower than this (seconds)
+    # with their parameters and plan, and the requests running a statement
+    # more than this many times (N+1 queries); 0 turns them off
+    SLOW_QUERY_THRESHOLD: float = 0
+    N_PLUS_ONE_THRESHOLD: int = 0
+
+    # how long (seconds) an Idempotency-Key of POST /api/orders/ is remembered
+    IDEMPOTENCY_KEY_TTL: float = 24 * 3600
 
 
 @lru_cache()
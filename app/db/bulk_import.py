@@ -0,0 +1,247 @@
+"""Bulk product import from supplier feeds (NDJSON or CSV).
+
+The feed is read lazily and handled in chunks: every row is validated against
+``schemas.ProductCreate``, the categories, characteristics and SKUs a chunk
+refers to are resolved with one query each, and the products, their inventory
+and characteristic values are written with executemany inserts. Rows that
+can't be imported end up in the report, the others are imported.
+"""
+import csv
+import json
+import re
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator
+
+import sqlalchemy as sa
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app.db import characteristic_index, crud, facets, models, schemas, search
+from app.exceptions import (
+    CategoryNotFound,
+    CharacteristicNotFound,
+    DuplicateCharacteristic,
+    ProductAlreadyRegistered,
+    WrongPrice,
+)
+
+CHUNK_SIZE = 5000
+
+# (line number, parsed record); a record which couldn't be parsed is a ValueError
+Row = tuple[int, Any]
+
+# CSV feeds carry characteristic values in "characteristic_<id>" columns
+CHARACTERISTIC_COLUMN = re.compile(r'characteristic_(\d+)$')
+
+
+# feeds are decoded with errors='replace': the bytes which aren't UTF-8 become
+# U+FFFD, and the rows holding them are rejected instead of failing the import
+UNDECODABLE = '\ufffd'
+INVALID_ENCODING = 'invalid UTF-8'
+
+
+def read_ndjson(lines: Iterable[str]) -> Iterator[Row]:
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        if UNDECODABLE in line:
+            yield number, ValueError(INVALID_ENCODING)
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as err:
+            yield number, ValueError(f'invalid JSON: {err}')
+
+
+def read_csv(lines: Iterable[str]) -> Iterator[Row]:
+    reader = csv.DictReader(lines)
+    for record in reader:
+        if UNDECODABLE in repr(list(record.values())):
+            yield reader.line_num, ValueError(INVALID_ENCODING)
+            continue
+        characteristics = []
+        for column, value in record.items():
+            match = CHARACTERISTIC_COLUMN.match(column or '')
+            if match and value:
+                characteristics.append(
+                    {
+                        'characteristic_id': match.group(1),
+                        'characteristic_value': value,
+                    }
+                )
+        record = {
+            column: value
+            for column, value in record.items()
+            if column and not CHARACTERISTIC_COLUMN.match(column)
+        }
+        yield reader.line_num, {**record, 'characteristics': characteristics}
+
+
+READERS: dict[str, Callable[[Iterable[str]], Iterator[Row]]] = {
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
+
+def _validation_message(err: ValidationError) -> str:
+    return '; '.join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+        for error in err.errors()
+    )
+
+
+def _validate(
+    chunk: list[Row], report: schemas.ImportReport
+) -> list[tuple[int, schemas.ProductCreate]]:
+    products = []
+    for number, record in chunk:
+        if isinstance(record, ValueError):
+            report.errors.append(schemas.ImportRowError(row=number, error=str(record)))
+            continue
+        try:
+            product = schemas.ProductCreate.parse_obj(record)
+        except ValidationError as err:
+            error = _validation_message(err)
+        else:
+            characteristic_ids = [
+                characteristic.characteristic_id
+                for characteristic in product.characteristics or []
+            ]
+            if product.price <= 0:
+                error = WrongPrice.detail
+            elif len(set(characteristic_ids)) != len(characteristic_ids):
+                error = DuplicateCharacteristic.detail
+            else:
+                products.append((number, product))
+                continue
+        report.errors.append(schemas.ImportRowError(row=number, error=error))
+    return products
+
+
+def _existing(db: Session, column: Any, values: set[Any]) -> set[Any]:
+    if not values:
+        return set()
+    query = sa.select(column).where(column.in_(values))
+    return set(db.connection().execute(query).scalars())
+
+
+def _import_chunk(
+    db: Session,
+    products: list[tuple[int, schemas.ProductCreate]],
+    seen_skus: set[str],
+    report: schemas.ImportReport,
+) -> None:
+    categories = _existing(
+        db, models.ProductCategory.id, {product.category_id for _, product in products}
+    )
+    characteristics = _existing(
+        db,
+        models.Characteristic.id,
+        {
+            characteristic.characteristic_id
+            for _, product in products
+            for characteristic in product.characteristics or []
+        },
+    )
+    seen_skus |= _existing(
+        db, models.Product.sku, {product.sku for _, product in products}
+    )
+
+    accepted = []
+    for number, product in products:
+        if product.category_id not in categories:
+            error = CategoryNotFound.detail
+        elif product.sku in seen_skus:
+            error = ProductAlreadyRegistered.detail
+        elif any(
+            characteristic.characteristic_id not in characteristics
+            for characteristic in product.characteristics or []
+        ):
+            error = CharacteristicNotFound.detail
+        else:
+            seen_skus.add(product.sku)
+            accepted.append(product)
+            continue
+        report.errors.append(schemas.ImportRowError(row=number, error=error))
+    if not accepted:
+        return
+
+    # plain Core on the connection: no ORM statement handling per chunk
+    connection = db.connection()
+    connection.execute(
+        sa.insert(models.Product.__table__),
+        [
+            {
+                'name': product.name,
+                'sku': product.sku,
+                'description': product.description,
+                'price': product.price,
+                'category_id': product.category_id,
+            }
+            for product in accepted
+        ],
+    )
+    # executemany can't return the new ids, the SKUs identify the rows instead
+    product_ids = dict(
+        connection.execute(
+            sa.select(models.Product.sku, models.Product.id).where(
+                models.Product.sku.in_([product.sku for product in accepted])
+            )
+        ).all()
+    )
+    connection.execute(
+        sa.insert(models.ProductInventory.__table__),
+        [{'product_id': product_id} for product_id in product_ids.values()],
+    )
+    values = [
+        {
+            'product_id': product_ids[product.sku],
+            'characteristic_id': characteristic.characteristic_id,
+            'characteristic_value': characteristic.characteristic_value,
+        }
+        for product in accepted
+        for characteristic in product.characteristics or []
+    ]
+    if values:
+        connection.execute(sa.insert(models.ProductCharacteristic.__table__), values)
+
+    # Core inserts bypass the session events which keep the indexes and the
+    # facets in sync
+    search.get_backend(connection.dialect).reindex(connection, product_ids.values())
+    facets.count_inserted(
+        db,
+        category_ids=[product.category_id for product in accepted],
+        characteristic_values=[
+            (value['characteristic_id'], value['characteristic_value'])
+            for value in values
+        ],
+    )
+    characteristic_index.record_inserted(
+        db,
+        [
+            (
+                value['product_id'],
+                value['characteristic_id'],
+                value['characteristic_value'],
+            )
+            for value in values
+        ],
+    )
+    report.imported += len(accepted)
+
+
+def import_products(
+    db: Session, rows: Iterable[Row], chunk_size: int = CHUNK_SIZE
+) -> schemas.ImportReport:
+    report = schemas.ImportReport()
+    seen_skus: set[str] = set()
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        products = _validate(chunk, report)
+        if products:
+            _import_chunk(db, products, seen_skus, report)
+
+    if report.imported:
+        crud.product_count_cache.clear()
+    report.errors.sort(key=lambda error: error.row)
+    return report
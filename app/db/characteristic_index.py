@@ -0,0 +1,281 @@
+"""In-memory inverted index of the characteristic values.
+
+Per ``(characteristic_id, characteristic_value)`` the index keeps the ids of
+the products having that value, the *postings*, in one of two forms:
+
+* a bitmap, a Python int whose bit ``n`` is set for product ``n``: it takes
+  (highest product id) / 8 bytes, and combines with others in C;
+* a sorted ``array('I')`` of the ids, 4 bytes per product.
+
+A value gets a bitmap when it's the smaller of the two, i.e. when more than
+one product id in ``BITMAP_DENSITY`` has it, and an array otherwise: a rare
+value of a 100 000 products catalogue takes a few bytes instead of 12 KB, and
+the index at most 4 bytes per ``product_characteristic`` row. A filter on
+several values of one characteristic is the OR of their postings, a filter on
+several characteristics the AND of those, all without touching the database;
+the database then only fetches the rows of the matching ids.
+
+The index is loaded from ``product_characteristic`` on first use, follows the
+writes committed by this process (from the session, like the facets; Core
+inserts call ``record_inserted``) and is reloaded every
+``CHARACTERISTIC_INDEX_TTL`` seconds to pick up the writes of the other
+processes. The reload also picks the form of each value again.
+"""
+import bisect
+import threading
+import time
+from array import array
+from typing import Any, Iterable, Optional, Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.db import models
+from app.db.facets import values_before_and_after
+
+Key = tuple[int, str]
+# (product id, key, whether the product has the value from now on)
+Change = tuple[int, Key, bool]
+# a bitmap or a sorted array of product ids
+Postings = Union[int, 'array[int]']
+
+# a bitmap takes 1 bit per id up to the highest one, an array 32 per product
+BITMAP_DENSITY = 32
+
+
+def ids_of(postings: Postings) -> list[int]:
+    """The product ids of postings, in ascending order."""
+    if isinstance(postings, array):
+        return postings.tolist()
+    bits = bin(postings)[:1:-1]
+    ids = []
+    position = bits.find('1')
+    while position != -1:
+        ids.append(position)
+        position = bits.find('1', position + 1)
+    return ids
+
+
+def count(postings: Postings) -> int:
+    """The number of product ids of postings."""
+    if isinstance(postings, array):
+        return len(postings)
+    # int.bit_count() is Python 3.10+
+    return bin(postings).count('1')
+
+
+def _bitmap_of(ids: Sequence[int]) -> int:
+    if not ids:
+        return 0
+    bitmap = bytearray(max(ids) // 8 + 1)
+    for product_id in ids:
+        bitmap[product_id >> 3] |= 1 << (product_id & 7)
+    return int.from_bytes(bitmap, 'little')
+
+
+def _postings_of(ids: list[int]) -> Postings:
+    """The smaller form for the ascending ``ids``."""
+    if ids and len(ids) * BITMAP_DENSITY > ids[-1]:
+        return _bitmap_of(ids)
+    return array('I', ids)
+
+
+def _union(postings: list[Postings]) -> Postings:
+    arrays = [ids for ids in postings if isinstance(ids, array)]
+    if len(arrays) == len(postings):
+        return array('I', sorted(set[int]().union(*arrays)))
+    bitmap = 0
+    for ids in postings:
+        bitmap |= ids if isinstance(ids, int) else _bitmap_of(ids)
+    return bitmap
+
+
+def _intersection(left: Postings, right: Postings) -> Postings:
+    if isinstance(left, int) and isinstance(right, int):
+        return left & right
+    if isinstance(left, int):
+        left, right = right, left
+    assert isinstance(left, array)
+    if isinstance(right, array):
+        return array('I', sorted(set(left).intersection(right)))
+    bits = right.to_bytes((right.bit_length() + 7) // 8, 'little')
+    return array(
+        'I',
+        (
+            product_id
+            for product_id in left
+            if product_id >> 3 < len(bits)
+            and bits[product_id >> 3] >> (product_id & 7) & 1
+        ),
+    )
+
+
+class CharacteristicIndex:
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._postings: Optional[dict[Key, Postings]] = None
+        self._loaded_at = 0.0
+        # changes committed while a load runs, replayed on its result
+        self._missed: Optional[list[Change]] = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings = None
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._postings is not None and time.monotonic() - self._loaded_at < self.ttl
+        )
+
+    def _load(self, db: Session) -> None:
+        with self._load_lock:
+            if self._is_fresh():
+                return
+            with self._lock:
+                self._missed = []
+            try:
+                ids: dict[Key, list[int]] = {}
+                for product_id, characteristic_id, value in db.execute(
+                    sa.select(
+                        models.ProductCharacteristic.product_id,
+                        models.ProductCharacteristic.characteristic_id,
+                        models.ProductCharacteristic.characteristic_value,
+                    ).where(
+                        models.ProductCharacteristic.product_id.is_not(None),
+                        models.ProductCharacteristic.characteristic_id.is_not(None),
+                    )
+                ):
+                    ids.setdefault((characteristic_id, value), []).append(product_id)
+                postings = {
+                    key: _postings_of(sorted(key_ids)) for key, key_ids in ids.items()
+                }
+            except BaseException:
+                with self._lock:
+                    self._missed = None
+                raise
+            with self._lock:
+                missed, self._missed = self._missed or [], None
+                self._postings = postings
+                self._loaded_at = time.monotonic()
+                self._apply(missed)
+
+    def _apply(self, changes: Iterable[Change]) -> None:
+        assert self._postings is not None
+        for product_id, key, has_value in changes:
+            ids = self._postings.get(key)
+            if isinstance(ids, int):
+                if has_value:
+                    self._postings[key] = ids | 1 << product_id
+                else:
+                    self._postings[key] = ids & ~(1 << product_id)
+            elif has_value:
+                ids = self._postings.setdefault(key, array('I'))
+                assert isinstance(ids, array)
+                position = bisect.bisect_left(ids, product_id)
+                if position == len(ids) or ids[position] != product_id:
+                    ids.insert(position, product_id)
+                # a value becoming common turns into a bitmap
+                if len(ids) * BITMAP_DENSITY > ids[-1]:
+                    self._postings[key] = _bitmap_of(ids)
+            elif ids is not None:
+                position = bisect.bisect_left(ids, product_id)
+                if position < len(ids) and ids[position] == product_id:
+                    del ids[position]
+
+    def apply(self, changes: list[Change]) -> None:
+        """Bring the index up to date with committed changes."""
+        with self._lock:
+            if self._missed is not None:
+                self._missed.extend(changes)
+            if self._postings is not None:
+                self._apply(changes)
+
+    def match(
+        self, db: Session, characteristic_values: dict[int, list[str]]
+    ) -> Postings:
+        """The postings of the products having one of the values of every
+        characteristic, loading the index from ``db`` if needed."""
+        if not self._is_fresh():
+            self._load(db)
+        postings = self._postings
+        assert postings is not None
+        result: Optional[Postings] = None
+        for characteristic_id, values in characteristic_values.items():
+            matching = _union(
+                [
+                    postings.get((characteristic_id, value), array('I'))
+                    for value in values
+                ]
+            )
+            result = matching if result is None else _intersection(result, matching)
+            if not count(result):
+                return 0
+        return result or 0
+
+
+index = CharacteristicIndex(ttl=get_settings().CHARACTERISTIC_INDEX_TTL)
+
+
+# Synchronization: the changes of each flush, applied to the index once the
+# transaction has committed
+_PENDING_KEY = 'characteristic_index_changes'
+
+
+def _pending(session: Session) -> list[Change]:
+    return session.info.setdefault(_PENDING_KEY, [])
+
+
+def record_inserted(
+    session: Session, rows: Iterable[tuple[Optional[int], Optional[int], str]]
+) -> None:
+    """Index (product id, characteristic id, value) rows inserted without the ORM."""
+    _pending(session).extend(
+        (product_id, (characteristic_id, value), True)
+        for product_id, characteristic_id, value in rows
+        if product_id is not None and characteristic_id is not None
+    )
+
+
+_COLUMNS = ('product_id', 'characteristic_id', 'characteristic_value')
+
+
+def _record(session: Session, values: tuple[Any, ...], has_value: bool) -> None:
+    product_id, characteristic_id, value = values
+    if product_id is not None and characteristic_id is not None:
+        _pending(session).append((product_id, (characteristic_id, value), has_value))
+
+
+@event.listens_for(Session, 'before_flush', named=True)
+def _collect_deleted(session: Session, **_: Any) -> None:
+    for instance in session.deleted:
+        if isinstance(instance, models.ProductCharacteristic):
+            before = values_before_and_after(instance, _COLUMNS)[0]
+            _record(session, before, False)
+
+
+@event.listens_for(Session, 'after_flush', named=True)
+def _collect_new_and_changed(session: Session, **_: Any) -> None:
+    for instance in (*session.new, *session.dirty):
+        if not isinstance(instance, models.ProductCharacteristic):
+            continue
+        before, after = values_before_and_after(instance, _COLUMNS)
+        if instance not in session.new and before != after:
+            _record(session, before, False)
+        if instance in session.new or before != after:
+            _record(session, after, True)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session: Session) -> None:
+    changes = session.info.pop(_PENDING_KEY, None)
+    if changes:
+        index.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changes(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
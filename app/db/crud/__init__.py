@@ -0,0 +1,61 @@
+"""Database queries, by the part of the schema they serve.
+
+The routers and jobs call them through this package: ``crud.get_product_by_id``.
+"""
+from app.db.crud.catalogue import (
+    add_product_characteristic,
+    add_product_characteristics,
+    create_characteristic,
+    create_product,
+    create_product_category,
+    get_characteristic_by_id,
+    get_characteristic_by_name,
+    get_characteristics_by_ids,
+    get_product_by_id,
+    get_product_by_sku,
+    get_product_category_by_id,
+    get_product_category_by_name,
+    invalidate_reference,
+    product_ext_options,
+    reference_cache,
+)
+from app.db.crud.facets import (
+    get_category_facets,
+    get_characteristic_facets,
+    reconcile_facets,
+)
+from app.db.crud.idempotency import (
+    claim_idempotency_key,
+    get_idempotency_key,
+    store_idempotent_response,
+)
+from app.db.crud.inventory import (
+    adjust_inventory,
+    adjust_product_quantity,
+    get_product_ids_by_sku,
+    get_short_stock,
+    lock_inventory,
+)
+from app.db.crud.listing import (
+    count_filtered_products,
+    get_characteristic_filters,
+    get_filtered_products_query,
+    get_product_sort_keys,
+    product_count_cache,
+)
+from app.db.crud.orders import (
+    add_order_item,
+    create_order,
+    get_order_by_id,
+    get_user_by_login,
+    order_options,
+    reserve_order_items,
+    upsert_order_user,
+    upsert_shipping_address,
+)
+from app.db.crud.payments import (
+    claim_payment,
+    get_pending_payments,
+    record_payment,
+    record_payment_error,
+)
@@ -0,0 +1,201 @@
+"""Categories, characteristics and products."""
+from typing import Iterable, Optional, TypeVar, Union
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached, selectinload
+
+from app import metrics
+from app.cache import TTLCache
+from app.config import get_settings
+from app.db import characteristic_index, facets, models, schemas
+
+ReferenceModel = TypeVar(
+    'ReferenceModel', models.ProductCategory, models.Characteristic
+)
+
+# Categories and characteristics hardly ever change but are looked up on every
+# product write. The cache keeps detached copies which are merged into the
+# caller's session without a query.
+reference_cache = TTLCache(
+    maxsize=get_settings().REFERENCE_CACHE_SIZE,
+    ttl=get_settings().REFERENCE_CACHE_TTL,
+)
+metrics.register_cache('reference', reference_cache)
+
+
+def _get_references(
+    db: Session, model: type[ReferenceModel], idents: Iterable[int]
+) -> dict[int, ReferenceModel]:
+    """The instances with these ids (the unknown ones are left out), the ones
+    missing from the cache loaded with a single query."""
+    references: dict[int, ReferenceModel] = {}
+    missing = []
+    for ident in set(idents):
+        cached = reference_cache.get((model.__name__, ident))
+        if cached is not None:
+            references[ident] = db.merge(cached, load=False)
+        else:
+            missing.append(ident)
+    if not missing:
+        return references
+
+    for instance in db.query(model).filter(model.id.in_(missing)):
+        detached = model(
+            **{
+                column.key: getattr(instance, column.key)
+                for column in sa.inspect(model).column_attrs
+            }
+        )
+        make_transient_to_detached(detached)
+        reference_cache.set((model.__name__, instance.id), detached)
+        references[instance.id] = instance
+    return references
+
+
+def _get_reference(
+    db: Session, model: type[ReferenceModel], ident: int
+) -> Optional[ReferenceModel]:
+    return _get_references(db, model, [ident]).get(ident)
+
+
+def invalidate_reference(
+    instance: Union[models.ProductCategory, models.Characteristic]
+) -> None:
+    reference_cache.invalidate((type(instance).__name__, instance.id))
+
+
+# Relationships serialized by schemas.ProductExt, loaded up front instead of
+# lazily per product
+product_ext_options = (
+    joinedload(models.Product.category),
+    selectinload(models.Product.characteristics).joinedload(
+        models.ProductCharacteristic.characteristic
+    ),
+)
+
+
+# Product stuff
+def get_product_category_by_name(
+    db: Session, name: str
+) -> Optional[models.ProductCategory]:
+    return (
+        db.query(models.ProductCategory)
+        .filter(models.ProductCategory.name == name)
+        .first()
+    )
+
+
+def get_product_category_by_id(
+    db: Session, category_id: int
+) -> Optional[models.ProductCategory]:
+    return _get_reference(db, models.ProductCategory, category_id)
+
+
+def create_product_category(
+    db: Session, product_category: schemas.ProductCategoryCreate
+) -> models.ProductCategory:
+    db_product_category = models.ProductCategory(**product_category.dict())
+    db.add(db_product_category)
+    db.flush()
+    invalidate_reference(db_product_category)
+    return db_product_category
+
+
+def get_characteristic_by_name(
+    db: Session, name: str
+) -> Optional[models.Characteristic]:
+    return (
+        db.query(models.Characteristic)
+        .filter(models.Characteristic.name == name)
+        .first()
+    )
+
+
+def get_characteristic_by_id(
+    db: Session, characteristic_id: int
+) -> Optional[models.Characteristic]:
+    return _get_reference(db, models.Characteristic, characteristic_id)
+
+
+def get_characteristics_by_ids(
+    db: Session, characteristic_ids: Iterable[int]
+) -> dict[int, models.Characteristic]:
+    return _get_references(db, models.Characteristic, characteristic_ids)
+
+
+def create_characteristic(
+    db: Session, characteristic: schemas.CharacteristicCreate
+) -> models.Characteristic:
+    db_characteristic = models.Characteristic(**characteristic.dict())
+    db.add(db_characteristic)
+    db.flush()
+    invalidate_reference(db_characteristic)
+    return db_characteristic
+
+
+def create_product(db: Session, product: schemas.ProductWithCategory) -> models.Product:
+    db_product = models.Product(**product.dict())
+    db.add(db_product)
+    db.flush()
+    db_product_inventory = models.ProductInventory(product_id=db_product.id)
+    db.add(db_product_inventory)
+    return db_product
+
+
+def get_product_by_id(db: Session, product_id: int) -> Optional[models.Product]:
+    return (
+        db.query(models.Product)
+        .options(*product_ext_options)
+        .filter(models.Product.id == product_id)
+        .first()
+    )
+
+
+def get_product_by_sku(db: Session, product_sku: str) -> Optional[models.Product]:
+    return db.query(models.Product).filter(models.Product.sku == product_sku).first()
+
+
+def add_product_characteristic(
+    db: Session, product_characteristic: schemas.ProductCharacteristic, product_id: int
+) -> None:
+    db_product_characteristic = models.ProductCharacteristic(
+        **product_characteristic.dict(), product_id=product_id
+    )
+    db.add(db_product_characteristic)
+    db.flush()
+
+
+def add_product_characteristics(
+    db: Session,
+    product_characteristics: list[schemas.ProductCharacteristic],
+    product_id: int,
+) -> None:
+    # one executemany, where the ORM would insert row by row for the ids
+    db.execute(
+        sa.insert(models.ProductCharacteristic),
+        [
+            {**product_characteristic.dict(), 'product_id': product_id}
+            for product_characteristic in product_characteristics
+        ],
+    )
+    facets.count_inserted(
+        db,
+        characteristic_values=[
+            (
+                product_characteristic.characteristic_id,
+                product_characteristic.characteristic_value,
+            )
+            for product_characteristic in product_characteristics
+        ],
+    )
+    characteristic_index.record_inserted(
+        db,
+        [
+            (
+                product_id,
+                product_characteristic.characteristic_id,
+                product_characteristic.characteristic_value,
+            )
+            for product_characteristic in product_characteristics
+        ],
+    )
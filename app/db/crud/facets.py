@@ -0,0 +1,39 @@
+"""The facets of the catalogue, counted by ``app.db.facets``."""
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.db import facets, models
+
+
+def get_category_facets(db: Session) -> list[sa.engine.Row]:
+    return db.execute(
+        sa.select(
+            models.CategoryFacet.category_id,
+            models.ProductCategory.name,
+            models.CategoryFacet.product_count,
+        )
+        .join(models.ProductCategory)
+        .where(models.CategoryFacet.product_count > 0)
+        .order_by(models.ProductCategory.name)
+    ).all()
+
+
+def get_characteristic_facets(db: Session) -> list[sa.engine.Row]:
+    return db.execute(
+        sa.select(
+            models.CharacteristicFacet.characteristic_id,
+            models.Characteristic.name,
+            models.CharacteristicFacet.characteristic_value,
+            models.CharacteristicFacet.product_count,
+        )
+        .join(models.Characteristic)
+        .where(models.CharacteristicFacet.product_count > 0)
+        .order_by(
+            models.Characteristic.name,
+            models.CharacteristicFacet.characteristic_value,
+        )
+    ).all()
+
+
+def reconcile_facets(db: Session) -> None:
+    facets.reconcile(db.connection())
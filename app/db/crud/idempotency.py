@@ -0,0 +1,42 @@
+"""Idempotency keys of the order requests, see ``app.idempotency``."""
+from datetime import datetime
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.dialects import UPSERT_INSERTS
+
+
+def claim_idempotency_key(
+    db: Session, key: str, request_hash: str, expired_before: datetime
+) -> bool:
+    """Insert the key, False if it is already taken.
+
+    The row is only visible to others once the caller's transaction commits;
+    a concurrent claim of the same key waits for that (or for the rollback,
+    which frees the key).
+    """
+    keys = models.IdempotencyKey.__table__
+    db.execute(sa.delete(keys).where(keys.c.created_at < expired_before))
+    insert = UPSERT_INSERTS[db.get_bind().dialect.name](keys).values(
+        key=key, request_hash=request_hash, created_at=datetime.now()
+    )
+    result = db.execute(insert.on_conflict_do_nothing(index_elements=[keys.c.key]))
+    return result.rowcount == 1  # type: ignore[no-any-return]
+
+
+def get_idempotency_key(db: Session, key: str) -> Optional[models.IdempotencyKey]:
+    return db.get(models.IdempotencyKey, key)
+
+
+def store_idempotent_response(
+    db: Session, key: str, status_code: int, response: bytes
+) -> None:
+    keys = models.IdempotencyKey.__table__
+    db.execute(
+        sa.update(keys)
+        .where(keys.c.key == key)
+        .values(status_code=status_code, response=response)
+    )
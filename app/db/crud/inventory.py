@@ -0,0 +1,115 @@
+"""Quantities in stock."""
+from typing import Any, Iterable, Iterator, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+INVENTORY_BATCH_SIZE = 1000
+
+
+def get_product_ids_by_sku(db: Session, skus: Iterable[str]) -> dict[str, int]:
+    return dict(
+        db.query(models.Product.sku, models.Product.id)
+        .filter(models.Product.sku.in_(set(skus)))
+        .all()
+    )
+
+
+def lock_inventory(db: Session, product_ids: Iterable[int]) -> list[int]:
+    """Lock the inventory rows of the products, return the ids that have one."""
+    # Lock in a deterministic order, so that two transactions sharing products
+    # can't deadlock (FOR UPDATE is not rendered on sqlite, where the first
+    # write of the transaction takes the database write lock)
+    return [
+        product_id
+        for (product_id,) in db.query(models.ProductInventory.product_id)
+        .filter(models.ProductInventory.product_id.in_(set(product_ids)))
+        .order_by(models.ProductInventory.product_id)
+        .with_for_update()
+    ]
+
+
+def adjust_product_quantity(
+    db: Session, product_id: int, delta: int
+) -> Optional[sa.engine.Row]:
+    """Add ``delta`` to the quantity in stock with one atomic UPDATE.
+
+    Returns the updated inventory row, or None if the product has none or the
+    quantity would become negative.
+    """
+    inventory = models.ProductInventory.__table__
+    update = (
+        sa.update(inventory)
+        .where(inventory.c.product_id == product_id, inventory.c.quantity + delta >= 0)
+        .values(quantity=inventory.c.quantity + delta)
+    )
+    if db.get_bind().dialect.full_returning:
+        return db.execute(update.returning(*inventory.c)).first()
+
+    if db.execute(update).rowcount != 1:
+        return None
+    return db.execute(
+        sa.select(inventory).where(inventory.c.product_id == product_id)
+    ).first()
+
+
+def _inventory_batches(deltas: dict[int, int]) -> Iterator[tuple[list[int], Any]]:
+    """The product ids in batches, each with its deltas as a CASE expression."""
+    product_ids = sorted(deltas)
+    for start in range(0, len(product_ids), INVENTORY_BATCH_SIZE):
+        batch = product_ids[start : start + INVENTORY_BATCH_SIZE]
+        yield batch, sa.case(
+            {product_id: deltas[product_id] for product_id in batch},
+            value=models.ProductInventory.product_id,
+        )
+
+
+def adjust_inventory(
+    db: Session, deltas: dict[int, int]
+) -> Optional[list[models.ProductInventory]]:
+    """Add the deltas to the quantities in stock, return the updated rows.
+
+    Returns None if some quantity would become negative (or the product has no
+    inventory row); in that case the transaction has to be rolled back by the
+    caller.
+    """
+    product_ids = sorted(deltas)
+    for batch, delta in _inventory_batches(deltas):
+        result = db.execute(
+            sa.update(models.ProductInventory)
+            .where(
+                models.ProductInventory.product_id.in_(batch),
+                models.ProductInventory.quantity + delta >= 0,
+            )
+            .values(quantity=models.ProductInventory.quantity + delta)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(batch):
+            return None
+
+    return (
+        db.query(models.ProductInventory)
+        .filter(models.ProductInventory.product_id.in_(product_ids))
+        .order_by(models.ProductInventory.product_id)
+        .populate_existing()
+        .all()
+    )
+
+
+def get_short_stock(db: Session, deltas: dict[int, int]) -> list[int]:
+    """The products whose quantity in stock the deltas would make negative."""
+    short = []
+    for batch, delta in _inventory_batches(deltas):
+        short.extend(
+            db.execute(
+                sa.select(models.ProductInventory.product_id)
+                .where(
+                    models.ProductInventory.product_id.in_(batch),
+                    models.ProductInventory.quantity + delta < 0,
+                )
+                .order_by(models.ProductInventory.product_id)
+            ).scalars()
+        )
+    return short
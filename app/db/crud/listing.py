@@ -0,0 +1,130 @@
+"""The filtered, sorted and counted product listings."""
+import sqlalchemy as sa
+from sqlalchemy.orm import Query, Session
+
+from app.cache import TTLCache
+from app.config import get_settings
+from app.db import characteristic_index, models, schemas, search
+from app.db.crud.catalogue import product_ext_options
+from app.db.keyset import SortKey, order_by_clauses
+
+# characteristic filters matching up to this many products fetch them by id,
+# beyond that the subqueries win (python -m benchmarks.bench_characteristics)
+INDEXED_IDS_LIMIT = 5000
+
+
+def get_characteristic_filters(
+    db: Session, characteristic_values: dict[int, list[str]]
+) -> list[sa.sql.ColumnElement]:
+    """Filters on the characteristic values, matched in the characteristic index.
+
+    The database gets the ids of the matching products, unless there are too
+    many of them: then it checks the values itself, the most selective first.
+    """
+    matching = characteristic_index.index.match(db, characteristic_values)
+    if not matching:
+        return [sa.false()]
+    if characteristic_index.count(matching) <= INDEXED_IDS_LIMIT:
+        return [models.Product.id.in_(characteristic_index.ids_of(matching))]
+
+    def selectivity(characteristic_id: int) -> int:
+        values = {characteristic_id: characteristic_values[characteristic_id]}
+        return characteristic_index.count(characteristic_index.index.match(db, values))
+
+    return [
+        models.Product.id.in_(
+            sa.select(models.ProductCharacteristic.product_id).where(
+                models.ProductCharacteristic.characteristic_id == characteristic_id,
+                models.ProductCharacteristic.characteristic_value.in_(
+                    characteristic_values[characteristic_id]
+                ),
+            )
+        )
+        for characteristic_id in sorted(characteristic_values, key=selectivity)
+    ]
+
+
+# the columns of the sorts (schemas.ProductSort)
+SORT_COLUMNS = {
+    'id': models.Product.id,
+    'price': models.Product.price,
+    'name': models.Product.name,
+    'category': models.Product.category_id,
+}
+
+
+def get_product_sort_keys(product_filters: schemas.ProductFilters) -> list[SortKey]:
+    if product_filters.sort is not None:
+        spec = product_filters.sort.value
+    elif product_filters.sort_by_price:
+        spec = schemas.ProductSort.MOST_EXPENSIVE.value
+    else:
+        spec = schemas.ProductSort.OLDEST.value
+    keys = [
+        (SORT_COLUMNS[name.lstrip('-')], name.startswith('-'))
+        for name in spec.split(',')
+    ]
+    # id is the tie-breaker which makes the order total (needed by keyset
+    # pagination), in the direction of the last key so that one index serves
+    if keys[-1][0] is not models.Product.id:
+        keys.append((models.Product.id, keys[-1][1]))
+    return keys
+
+
+def get_filtered_products_query(
+    db: Session, product_filters: schemas.ProductFilters
+) -> Query:
+    search_backend = search.get_backend(db.get_bind().dialect)
+    filters = []
+    if product_filters.filter_by_name:
+        filters.append(search_backend.name_filter(product_filters.filter_by_name))
+    if product_filters.filter_by_category_name:
+        # category names are unique, so this is an equality the indexes can serve
+        filters.append(
+            models.Product.category_id
+            == sa.select(models.ProductCategory.id)
+            .where(
+                models.ProductCategory.name == product_filters.filter_by_category_name
+            )
+            .scalar_subquery()
+        )
+    if product_filters.min_price is not None:
+        filters.append(models.Product.price >= product_filters.min_price)
+    if product_filters.max_price is not None:
+        filters.append(models.Product.price <= product_filters.max_price)
+    if product_filters.filter_by_characteristic:
+        filters.extend(
+            get_characteristic_filters(db, product_filters.characteristic_values())
+        )
+    products_query = (
+        db.query(models.Product).options(*product_ext_options).filter(*filters)
+    )
+    ordering = order_by_clauses(get_product_sort_keys(product_filters))
+    if product_filters.search:
+        matches = search_backend.search(product_filters.search)
+        products_query = products_query.join(
+            matches, matches.c.product_id == models.Product.id
+        )
+        # most relevant first, unless the client asked for another order
+        if product_filters.by_relevance():
+            ordering.insert(0, matches.c.rank)
+
+    return products_query.order_by(*ordering)
+
+
+product_count_cache = TTLCache(
+    maxsize=get_settings().PRODUCT_COUNT_CACHE_SIZE,
+    ttl=get_settings().PRODUCT_COUNT_CACHE_TTL,
+)
+
+
+def count_filtered_products(
+    db: Session, product_filters: schemas.ProductFilters
+) -> int:
+    # the sorts share the count
+    key = product_filters.json(exclude={'sort_by_price', 'sort'})
+    total = product_count_cache.get(key)
+    if total is None:
+        total = get_filtered_products_query(db, product_filters).order_by(None).count()
+        product_count_cache.set(key, total)
+    return total
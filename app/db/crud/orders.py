@@ -0,0 +1,156 @@
+"""Orders, their customers, addresses and items."""
+from collections import defaultdict
+from decimal import Decimal
+from typing import Optional, Union
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.sql.selectable import ScalarSelect
+
+from app.db import models, schemas
+from app.db.crud.inventory import lock_inventory
+from app.db.dialects import UPSERT_INSERTS
+
+# Relationships serialized by schemas.ProcessedOrder and its items, loaded up
+# front instead of lazily per order
+order_options = (
+    joinedload(models.Order.user),
+    joinedload(models.Order.shipping_address),
+    selectinload(models.Order.items).joinedload(models.OrderItems.product),
+)
+
+
+def upsert_order_user(db: Session, order_user: schemas.User) -> ScalarSelect:
+    """Register the customer or bring their details up to date in one statement.
+
+    The row is only written if some detail differs, so a returning customer
+    costs no write. RETURNING yields nothing in that case: the returned
+    subquery stands for the customer's id instead (e.g. in the order INSERT).
+    """
+    users = models.User.__table__
+    values = order_user.dict()
+    details = [name for name in values if name != 'login']
+    insert = UPSERT_INSERTS[db.get_bind().dialect.name](users).values(values)
+    db.execute(
+        insert.on_conflict_do_update(
+            index_elements=[users.c.login],
+            set_={name: insert.excluded[name] for name in details},
+            where=sa.or_(
+                *(
+                    users.c[name].is_distinct_from(insert.excluded[name])
+                    for name in details
+                )
+            ),
+        )
+    )
+    return (
+        sa.select(users.c.id).where(users.c.login == order_user.login).scalar_subquery()
+    )
+
+
+def get_user_by_login(db: Session, login: str) -> Optional[models.User]:
+    return db.query(models.User).filter(models.User.login == login).first()
+
+
+def upsert_shipping_address(
+    db: Session, shipping_address: schemas.ShippingAddress
+) -> ScalarSelect:
+    """Store the address unless it is already known, in one statement.
+
+    Returns the id of the address as a scalar subquery, like upsert_order_user.
+    """
+    addresses = models.ShippingAddress.__table__
+    values = shipping_address.dict()
+    content_hash = models.ShippingAddress.content_hash_of(values)
+    insert = UPSERT_INSERTS[db.get_bind().dialect.name](addresses).values(
+        **values, content_hash=content_hash
+    )
+    db.execute(insert.on_conflict_do_nothing(index_elements=[addresses.c.content_hash]))
+    return (
+        sa.select(addresses.c.id)
+        .where(addresses.c.content_hash == content_hash)
+        .scalar_subquery()
+    )
+
+
+def create_order(
+    db: Session,
+    total: Decimal,
+    user_id: Union[int, ScalarSelect],
+    shipping_address_id: Union[int, ScalarSelect],
+) -> models.Order:
+    # created unpaid, the payment is taken in the background (app.payments)
+    db_order = models.Order(
+        total=total,
+        user_id=user_id,
+        shipping_address_id=shipping_address_id,
+    )
+    db.add(db_order)
+    db.flush()
+    return db_order
+
+
+def add_order_item(db: Session, order_item: schemas.OrderItems, order_id: int) -> None:
+    db_order_items = models.OrderItems(
+        quantity=order_item.quantity,
+        price_per_item=order_item.price_per_item,
+        product_id=order_item.product.id,
+        order_id=order_id,
+    )
+    db.add(db_order_items)
+    db.flush()
+
+
+def reserve_order_items(
+    db: Session, order_id: int, items: list[schemas.OrderItems]
+) -> bool:
+    """Take the whole basket out of stock and attach it to the order.
+
+    Returns False if some product is unknown or short of stock; in that case the
+    transaction has to be rolled back by the caller.
+    """
+    quantities: dict[int, int] = defaultdict(int)
+    for item in items:
+        quantities[item.product.id] += item.quantity
+    if not quantities:
+        return True
+
+    if len(lock_inventory(db, quantities)) != len(quantities):
+        return False
+
+    # check and decrement in one statement, so stock can never go below zero
+    requested = sa.case(quantities, value=models.ProductInventory.product_id)
+    result = db.execute(
+        sa.update(models.ProductInventory)
+        .where(
+            models.ProductInventory.product_id.in_(quantities),
+            models.ProductInventory.quantity >= requested,
+        )
+        .values(quantity=models.ProductInventory.quantity - requested)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(quantities):
+        return False
+
+    db.execute(
+        sa.insert(models.OrderItems),
+        [
+            {
+                'quantity': item.quantity,
+                'price_per_item': item.price_per_item,
+                'product_id': item.product.id,
+                'order_id': order_id,
+            }
+            for item in items
+        ],
+    )
+    return True
+
+
+def get_order_by_id(
+    db: Session, order_id: int, with_items: bool = False
+) -> Optional[models.Order]:
+    query = db.query(models.Order)
+    if with_items:
+        query = query.options(*order_options)
+    return query.filter(models.Order.id == order_id).first()
@@ -0,0 +1,100 @@
+"""Payments of the orders, taken by ``app.payments``."""
+from datetime import datetime, timedelta
+from typing import Any, Iterable
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+
+def _payment_due() -> Any:
+    return sa.and_(
+        models.Order.payment_status.in_(models.Order.UNSETTLED),
+        sa.or_(
+            models.Order.next_payment_attempt_at.is_(None),
+            models.Order.next_payment_attempt_at <= datetime.now(),
+        ),
+    )
+
+
+def get_pending_payments(
+    db: Session, limit: int, exclude: Iterable[int] = ()
+) -> list[sa.engine.Row]:
+    """Ids and totals of the oldest orders waiting for their payment, except
+    those whose last charge failed less than their retry delay ago, or which a
+    worker is charging."""
+    return db.execute(
+        sa.select(models.Order.id, models.Order.total)
+        .where(_payment_due(), models.Order.id.not_in(list(exclude)))
+        .order_by(models.Order.id)
+        .limit(limit)
+    ).all()
+
+
+def claim_payment(db: Session, order_id: int, timeout: float) -> bool:
+    """Claim the charge of a due order, False if another worker has it.
+
+    The claim expires after ``timeout`` seconds, for the orders of a worker
+    which died while charging them.
+    """
+    result = db.execute(
+        sa.update(models.Order)
+        .where(models.Order.id == order_id, _payment_due())
+        .values(
+            payment_status=models.Order.CHARGING,
+            next_payment_attempt_at=datetime.now() + timedelta(seconds=timeout),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1  # type: ignore[no-any-return]
+
+
+def record_payment(db: Session, order_id: int, paid: bool) -> bool:
+    """Record the outcome of an unsettled payment, False if there's none."""
+    result = db.execute(
+        sa.update(models.Order)
+        .where(
+            models.Order.id == order_id,
+            models.Order.payment_status.in_(models.Order.UNSETTLED),
+        )
+        .values(
+            is_paid=paid,
+            payment_status=models.Order.PAID if paid else models.Order.PAYMENT_FAILED,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1  # type: ignore[no-any-return]
+
+
+def record_payment_error(
+    db: Session, order_id: int, max_attempts: int, retry_delay: float
+) -> None:
+    """Count a charge which raised: the order is retried after ``retry_delay``
+    seconds, doubled at every attempt, and fails after ``max_attempts``."""
+    attempts = db.execute(
+        sa.select(models.Order.payment_attempts).where(
+            models.Order.id == order_id,
+            models.Order.payment_status.in_(models.Order.UNSETTLED),
+        )
+    ).scalar()
+    if attempts is None:
+        return
+    attempts += 1
+    values: dict[str, Any] = {
+        'payment_attempts': attempts,
+        'payment_status': models.Order.PENDING_PAYMENT,
+        'next_payment_attempt_at': datetime.now()
+        + timedelta(seconds=retry_delay * 2 ** (attempts - 1)),
+    }
+    if attempts >= max_attempts:
+        values['payment_status'] = models.Order.PAYMENT_FAILED
+    db.execute(
+        sa.update(models.Order)
+        .where(
+            models.Order.id == order_id,
+            models.Order.payment_status.in_(models.Order.UNSETTLED),
+        )
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
@@ -1,19 +1,235 @@
+from functools import lru_cache
+from typing import Any, Optional
+
 from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 
-from app.config import get_settings
+from app.config import Settings, get_settings
+from app.db.debug import log_slow_queries, record_request_statements
+from app.db.instrumentation import (
+    TimedAsyncAdaptedQueuePool,
+    TimedQueuePool,
+    instrument_engine,
+)
+from app.db.pragmas import apply_sqlite_profile, is_sqlite_file, serializes_writes
+from app.db.replicas import ReplicaSet, RoutingSession
 
 Base = declarative_base()
 
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
 
-def get_engine() -> Engine:
-    return create_engine(
-        get_settings().SQLALCHEMY_DATABASE_URI,
-        connect_args={'check_same_thread': False},
+
+def _engine_options(
+    url: URL, settings: Settings, asynchronous: bool, read_only: bool
+) -> dict[str, Any]:
+    engine_kwargs: dict[str, Any] = {}
+    if url.get_backend_name() == 'sqlite':
+        engine_kwargs['connect_args'] = {'check_same_thread': False}
+        if not is_sqlite_file(url):
+            # every new connection would see its own empty database
+            return {'poolclass': StaticPool, **engine_kwargs}
+
+    if settings.METRICS_ENABLED:
+        poolclass = TimedAsyncAdaptedQueuePool if asynchronous else TimedQueuePool
+    else:
+        poolclass = AsyncAdaptedQueuePool if asynchronous else QueuePool
+    pool_size, max_overflow = (
+        settings.SQLALCHEMY_POOL_SIZE,
+        settings.SQLALCHEMY_MAX_OVERFLOW,
     )
+    if serializes_writes(url, settings) and not read_only:
+        # the single writer: the write transactions queue for its connection
+        pool_size, max_overflow = 1, 0
+    return {
+        'poolclass': poolclass,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_recycle': settings.SQLALCHEMY_POOL_RECYCLE,
+        'pool_pre_ping': settings.SQLALCHEMY_POOL_PRE_PING,
+        **engine_kwargs,
+    }
+
+
+def _instrument(engine: Engine, settings: Settings) -> None:
+    if settings.METRICS_ENABLED:
+        instrument_engine(engine)
+    if settings.SLOW_QUERY_THRESHOLD:
+        log_slow_queries(engine, settings.SLOW_QUERY_THRESHOLD)
+    if settings.N_PLUS_ONE_THRESHOLD:
+        record_request_statements(engine)
+
 
+def _configure(engine: Engine, url: URL, settings: Settings, read_only: bool) -> None:
+    if url.get_backend_name() == 'sqlite':
+        apply_sqlite_profile(
+            engine,
+            settings,
+            read_only=read_only,
+            immediate=serializes_writes(url, settings) and not read_only,
+        )
+    _instrument(engine, settings)
+
+
+def create_db_engine(
+    settings: Settings, read_only: bool = False, uri: Optional[str] = None
+) -> Engine:
+    """Engine of the database (``uri``: of a replica instead)."""
+    url = make_url(uri or settings.SQLALCHEMY_DATABASE_URI)
+    engine = create_engine(
+        url, **_engine_options(url, settings, asynchronous=False, read_only=read_only)
+    )
+    _configure(engine, url, settings, read_only)
+    return engine
+
+
+def create_async_db_engine(
+    settings: Settings, read_only: bool = False, uri: Optional[str] = None
+) -> AsyncEngine:
+    url = make_url(uri or settings.SQLALCHEMY_DATABASE_URI)
+    url = url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+    engine = create_async_engine(
+        url, **_engine_options(url, settings, asynchronous=True, read_only=read_only)
+    )
+    _configure(engine.sync_engine, url, settings, read_only)
+    return engine
 
+
+# One engine (and its pool) per process, created on first use. With SQLite it
+# is the single writer, and the reads have an engine of their own. Read
+# sessions go to the replicas, if any (app.db.replicas).
+@lru_cache()
+def get_engine() -> Engine:
+    return create_db_engine(get_settings())
+
+
+@lru_cache()
 def get_session() -> sessionmaker:
     return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+
+def _has_read_engine() -> bool:
+    settings = get_settings()
+    return serializes_writes(make_url(settings.SQLALCHEMY_DATABASE_URI), settings)
+
+
+@lru_cache()
+def get_read_engine() -> Engine:
+    if not _has_read_engine():
+        return get_engine()
+    return create_db_engine(get_settings(), read_only=True)
+
+
+@lru_cache()
+def get_replica_set() -> ReplicaSet:
+    settings = get_settings()
+    return ReplicaSet(
+        [
+            create_db_engine(settings, read_only=True, uri=uri)
+            for uri in settings.SQLALCHEMY_REPLICA_URIS
+        ],
+        retry_after=settings.REPLICA_RETRY_AFTER,
+    )
+
+
+@lru_cache()
+def get_read_session() -> sessionmaker:
+    return sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        class_=RoutingSession,
+        primary=get_read_engine(),
+        replicas=get_replica_set(),
+    )
+
+
+@lru_cache()
+def get_routing_session() -> sessionmaker:
+    """Sessions reading from the replicas until they write to the primary."""
+    return sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        class_=RoutingSession,
+        primary=get_engine(),
+        replicas=get_replica_set(),
+    )
+
+
+@lru_cache()
+def get_async_engine() -> AsyncEngine:
+    return create_async_db_engine(get_settings())
+
+
+@lru_cache()
+def get_async_session() -> sessionmaker:
+    return sessionmaker(
+        autocommit=False, autoflush=False, bind=get_async_engine(), class_=AsyncSession
+    )
+
+
+@lru_cache()
+def get_async_read_engine() -> AsyncEngine:
+    if not _has_read_engine():
+        return get_async_engine()
+    return create_async_db_engine(get_settings(), read_only=True)
+
+
+@lru_cache()
+def get_async_replica_set() -> ReplicaSet:
+    settings = get_settings()
+    return ReplicaSet(
+        [
+            create_async_db_engine(settings, read_only=True, uri=uri)
+            for uri in settings.SQLALCHEMY_REPLICA_URIS
+        ],
+        retry_after=settings.REPLICA_RETRY_AFTER,
+    )
+
+
+@lru_cache()
+def get_async_read_session() -> sessionmaker:
+    return sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        class_=AsyncSession,
+        sync_session_class=RoutingSession,
+        primary=get_async_read_engine().sync_engine,
+        replicas=get_async_replica_set(),
+    )
+
+
+def _created(factory: Any) -> bool:
+    """Whether the ``lru_cache``'d ``factory`` has built its object yet."""
+    return bool(factory.cache_info().currsize)
+
+
+def dispose_engine() -> None:
+    if _created(get_replica_set):
+        for replica in get_replica_set().engines:
+            replica.dispose()
+    if _created(get_read_engine):
+        get_read_engine().dispose()
+    get_engine().dispose()
+    get_routing_session.cache_clear()
+    get_read_session.cache_clear()
+    get_replica_set.cache_clear()
+    get_read_engine.cache_clear()
+    get_session.cache_clear()
+    get_engine.cache_clear()
+
+
+async def dispose_async_engine() -> None:
+    if _created(get_async_replica_set):
+        for replica in get_async_replica_set().engines:
+            await replica.dispose()  # type: ignore[misc]
+    if _created(get_async_read_engine):
+        await get_async_read_engine().dispose()
+    await get_async_engine().dispose()
+    get_async_read_session.cache_clear()
+    get_async_replica_set.cache_clear()
+    get_async_read_engine.cache_clear()
+    get_async_session.cache_clear()
+    get_async_engine.cache_clear()
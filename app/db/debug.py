@@ -0,0 +1,191 @@
+"""Query debugging for tests, development and staging.
+
+* ``StatementCounter`` records the statements of a ``with`` block,
+* ``log_slow_queries`` logs the statements over a duration with their bound
+  parameters and plan (``SLOW_QUERY_THRESHOLD``),
+* ``NPlusOneMiddleware`` logs the requests which run the same statement shape
+  over and over, typically a lazy load per row (``N_PLUS_ONE_THRESHOLD``).
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from types import TracebackType
+from typing import Any, Iterable, Optional, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# a parenthesized list of bound parameters: sqlite/asyncpg/psycopg2 styles
+_PARAMETER = r'(?:\?|\$\d+|%\(\w+\)s|%s)'
+_PARAMETER_LIST = re.compile(rf'\(\s*{_PARAMETER}(?:\s*,\s*{_PARAMETER})*\s*\)')
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with its whitespace normalized and its parameter lists
+    collapsed, so that ``IN (?, ?)`` and ``IN (?, ?, ?)`` count as one shape."""
+    return _PARAMETER_LIST.sub('(?)', ' '.join(statement.split()))
+
+
+def repeated_statements(statements: Iterable[str], threshold: int) -> dict[str, int]:
+    """The statement shapes run more than ``threshold`` times, with their count."""
+    counts = Counter(statement_shape(statement) for statement in statements)
+    return {shape: count for shape, count in counts.items() if count > threshold}
+
+
+class StatementCounter:
+    """Records the statements an engine executes inside a ``with`` block.
+
+    Meant for tests and debugging, e.g. to check that a page of products
+    takes the same number of queries whatever its size. The engine may also be
+    the ``Engine`` class, to record the statements of every engine.
+    """
+
+    def __init__(self, engine: Union[Engine, type[Engine]]) -> None:
+        self.engine = engine
+        self.statements: list[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def check_n_plus_one(self, threshold: int) -> None:
+        """Raise ``NPlusOneError`` if a statement shape ran over ``threshold`` times."""
+        repeated = repeated_statements(self.statements, threshold)
+        if repeated:
+            raise NPlusOneError(
+                'N+1 queries: '
+                + '; '.join(f'{count} x {shape}' for shape, count in repeated.items())
+            )
+
+    def _before_cursor_execute(self, statement: str, **_: Any) -> None:
+        self.statements.append(statement)
+
+    def __enter__(self) -> 'StatementCounter':
+        event.listen(
+            self.engine,
+            'before_cursor_execute',
+            self._before_cursor_execute,
+            named=True,
+        )
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+# Slow query log
+def explain(conn: Connection, statement: str, parameters: Any) -> str:
+    """The plan of a statement, run on the raw DBAPI connection of ``conn``."""
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def log_slow_queries(engine: Engine, threshold: float) -> None:
+    """Log the statements of ``engine`` which take ``threshold`` seconds or more."""
+
+    def before_cursor_execute(conn: Connection, **_: Any) -> None:
+        conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(
+        conn: Connection,
+        statement: str,
+        parameters: Any,
+        executemany: bool,
+        **_: Any,
+    ) -> None:
+        if not conn.info.get('slow_query_start'):
+            return
+        duration = time.perf_counter() - conn.info['slow_query_start'].pop()
+        if duration < threshold:
+            return
+        if executemany:
+            plan = '(executemany)'
+        else:
+            try:
+                plan = explain(conn, statement, parameters)
+            except Exception as err:  # pylint: disable=broad-except
+                plan = f'(no plan: {err})'
+        logger.warning(
+            'Slow query (%.3fs): %s\nParameters: %r\nPlan:\n%s',
+            duration,
+            statement,
+            parameters,
+            plan,
+        )
+
+    def handle_error(exception_context: Any) -> None:
+        # a failed statement gets no after_cursor_execute: forget its start,
+        # or the list grows for the life of the pooled connection
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('slow_query_start'):
+            conn.info['slow_query_start'].pop()
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute, named=True)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute, named=True)
+    event.listen(engine, 'handle_error', handle_error)
+
+
+# N+1 detection per request
+_request_statements: ContextVar[Optional[list[str]]] = ContextVar(
+    'request_statements', default=None
+)
+
+
+def _record_request_statement(statement: str, **_: Any) -> None:
+    statements = _request_statements.get()
+    if statements is not None:
+        statements.append(statement)
+
+
+def record_request_statements(engine: Engine) -> None:
+    event.listen(engine, 'before_cursor_execute', _record_request_statement, named=True)
+
+
+class NPlusOneMiddleware:
+    """Logs the statement shapes a request runs more than ``threshold`` times.
+
+    Only sees the engines passed to ``record_request_statements``.
+    """
+
+    def __init__(self, app: ASGIApp, threshold: int) -> None:
+        self.app = app
+        self.threshold = threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        statements: list[str] = []
+        token = _request_statements.set(statements)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_statements.reset(token)
+            for shape, count in repeated_statements(statements, self.threshold).items():
+                logger.warning(
+                    'N+1 queries in %s %s: %d x %s',
+                    scope['method'],
+                    scope['path'],
+                    count,
+                    shape,
+                )
@@ -0,0 +1,5 @@
+"""What the database dialects differ in, for the statements which care."""
+from sqlalchemy.dialects import postgresql, sqlite
+
+# the dialects whose INSERT can take an ON CONFLICT clause
+UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
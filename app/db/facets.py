@@ -0,0 +1,201 @@
+"""Product counts per category and per characteristic value (the facets).
+
+The counts live in ``category_facet`` and ``characteristic_facet`` and are
+kept up to date from the session, like the search index: every flush records
+a +1/-1 per count for the products and characteristic values it inserts,
+deletes or moves, and the deltas are added to the counts just before the
+transaction commits, with one upsert per table. Core inserts bypass the
+flush and record their rows with ``count_inserted``.
+
+``reconcile`` recounts everything from the catalogue. It fills the tables of
+an existing database (see the migrations) and runs every
+``FACET_RECONCILE_INTERVAL`` seconds to repair the counts of rows written
+behind the session's back.
+"""
+from collections import Counter
+from typing import Any, Iterable, Optional
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, attributes
+
+from app.db import models
+from app.db.dialects import UPSERT_INSERTS
+
+categories = models.CategoryFacet.__table__
+characteristics = models.CharacteristicFacet.__table__
+
+
+# Counting
+def _recount(connection: Connection) -> None:
+    connection.execute(
+        sa.insert(categories).from_select(
+            ['category_id', 'product_count'],
+            sa.select(models.Product.category_id, sa.func.count())
+            .where(models.Product.category_id.is_not(None))
+            .group_by(models.Product.category_id),
+        )
+    )
+    connection.execute(
+        sa.insert(characteristics).from_select(
+            ['characteristic_id', 'characteristic_value', 'product_count'],
+            sa.select(
+                models.ProductCharacteristic.characteristic_id,
+                models.ProductCharacteristic.characteristic_value,
+                sa.func.count(),
+            )
+            .where(models.ProductCharacteristic.characteristic_id.is_not(None))
+            .group_by(
+                models.ProductCharacteristic.characteristic_id,
+                models.ProductCharacteristic.characteristic_value,
+            ),
+        )
+    )
+
+
+def reconcile(connection: Connection) -> None:
+    """Recount all the facets from the catalogue."""
+    connection.execute(sa.delete(categories))
+    connection.execute(sa.delete(characteristics))
+    _recount(connection)
+
+
+def _add(
+    connection: Connection, table: sa.Table, deltas: Counter[tuple[Any, ...]]
+) -> None:
+    key_columns = list(table.primary_key)
+    rows = [
+        {
+            **{column.name: value for column, value in zip(key_columns, key)},
+            'product_count': delta,
+        }
+        for key, delta in deltas.items()
+        if delta
+    ]
+    if not rows:
+        return
+
+    upsert_insert = UPSERT_INSERTS.get(connection.dialect.name)
+    if upsert_insert is not None:
+        insert = upsert_insert(table).values(rows)
+        connection.execute(
+            insert.on_conflict_do_update(
+                index_elements=key_columns,
+                set_={
+                    'product_count': table.c.product_count
+                    + insert.excluded.product_count
+                },
+            )
+        )
+        return
+
+    for row in rows:
+        keys = [column == row[column.name] for column in key_columns]
+        updated = connection.execute(
+            sa.update(table)
+            .where(*keys)
+            .values(product_count=table.c.product_count + row['product_count'])
+        )
+        if not updated.rowcount:
+            connection.execute(sa.insert(table).values(row))
+
+
+# Synchronization: the deltas of each flush, added to the counts once just
+# before the transaction commits
+_PENDING_KEY = 'facet_pending_deltas'
+
+
+def _pending(
+    session: Session,
+) -> tuple[Counter[tuple[Any, ...]], Counter[tuple[Any, ...]]]:
+    return session.info.setdefault(_PENDING_KEY, (Counter(), Counter()))
+
+
+def count_inserted(
+    session: Session,
+    category_ids: Iterable[Optional[int]] = (),
+    characteristic_values: Iterable[tuple[Optional[int], str]] = (),
+) -> None:
+    """Count products and characteristic values inserted without the ORM."""
+    category_deltas, characteristic_deltas = _pending(session)
+    category_deltas.update(
+        (category_id,) for category_id in category_ids if category_id is not None
+    )
+    characteristic_deltas.update(
+        key for key in characteristic_values if key[0] is not None
+    )
+
+
+# the attributes which key the counts of a product and of a characteristic value
+_KEYS = {
+    models.Product: ('category_id',),
+    models.ProductCharacteristic: ('characteristic_id', 'characteristic_value'),
+}
+
+
+def values_before_and_after(
+    instance: Any, names: tuple[str, ...]
+) -> tuple[tuple[Any, ...], tuple[Any, ...]]:
+    """The values of attributes of the instance before and after the flush."""
+    before, after = [], []
+    for name in names:
+        history = attributes.get_history(instance, name)
+        before.append(next(iter([*history.deleted, *history.unchanged]), None))
+        after.append(next(iter([*history.added, *history.unchanged]), None))
+    return tuple(before), tuple(after)
+
+
+def _deltas(session: Session, instance: Any) -> Optional[Counter[tuple[Any, ...]]]:
+    """The pending deltas of the counts the instance belongs to, if any."""
+    if isinstance(instance, models.Product):
+        return _pending(session)[0]
+    if isinstance(instance, models.ProductCharacteristic):
+        return _pending(session)[1]
+    return None
+
+
+@event.listens_for(Session, 'before_flush', named=True)
+def _collect_deleted(session: Session, **_: Any) -> None:
+    # the deleted rows are read while they still exist, should their
+    # attributes have expired
+    for instance in session.deleted:
+        deltas = _deltas(session, instance)
+        if deltas is not None:
+            before = values_before_and_after(instance, _KEYS[type(instance)])[0]
+            if before[0] is not None:
+                deltas[before] -= 1
+
+
+@event.listens_for(Session, 'after_flush', named=True)
+def _collect_new_and_moved(session: Session, **_: Any) -> None:
+    # after the flush: the foreign keys of new relationships are set by now
+    for instance in (*session.new, *session.dirty):
+        deltas = _deltas(session, instance)
+        if deltas is None:
+            continue
+        before, after = values_before_and_after(instance, _KEYS[type(instance)])
+        if instance in session.new:
+            before = (None,)
+        elif before == after:
+            continue
+        if before[0] is not None:
+            deltas[before] -= 1
+        if after[0] is not None:
+            deltas[after] += 1
+
+
+@event.listens_for(Session, 'before_commit')
+def _add_deltas(session: Session) -> None:
+    session.flush()
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        category_deltas, characteristic_deltas = pending
+        connection = session.connection()
+        _add(connection, categories, category_deltas)
+        _add(connection, characteristics, characteristic_deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_deltas(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -1,6 +1,14 @@
-from app.db import models
+import logging
+
+from app.db import migrations
 from app.db.database import get_engine
 
+logger = logging.getLogger(__name__)
+
 
-def init_db() -> None:
-    models.Base.metadata.create_all(bind=get_engine())
+def init_db() -> list[str]:
+    """Bring the database up to date, returning the applied migrations."""
+    applied = migrations.upgrade(get_engine())
+    for description in applied:
+        logger.info('Applied migration: %s', description)
+    return applied
@@ -0,0 +1,89 @@
+"""Engine and pool instrumentation, which adds to the stats of the request
+being served (see ``app.metrics``): the statements, their time and rows, and
+the time spent waiting for a pooled connection."""
+import time
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.metrics import RequestStats, current_stats
+
+
+class _RowCountingCursor:
+    """Proxy of a DBAPI cursor which adds the fetched rows to the stats."""
+
+    def __init__(self, cursor: Any, stats: RequestStats) -> None:
+        self._cursor = cursor
+        self._stats = stats
+
+    def fetchone(self) -> Any:
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.db_rows += 1
+        return row
+
+    def fetchmany(self, *args: Any) -> Any:
+        rows = self._cursor.fetchmany(*args)
+        self._stats.db_rows += len(rows)
+        return rows
+
+    def fetchall(self) -> Any:
+        rows = self._cursor.fetchall()
+        self._stats.db_rows += len(rows)
+        return rows
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+
+def _before_cursor_execute(conn: Connection, **_: Any) -> None:
+    if current_stats() is not None:
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(
+    conn: Connection, cursor: Any, context: Any, **_: Any
+) -> None:
+    stats = current_stats()
+    if stats is None or not conn.info.get('metrics_start'):
+        return
+    stats.db_time += time.perf_counter() - conn.info['metrics_start'].pop()
+    stats.db_statements += 1
+    if context is not None and cursor.description is not None:
+        # the result reads its rows from context.cursor
+        context.cursor = _RowCountingCursor(cursor, stats)
+
+
+def _handle_error(exception_context: Any) -> None:
+    # a failed statement gets no after_cursor_execute: forget its start
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('metrics_start'):
+        conn.info['metrics_start'].pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute, named=True)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute, named=True)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+class _TimedCheckout:
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            # pylint: disable=no-member
+            return super()._do_get()  # type: ignore[misc]
+        finally:
+            stats = current_stats()
+            if stats is not None:
+                stats.pool_wait += time.perf_counter() - start
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    """QueuePool which adds the time a checkout takes to the request stats."""
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool which adds the checkout time to the request stats."""
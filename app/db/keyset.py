@@ -0,0 +1,148 @@
+import base64
+import binascii
+import json
+from typing import Any, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import InstrumentedAttribute, Query
+
+# (mapped column, descending); the last key has to be unique (e.g. the id)
+SortKey = tuple[InstrumentedAttribute, bool]
+
+
+def order_by_clauses(keys: list[SortKey]) -> list[Any]:
+    return [
+        column.desc() if descending else column.asc() for column, descending in keys
+    ]
+
+
+def encode_cursor(values: list[Any], backwards: bool) -> str:
+    payload = json.dumps({'k': values, 'b': backwards}, default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, keys: list[SortKey]) -> tuple[list[Any], bool]:
+    """Raises ValueError for cursors that weren't issued for these sort keys."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        raw_values, backwards = payload['k'], bool(payload['b'])
+    except (binascii.Error, ValueError, TypeError, KeyError) as err:
+        raise ValueError('Malformed cursor') from err
+    if not isinstance(raw_values, list) or len(raw_values) != len(keys):
+        raise ValueError('Cursor does not match the sort order')
+    try:
+        values = [
+            None
+            if value is None and column.nullable
+            else column.type.python_type(value)
+            for (column, _), value in zip(keys, raw_values)
+        ]
+    except (ArithmeticError, ValueError, TypeError) as err:
+        raise ValueError('Malformed cursor') from err
+    return values, backwards
+
+
+def _nulls_high(query: Query) -> bool:
+    # NULL sorts after every value on PostgreSQL and Oracle, before them on the
+    # others; the ORDER BY keeps that placement, which the indexes serve
+    return query.session.get_bind().dialect.name in ('postgresql', 'oracle')
+
+
+def _nulls_first(column: InstrumentedAttribute, descending: bool, high: bool) -> bool:
+    return bool(column.nullable) and descending == high
+
+
+def _equal(column: InstrumentedAttribute, value: Any) -> Any:
+    return column.is_(None) if value is None else column == value
+
+
+def _beyond(keys: list[SortKey], values: list[Any], nulls_high: bool) -> Any:
+    # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y), honouring each direction
+    # and where the NULLs sort
+    (column, descending), value = keys[0], values[0]
+    nulls_first = _nulls_first(column, descending, nulls_high)
+    if value is None:
+        first = column.is_not(None) if nulls_first else sa.false()
+    else:
+        first = column < value if descending else column > value
+        if column.nullable and not nulls_first:
+            first = sa.or_(first, column.is_(None))
+    if len(keys) == 1:
+        return first
+    return sa.or_(
+        first,
+        sa.and_(_equal(column, value), _beyond(keys[1:], values[1:], nulls_high)),
+    )
+
+
+def _after(keys: list[SortKey], values: list[Any], nulls_high: bool) -> list[Any]:
+    """The rows after ``values``, as filters to read one after the other.
+
+    Each filter is a range of the index on the keys, which the database seeks
+    to rather than filtering the rows before it. The NULLs of the first key
+    and its values make two ranges: one filter for both would be a scan.
+    """
+    (column, descending), value = keys[0], values[0]
+    nulls_first = _nulls_first(column, descending, nulls_high)
+    ties = (
+        sa.and_(_equal(column, value), _beyond(keys[1:], values[1:], nulls_high))
+        if len(keys) > 1
+        else sa.false()
+    )
+    if value is None:
+        return [ties, column.is_not(None)] if nulls_first else [ties]
+
+    beyond = column < value if descending else column > value
+    # the redundant bound is the one the index seeks to
+    bound = column <= value if descending else column >= value
+    ranges = [sa.and_(bound, sa.or_(beyond, ties))]
+    if column.nullable and not nulls_first:
+        ranges.append(column.is_(None))
+    return ranges
+
+
+def _key_values(item: Any, keys: list[SortKey]) -> list[Any]:
+    return [getattr(item, column.key) for column, _ in keys]
+
+
+def paginate(
+    query: Query, keys: list[SortKey], size: int, cursor: Optional[str] = None
+) -> tuple[list[Any], Optional[str], Optional[str]]:
+    """Return a page of ``query`` with its next and previous cursors.
+
+    Each page is a range scan starting right after (or before) the row the
+    cursor points to, so it costs the same however deep the client scrolls. A
+    page which reaches the NULLs of the first key goes on with a second scan.
+    """
+    backwards = False
+    ranges: list[Any] = [None]
+    scan_keys = keys
+    if cursor is not None:
+        values, backwards = decode_cursor(cursor, keys)
+        scan_keys = [(column, descending != backwards) for column, descending in keys]
+        ranges = _after(scan_keys, values, _nulls_high(query))
+
+    query = query.order_by(None).order_by(*order_by_clauses(scan_keys))
+    items: list[Any] = []
+    for condition in ranges:
+        rows = query if condition is None else query.filter(condition)
+        items.extend(rows.limit(size + 1 - len(items)).all())
+        if len(items) > size:
+            break
+    has_more = len(items) > size
+    items = items[:size]
+    if backwards:
+        items.reverse()
+    if not items:
+        return items, None, None
+
+    first, last = _key_values(items[0], keys), _key_values(items[-1], keys)
+    next_cursor = encode_cursor(last, backwards=False)
+    prev_cursor = encode_cursor(first, backwards=True)
+    if backwards:
+        return items, next_cursor, prev_cursor if has_more else None
+    return (
+        items,
+        next_cursor if has_more else None,
+        prev_cursor if cursor is not None else None,
+    )
@@ -0,0 +1,246 @@
+"""Schema migrations for databases created by earlier versions of the app.
+
+``create_all`` only adds missing tables, so everything it can't do for an
+existing database (indexes and columns on existing tables, data fixes) is
+an entry of ``MIGRATIONS``. The number of applied migrations is kept in the
+``schema_version`` table; a fresh database is created from the models and
+stamped with the latest version straight away.
+"""
+from dataclasses import dataclass
+from typing import Callable
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+
+from app.db import (  # noqa: F401 pylint: disable=unused-import
+    facets,
+    models,
+    schemas,
+    search,
+)
+
+schema_version = sa.Table(
+    'schema_version',
+    models.Base.metadata,
+    sa.Column('version', sa.Integer, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def _create_indexes(connection: Connection, table: sa.Table, *names: str) -> None:
+    for index in table.indexes:
+        if index.name in names:
+            index.create(connection, checkfirst=True)
+
+
+def _has_column(connection: Connection, table: sa.Table, name: str) -> bool:
+    columns = sa.inspect(connection).get_columns(table.name)
+    return name in {column['name'] for column in columns}
+
+
+def _set_not_null(connection: Connection, table: sa.Table, name: str) -> None:
+    """Make a column NOT NULL like in the model, once every row has a value."""
+    columns = sa.inspect(connection).get_columns(table.name)
+    if not next(column['nullable'] for column in columns if column['name'] == name):
+        return
+    quote = connection.dialect.identifier_preparer.quote
+    if connection.dialect.name != 'sqlite':
+        connection.execute(
+            sa.text(
+                f'ALTER TABLE {quote(table.name)} ALTER COLUMN {quote(name)} '
+                'SET NOT NULL'
+            )
+        )
+        return
+
+    # SQLite can't alter a column: the table is rebuilt from the model and
+    # takes the place of the old one (https://sqlite.org/lang_altertable.html)
+    rebuilt = table.to_metadata(sa.MetaData(), name=f'_{table.name}_rebuilt')
+    column_names = ', '.join(quote(column.name) for column in table.columns)
+    connection.execute(CreateTable(rebuilt))
+    connection.execute(
+        sa.text(
+            f'INSERT INTO {quote(rebuilt.name)} ({column_names}) '
+            f'SELECT {column_names} FROM {quote(table.name)}'
+        )
+    )
+    connection.execute(sa.text(f'DROP TABLE {quote(table.name)}'))
+    connection.execute(
+        sa.text(f'ALTER TABLE {quote(rebuilt.name)} RENAME TO {quote(table.name)}')
+    )
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def _add_secondary_indexes(connection: Connection) -> None:
+    _create_indexes(
+        connection,
+        models.Product.__table__,
+        'ix_product_price_id',
+        'ix_product_category_id_id',
+        'ix_product_category_id_price_id',
+    )
+    _create_indexes(
+        connection,
+        models.ProductInventory.__table__,
+        'ix_product_inventory_product_id',
+    )
+    _create_indexes(
+        connection,
+        models.ProductCharacteristic.__table__,
+        'ix_product_characteristic_characteristic_id_value',
+    )
+    _create_indexes(
+        connection,
+        models.Order.__table__,
+        'ix_order_user_id',
+        'ix_order_shipping_address_id',
+    )
+    _create_indexes(
+        connection,
+        models.OrderItems.__table__,
+        'ix_order_items_order_id',
+        'ix_order_items_product_id',
+    )
+
+
+def _deduplicate_shipping_addresses(connection: Connection) -> None:
+    addresses = models.ShippingAddress.__table__
+    orders = models.Order.__table__
+    if not _has_column(connection, addresses, 'content_hash'):
+        # SQLite can't add a NOT NULL column without a default: the column
+        # becomes NOT NULL once every row is filled in below
+        connection.execute(
+            sa.text('ALTER TABLE shipping_address ADD COLUMN content_hash VARCHAR(64)')
+        )
+
+    # the first row of every address is kept (normalized), the orders of the
+    # other rows are moved to it
+    kept: dict[str, int] = {}
+    normalized, merged = [], []
+    for row in connection.execute(
+        sa.select(
+            addresses.c.id,
+            *(addresses.c[name] for name in models.ShippingAddress.FIELDS),
+        ).order_by(addresses.c.id)
+    ).mappings():
+        values = schemas.ShippingAddress.parse_obj(row).dict()
+        content_hash = models.ShippingAddress.content_hash_of(values)
+        if content_hash in kept:
+            merged.append({'duplicate_id': row['id'], 'kept_id': kept[content_hash]})
+        else:
+            kept[content_hash] = row['id']
+            normalized.append(
+                {'id_': row['id'], **values, 'content_hash': content_hash}
+            )
+
+    if merged:
+        connection.execute(
+            sa.update(orders)
+            .where(orders.c.shipping_address_id == sa.bindparam('duplicate_id'))
+            .values(shipping_address_id=sa.bindparam('kept_id')),
+            merged,
+        )
+        connection.execute(
+            sa.delete(addresses).where(addresses.c.id == sa.bindparam('duplicate_id')),
+            merged,
+        )
+    if normalized:
+        connection.execute(
+            sa.update(addresses).where(addresses.c.id == sa.bindparam('id_')),
+            normalized,
+        )
+    _set_not_null(connection, addresses, 'content_hash')
+    _create_indexes(connection, addresses, 'ix_shipping_address_content_hash')
+
+
+def _add_payment_status(connection: Connection) -> None:
+    orders = models.Order.__table__
+    if not _has_column(connection, orders, 'payment_status'):
+        connection.execute(
+            sa.text(
+                'ALTER TABLE "order" ADD COLUMN payment_status VARCHAR NOT NULL '
+                f"DEFAULT '{models.Order.PENDING_PAYMENT}'"
+            )
+        )
+        # the orders used to be paid while they were created
+        connection.execute(
+            sa.update(orders).values(
+                payment_status=sa.case(
+                    (orders.c.is_paid, models.Order.PAID),
+                    else_=models.Order.PAYMENT_FAILED,
+                )
+            )
+        )
+    _create_indexes(connection, orders, 'ix_order_payment_status')
+
+
+def _count_facets(connection: Connection) -> None:
+    # the tables are new, created empty by create_all
+    facets.reconcile(connection)
+
+
+def _add_sort_indexes(connection: Connection) -> None:
+    _create_indexes(
+        connection,
+        models.Product.__table__,
+        'ix_product_name_id',
+        'ix_product_category_id_name_id',
+    )
+
+
+def _add_payment_retries(connection: Connection) -> None:
+    orders = models.Order.__table__
+    if not _has_column(connection, orders, 'payment_attempts'):
+        connection.execute(
+            sa.text(
+                'ALTER TABLE "order" ADD COLUMN payment_attempts INTEGER NOT NULL '
+                'DEFAULT 0'
+            )
+        )
+    if not _has_column(connection, orders, 'next_payment_attempt_at'):
+        datetime_type = sa.DateTime().compile(dialect=connection.dialect)
+        connection.execute(
+            sa.text(
+                f'ALTER TABLE "order" ADD COLUMN next_payment_attempt_at {datetime_type}'
+            )
+        )
+
+
+MIGRATIONS = [
+    Migration('Secondary indexes for the hot queries', _add_secondary_indexes),
+    Migration('Deduplicate the shipping addresses', _deduplicate_shipping_addresses),
+    Migration('Payment status of the orders', _add_payment_status),
+    Migration('Facet counts of the catalogue', _count_facets),
+    Migration('Indexes for the product sorts', _add_sort_indexes),
+    Migration('Payment retries of the orders', _add_payment_retries),
+]
+
+
+def get_version(connection: Connection) -> int:
+    return connection.execute(sa.select(schema_version.c.version)).scalar_one()
+
+
+def upgrade(engine: Engine) -> list[str]:
+    """Bring the database up to date, return the descriptions of what was applied."""
+    with engine.begin() as connection:
+        is_new = not sa.inspect(connection).has_table(models.Product.__tablename__)
+        models.Base.metadata.create_all(connection)
+
+        version = connection.execute(sa.select(schema_version.c.version)).scalar()
+        if version is None:
+            # databases older than the migrations start from scratch
+            version = len(MIGRATIONS) if is_new else 0
+            connection.execute(sa.insert(schema_version).values(version=version))
+
+        pending = MIGRATIONS[version:]
+        for migration in pending:
+            migration.upgrade(connection)
+        connection.execute(sa.update(schema_version).values(version=len(MIGRATIONS)))
+    return [migration.description for migration in pending]
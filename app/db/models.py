@@ -1,6 +1,10 @@
+import hashlib
+import json
 from datetime import datetime
+from typing import Any, Mapping, Optional
 
 import sqlalchemy as sa
+from sqlalchemy import event
 from sqlalchemy.orm import relationship
 
 from app.db.database import Base
@@ -44,7 +48,16 @@ class ProductCategory(Base):
 
 class Product(Base):
     __tablename__ = 'product'
-    __table_args__ = (sa.CheckConstraint('price > 0'),)
+    __table_args__ = (
+        sa.CheckConstraint('price > 0'),
+        # listing (one index per schemas.ProductSort, the id breaking the
+        # ties), optionally within a category
+        sa.Index('ix_product_price_id', 'price', 'id'),
+        sa.Index('ix_product_name_id', 'name', 'id'),
+        sa.Index('ix_product_category_id_id', 'category_id', 'id'),
+        sa.Index('ix_product_category_id_price_id', 'category_id', 'price', 'id'),
+        sa.Index('ix_product_category_id_name_id', 'category_id', 'name', 'id'),
+    )
 
     id = sa.Column(sa.Integer, primary_key=True, index=True)
     name = sa.Column(sa.String, nullable=False)
@@ -66,11 +79,19 @@ class Product(Base):
         'OrderItems', back_populates='product', uselist=True
     )
 
+    def _change_quantity(self, delta: int) -> None:
+        # an SQL expression: the flush emits SET quantity = quantity + :delta, so
+        # concurrent changes are not overwritten by a stale value read before
+        quantity = self.product_inventory.quantity
+        if not isinstance(quantity, sa.sql.ClauseElement):
+            quantity = ProductInventory.quantity
+        self.product_inventory.quantity = quantity + delta
+
     def increase_quantity(self, inc_value: int) -> None:
-        self.product_inventory.quantity += inc_value
+        self._change_quantity(inc_value)
 
     def decrease_quantity(self, dec_value: int) -> None:
-        self.product_inventory.quantity -= dec_value
+        self._change_quantity(-dec_value)
 
     def __repr__(self) -> str:
         return f'<Product "{self.name}", SKU="{self.sku}">'
@@ -81,7 +102,9 @@ class ProductInventory(Base):
     __table_args__ = (sa.CheckConstraint('quantity >= 0'),)
 
     id = sa.Column(sa.Integer, primary_key=True)
-    product_id = sa.Column(sa.Integer, sa.ForeignKey(Product.id))
+    product_id = sa.Column(
+        sa.Integer, sa.ForeignKey(Product.id), unique=True, index=True
+    )
     quantity = sa.Column(sa.Integer, default=0, nullable=False)
 
     # (Product, Inventory)  - one to one relationship
@@ -112,6 +135,12 @@ class ProductCharacteristic(Base):
         sa.UniqueConstraint(
             'product_id', 'characteristic_id', name='_product_characteristic_uc'
         ),
+        # products having a given characteristic (value)
+        sa.Index(
+            'ix_product_characteristic_characteristic_id_value',
+            'characteristic_id',
+            'characteristic_value',
+        ),
     )
 
     id = sa.Column(sa.Integer, primary_key=True, index=True)
@@ -125,6 +154,26 @@ class ProductCharacteristic(Base):
     product = relationship('Product', back_populates='characteristics', uselist=False)
 
 
+# Facets: product counts maintained by app.db.facets
+class CategoryFacet(Base):
+    __tablename__ = 'category_facet'
+
+    category_id = sa.Column(
+        sa.Integer, sa.ForeignKey(ProductCategory.id), primary_key=True
+    )
+    product_count = sa.Column(sa.Integer, default=0, nullable=False)
+
+
+class CharacteristicFacet(Base):
+    __tablename__ = 'characteristic_facet'
+
+    characteristic_id = sa.Column(
+        sa.Integer, sa.ForeignKey(Characteristic.id), primary_key=True
+    )
+    characteristic_value = sa.Column(sa.String, primary_key=True)
+    product_count = sa.Column(sa.Integer, default=0, nullable=False)
+
+
 # Order tables
 class ShippingAddress(Base):
     __tablename__ = 'shipping_address'
@@ -135,23 +184,59 @@ class ShippingAddress(Base):
     postcode = sa.Column(sa.String, nullable=False)
     address = sa.Column(sa.String, nullable=False)
     apartment = sa.Column(sa.String, nullable=True)
+    # an address is stored once, whatever the number of orders shipping to it
+    content_hash = sa.Column(sa.String(64), nullable=False, unique=True, index=True)
 
     orders = relationship('Order', back_populates='shipping_address', uselist=True)
 
+    FIELDS = ('country', 'city', 'postcode', 'address', 'apartment')
+
+    @classmethod
+    def content_hash_of(cls, values: Mapping[str, Optional[str]]) -> str:
+        content = json.dumps([values.get(name) for name in cls.FIELDS])
+        return hashlib.sha256(content.encode()).hexdigest()
+
     def __repr__(self) -> str:
         return f'<Address "{self.city}, {self.address}, {self.apartment}">'
 
 
+@event.listens_for(ShippingAddress, 'before_insert', named=True)
+@event.listens_for(ShippingAddress, 'before_update', named=True)
+def _set_content_hash(target: ShippingAddress, **_: Any) -> None:
+    target.content_hash = ShippingAddress.content_hash_of(
+        {name: getattr(target, name) for name in ShippingAddress.FIELDS}
+    )
+
+
 class Order(Base):
     __tablename__ = 'order'
 
+    # payment_status values; orders are paid in the background, see app.payments
+    PENDING_PAYMENT = 'pending_payment'
+    # claimed by a payment worker, which is charging it
+    CHARGING = 'charging'
+    PAID = 'paid'
+    PAYMENT_FAILED = 'payment_failed'
+    UNSETTLED = (PENDING_PAYMENT, CHARGING)
+
     id = sa.Column(sa.Integer, primary_key=True, index=True)
     creation_date = sa.Column(sa.DateTime(), default=datetime.now(), nullable=False)
     total = sa.Column(sa.Numeric(10, 8), nullable=False)
-    is_paid = sa.Column(sa.Boolean, nullable=False)
+    is_paid = sa.Column(sa.Boolean, default=False, nullable=False)
     is_processed = sa.Column(sa.Boolean, default=False, nullable=False)
-    user_id = sa.Column(sa.Integer, sa.ForeignKey(User.id))
-    shipping_address_id = sa.Column(sa.Integer, sa.ForeignKey(ShippingAddress.id))
+    payment_status = sa.Column(
+        sa.String, default=PENDING_PAYMENT, nullable=False, index=True
+    )
+    # charges which raised, and when the next one may be tried (or when the
+    # claim of a worker which stopped answering expires)
+    payment_attempts = sa.Column(
+        sa.Integer, default=0, server_default='0', nullable=False
+    )
+    next_payment_attempt_at = sa.Column(sa.DateTime, nullable=True)
+    user_id = sa.Column(sa.Integer, sa.ForeignKey(User.id), index=True)
+    shipping_address_id = sa.Column(
+        sa.Integer, sa.ForeignKey(ShippingAddress.id), index=True
+    )
 
     user = relationship('User', back_populates='orders', uselist=False)
     items = relationship('OrderItems', back_populates='order', uselist=True)
@@ -173,8 +258,42 @@ class OrderItems(Base):
     id = sa.Column(sa.Integer, primary_key=True, index=True)
     quantity = sa.Column(sa.Integer, nullable=False)
     price_per_item = sa.Column(sa.Numeric(10, 8), nullable=False)
-    order_id = sa.Column(sa.Integer, sa.ForeignKey(Order.id))
-    product_id = sa.Column(sa.Integer, sa.ForeignKey(Product.id))
+    order_id = sa.Column(sa.Integer, sa.ForeignKey(Order.id), index=True)
+    product_id = sa.Column(sa.Integer, sa.ForeignKey(Product.id), index=True)
 
     order = relationship('Order', back_populates='items', uselist=False)
     product = relationship('Product', back_populates='product_in_orders', uselist=False)
+
+
+class IdempotencyKey(Base):
+    """Response of a POST /api/orders/ which carried an Idempotency-Key."""
+
+    __tablename__ = 'idempotency_key'
+
+    key = sa.Column(sa.String, primary_key=True)
+    request_hash = sa.Column(sa.String(64), nullable=False)
+    status_code = sa.Column(sa.Integer, nullable=True)
+    response = sa.Column(sa.LargeBinary, nullable=True)
+    created_at = sa.Column(
+        sa.DateTime, default=datetime.now, nullable=False, index=True
+    )
+
+    def __repr__(self) -> str:
+        return f'<Idempotency key "{self.key}">'
+
+
+class CacheGeneration(Base):
+    """Generation of the response cache (see ``app.response_cache``), bumped
+    by every transaction which writes to the catalogue."""
+
+    __tablename__ = 'cache_generation'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    generation = sa.Column(sa.Integer, default=0, nullable=False)
+
+
+event.listen(
+    CacheGeneration.__table__,
+    'after_create',
+    sa.DDL('INSERT INTO cache_generation (id, generation) VALUES (1, 0)'),
+)
@@ -0,0 +1,78 @@
+"""SQLite tuning, applied to every new connection of an engine.
+
+The defaults of SQLite suit a single process: a rollback journal synced
+on every commit, no wait on a locked database, a 2 MB page cache. A busy API
+wants WAL (readers and the writer don't block each other), NORMAL syncs
+(durable at checkpoints, never corrupted), a memory map, a larger cache and
+a wait on locks instead of an immediate "database is locked".
+
+SQLite still takes one writer at a time, and a deferred transaction which
+starts reading and then writes can't wait for the lock: it fails at once if
+another one wrote meanwhile. The writer engine therefore has a single
+connection and begins its transactions with ``BEGIN IMMEDIATE``, while the
+reads go through a pool of read-only connections.
+"""
+from typing import Any, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import URL, Connection, Engine
+
+from app.config import Settings
+
+
+def is_sqlite_file(url: URL) -> bool:
+    return url.get_backend_name() == 'sqlite' and url.database not in (
+        None,
+        '',
+        ':memory:',
+    )
+
+
+def serializes_writes(url: URL, settings: Settings) -> bool:
+    """Whether the engine of ``url`` is a single writer next to a read pool."""
+    return is_sqlite_file(url) and settings.SQLITE_SERIALIZE_WRITES
+
+
+def sqlite_pragmas(settings: Settings) -> dict[str, Union[str, int]]:
+    return {
+        'journal_mode': settings.SQLITE_JOURNAL_MODE,
+        'synchronous': settings.SQLITE_SYNCHRONOUS,
+        'busy_timeout': settings.SQLITE_BUSY_TIMEOUT,
+        'cache_size': settings.SQLITE_CACHE_SIZE,
+        'mmap_size': settings.SQLITE_MMAP_SIZE,
+        'temp_store': settings.SQLITE_TEMP_STORE,
+    }
+
+
+def apply_sqlite_profile(
+    engine: Engine,
+    settings: Settings,
+    read_only: bool = False,
+    immediate: bool = False,
+) -> None:
+    """Set the pragmas on the connections of ``engine``.
+
+    ``read_only`` connections refuse to write, ``immediate`` ones take the
+    write lock when their transaction begins.
+    """
+    pragmas = sqlite_pragmas(settings)
+    if read_only:
+        pragmas['query_only'] = 'ON'
+
+    def set_pragmas(dbapi_connection: Any, **_: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+        if immediate:
+            # no implicit BEGIN from the driver, see begin_immediate
+            dbapi_connection.isolation_level = None
+
+    def begin_immediate(conn: Connection) -> None:
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+    event.listen(engine, 'connect', set_pragmas, named=True)
+    if immediate:
+        event.listen(engine, 'begin', begin_immediate)
@@ -0,0 +1,156 @@
+"""Read replicas for the GET requests and the admin's list views.
+
+A ``RoutingSession`` reads from a replica and writes to the primary. Once it
+wrote, it reads from the primary too, and so does a client for
+``REPLICA_STICKINESS`` seconds (the replication lag it tolerates) after its
+own writes: ``ReadYourWritesMiddleware`` stamps the responses to successful
+writes with the time, in a cookie and a header, which the client sends back.
+
+The replicas are health checked: each one is probed with a connection before
+its first use and, when it fails (to connect, or later with a disconnect),
+left out for ``REPLICA_RETRY_AFTER`` seconds and probed again. Without a
+healthy replica the reads go to the primary.
+"""
+import itertools
+import logging
+import math
+import time
+from typing import Any, Optional, Sequence, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, ExceptionContext
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+LAST_WRITE_COOKIE = 'last_write'
+LAST_WRITE_HEADER = 'X-Last-Write'
+# requests which only read, see ReadYourWritesMiddleware
+READ_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+
+class ReplicaSet:
+    """Round-robin over the healthy replicas."""
+
+    def __init__(
+        self, engines: Sequence[Union[Engine, AsyncEngine]], retry_after: float
+    ) -> None:
+        self.engines = list(engines)
+        # the sessions bind to the sync engines, async ones included
+        self.binds = [
+            engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+            for engine in self.engines
+        ]
+        self.retry_after = retry_after
+        self.healthy: set[Engine] = set()
+        self.down_until: dict[Engine, float] = {}
+        self._turns = itertools.count()
+        for bind in self.binds:
+            event.listen(bind, 'handle_error', self._handle_error)
+
+    def pick(self) -> Optional[Engine]:
+        """A healthy replica, or None."""
+        for _ in range(len(self.binds)):
+            bind = self.binds[next(self._turns) % len(self.binds)]
+            if bind in self.healthy or self._probe(bind):
+                return bind
+        return None
+
+    def _probe(self, bind: Engine) -> bool:
+        if self.down_until.get(bind, 0) > time.monotonic():
+            return False
+        try:
+            bind.connect().close()
+        except Exception:  # pylint: disable=broad-except
+            self.mark_down(bind)
+            return False
+        self.healthy.add(bind)
+        return True
+
+    def mark_down(self, bind: Engine) -> None:
+        logger.warning('Replica %s is down', bind.url)
+        self.healthy.discard(bind)
+        self.down_until[bind] = time.monotonic() + self.retry_after
+
+    def _handle_error(self, context: ExceptionContext) -> None:
+        if context.is_disconnect or context.connection is None:
+            self.mark_down(context.engine)
+
+
+class RoutingSession(Session):
+    """Writes (flushes and DML) go to ``primary``, reads to a replica until
+    ``sticky_until`` (a ``time.time()``) or as long as the session wrote in
+    the last ``REPLICA_STICKINESS`` seconds."""
+
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: ReplicaSet,
+        sticky_until: float = 0,
+        **kwargs: Any,
+    ) -> None:
+        # an AsyncSession passes its own (None) bind
+        kwargs['bind'] = primary
+        super().__init__(**kwargs)
+        self.primary = primary
+        self.replicas = replicas
+        self.sticky_until = sticky_until
+
+    def get_bind(  # pylint: disable=arguments-differ,unused-argument
+        self, mapper: Any = None, clause: Any = None, **kwargs: Any
+    ) -> Engine:
+        now = time.time()
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.sticky_until = now + get_settings().REPLICA_STICKINESS
+            return self.primary
+        if now < self.sticky_until:
+            return self.primary
+        return self.replicas.pick() or self.primary
+
+
+def read_your_writes_until(request: Request) -> float:
+    """Until when the client reads from the primary, after its last write."""
+    last_write = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(
+        LAST_WRITE_COOKIE
+    )
+    try:
+        # a stamp from the future would stick the client to the primary
+        last_write_time = min(float(last_write or 0), time.time())
+    except ValueError:
+        return 0
+    return last_write_time + get_settings().REPLICA_STICKINESS
+
+
+class ReadYourWritesMiddleware:
+    """Stamps the responses to the successful writes with their time."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or scope['method'] in READ_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_stamp(message: Message) -> None:
+            if message['type'] == 'http.response.start' and message['status'] < 400:
+                stamp = f'{time.time():.6f}'
+                max_age = math.ceil(get_settings().REPLICA_STICKINESS)
+                message['headers'] = [
+                    *message.get('headers', ()),
+                    (LAST_WRITE_HEADER.lower().encode(), stamp.encode()),
+                    (
+                        b'set-cookie',
+                        f'{LAST_WRITE_COOKIE}={stamp}; Max-Age={max_age}; '
+                        'Path=/; HttpOnly; SameSite=Lax'.encode(),
+                    ),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_stamp)
@@ -1,7 +1,12 @@
+import re
 from decimal import Decimal
-from typing import Optional
+from enum import Enum
+from typing import Any, Generic, Optional, TypeVar
 
-from pydantic import BaseModel
+from pydantic import BaseModel, root_validator, validator
+from pydantic.generics import GenericModel
+
+T = TypeVar('T')
 
 
 # Product category schemas
@@ -79,14 +84,84 @@ class Product(ProductCreate):
 
 class ProductExt(ProductBase):
     id: int
-    category: ProductCategory
+    category: Optional[ProductCategory]
     characteristics: Optional[list[ProductCharacteristicExt]]
 
 
+# "<characteristic id>:<value>", e.g. "3:синий"
+CHARACTERISTIC_FILTER = r'^\d+:.+$'
+
+
+# comma-separated keys, "-" for descending, the id breaks the ties; all indexed
+class ProductSort(str, Enum):
+    OLDEST = 'id'
+    NEWEST = '-id'
+    CHEAPEST = 'price'
+    MOST_EXPENSIVE = '-price'
+    NAME = 'name'
+    NAME_DESC = '-name'
+    CATEGORY_CHEAPEST = 'category,price'
+    CATEGORY_NAME = 'category,name'
+
+
 class ProductFilters(BaseModel):
+    # full-text search over name, description and characteristic values
+    search: Optional[str] = None
     filter_by_name: Optional[str] = ''
+    # the same as sort=-price, kept for the existing clients
     sort_by_price: Optional[bool] = False
-    filter_by_category_name: Optional[str]
+    sort: Optional[ProductSort] = None
+    filter_by_category_name: Optional[str] = None
+    min_price: Optional[Decimal] = None
+    max_price: Optional[Decimal] = None
+    # products having one of the values of every characteristic listed
+    filter_by_characteristic: list[str] = []
+
+    @validator('filter_by_characteristic')
+    def check_characteristic_filters(  # pylint: disable=no-self-argument
+        cls, value: list[str]
+    ) -> list[str]:
+        for characteristic_filter in value:
+            if not re.match(CHARACTERISTIC_FILTER, characteristic_filter):
+                raise ValueError(f'{characteristic_filter!r} is not "id:value"')
+        # sorted: the same filters are the same cache keys
+        return sorted(set(value))
+
+    def characteristic_values(self) -> dict[int, list[str]]:
+        values: dict[int, list[str]] = {}
+        for characteristic_filter in self.filter_by_characteristic:
+            characteristic_id, _, value = characteristic_filter.partition(':')
+            values.setdefault(int(characteristic_id), []).append(value)
+        return values
+
+    def by_relevance(self) -> bool:
+        """Whether the matches of the search come most relevant first."""
+        return bool(self.search) and self.sort is None and not self.sort_by_price
+
+
+# Facet schemas
+class CategoryFacet(BaseModel):
+    category_id: int
+    name: str
+    product_count: int
+
+    class Config:
+        orm_mode = True
+
+
+class CharacteristicFacet(BaseModel):
+    characteristic_id: int
+    name: str
+    characteristic_value: str
+    product_count: int
+
+    class Config:
+        orm_mode = True
+
+
+class Facets(BaseModel):
+    categories: list[CategoryFacet]
+    characteristics: list[CharacteristicFacet]
 
 
 # Product inventory schemas
@@ -99,6 +174,33 @@ class ProductInventory(BaseModel):
         orm_mode = True
 
 
+class InventoryAdjustment(BaseModel):
+    # the product is given either by id or by SKU
+    product_id: Optional[int]
+    sku: Optional[str]
+    delta: int
+
+    @root_validator(skip_on_failure=True)
+    def check_product(  # pylint: disable=no-self-argument
+        cls, values: dict[str, Any]
+    ) -> dict[str, Any]:
+        if (values['product_id'] is None) == (values['sku'] is None):
+            raise ValueError('either product_id or sku has to be given')
+        return values
+
+
+# Bulk import schemas
+class ImportRowError(BaseModel):
+    # line of the feed (the CSV header is line 1)
+    row: int
+    error: str
+
+
+class ImportReport(BaseModel):
+    imported: int = 0
+    errors: list[ImportRowError] = []
+
+
 # User schemas
 class User(BaseModel):
     # login = email
@@ -136,6 +238,13 @@ class ShippingAddress(BaseModel):
     address: str
     apartment: Optional[str]
 
+    # addresses are deduplicated by content, so spell them out the same way
+    @validator('country', 'city', 'postcode', 'address', 'apartment')
+    def collapse_whitespace(  # pylint: disable=no-self-argument
+        cls, value: Optional[str]
+    ) -> Optional[str]:
+        return None if value is None else ' '.join(value.split())
+
     class Config:
         orm_mode = True
 
@@ -150,10 +259,38 @@ class Order(BaseModel):
         orm_mode = True
 
 
+class CreatedOrder(Order):
+    id: int
+    payment_status: str
+
+
 class ProcessedOrder(Order):
     is_processed: bool
 
 
+class OrderPayment(BaseModel):
+    id: int
+    payment_status: str
+    is_paid: bool
+
+    class Config:
+        orm_mode = True
+
+
+class PaymentNotification(BaseModel):
+    # sent by the payment gateway
+    paid: bool
+
+
+# Pagination schemas
+class CursorPage(GenericModel, Generic[T]):
+    items: list[T]
+    size: int
+    next_cursor: Optional[str]
+    previous_cursor: Optional[str]
+    total: Optional[int]
+
+
 class HTTPError(BaseModel):
     detail: str
 
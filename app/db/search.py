@@ -0,0 +1,276 @@
+"""Full-text index over product names, descriptions and characteristic values.
+
+The index lives next to the catalogue tables (``product_search``): an FTS5
+table with the trigram tokenizer on sqlite, a weighted tsvector with a GIN
+index on Postgres. It is created together with the tables and kept in sync
+from the session, so every writer (API, admin, bulk jobs) updates it.
+"""
+import re
+from typing import Any, Iterable, Optional
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Dialect
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+SEARCH_TABLE = 'product_search'
+
+fts_table = sa.table(
+    SEARCH_TABLE,
+    sa.column('rowid', sa.Integer),
+    sa.column('name', sa.String),
+    sa.column('description', sa.Text),
+    sa.column('characteristics', sa.Text),
+)
+
+
+def _characteristics_text(product_id: Any) -> Any:
+    return (
+        sa.select(
+            sa.func.coalesce(
+                sa.func.group_concat(models.ProductCharacteristic.characteristic_value),
+                '',
+            )
+        )
+        .where(models.ProductCharacteristic.product_id == product_id)
+        .scalar_subquery()
+    )
+
+
+class SearchBackend:
+    """Fallback for databases without full-text search: plain LIKE scans."""
+
+    def create_schema(  # pylint: disable=unused-argument
+        self, connection: Connection
+    ) -> bool:
+        """Create the index storage, return True if it didn't exist yet."""
+        return False
+
+    def reindex(self, connection: Connection, product_ids: Iterable[int]) -> None:
+        pass
+
+    def reindex_all(self, connection: Connection) -> None:
+        pass
+
+    def name_filter(self, name: str) -> Any:
+        return models.Product.name.contains(name)
+
+    def search(self, query: str) -> Any:
+        """Selectable of (product_id, rank) matching ``query``, best match first."""
+        terms = [models.Product.name.contains(term) for term in query.split()]
+        return (
+            sa.select(
+                models.Product.id.label('product_id'), sa.literal(0).label('rank')
+            )
+            .where(*terms)
+            .subquery()
+        )
+
+
+class SqliteSearchBackend(SearchBackend):
+    # trigrams match any substring of at least three characters (prefixes
+    # included), which keeps the semantics of the former LIKE '%name%'
+    MIN_TERM_LENGTH = 3
+    # bm25 weights of the name, description and characteristics columns
+    WEIGHTS = (10.0, 1.0, 2.0)
+
+    def create_schema(self, connection: Connection) -> bool:
+        exists = connection.execute(
+            sa.text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+            {'name': SEARCH_TABLE},
+        ).first()
+        if exists:
+            return False
+        connection.exec_driver_sql(
+            f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5('
+            "name, description, characteristics, tokenize='trigram')"
+        )
+        return True
+
+    def _insert(self, connection: Connection, where: Any) -> None:
+        products = sa.select(
+            models.Product.id,
+            models.Product.name,
+            models.Product.description,
+            _characteristics_text(models.Product.id),
+        ).where(where)
+        connection.execute(
+            sa.insert(fts_table).from_select(
+                ['rowid', 'name', 'description', 'characteristics'], products
+            )
+        )
+
+    def reindex(self, connection: Connection, product_ids: Iterable[int]) -> None:
+        product_ids = list(product_ids)
+        connection.execute(
+            sa.delete(fts_table).where(fts_table.c.rowid.in_(product_ids))
+        )
+        self._insert(connection, models.Product.id.in_(product_ids))
+
+    def reindex_all(self, connection: Connection) -> None:
+        connection.execute(sa.delete(fts_table))
+        self._insert(connection, sa.true())
+
+    @staticmethod
+    def _phrase(term: str) -> str:
+        escaped = term.replace('"', '""')
+        return f'"{escaped}"'
+
+    def name_filter(self, name: str) -> Any:
+        if len(name.strip()) < self.MIN_TERM_LENGTH:
+            return super().name_filter(name)
+        matching = sa.select(fts_table.c.rowid).where(
+            sa.text(f'{SEARCH_TABLE} MATCH :name_query').bindparams(
+                name_query=f'name : {self._phrase(name.strip())}'
+            )
+        )
+        return models.Product.id.in_(matching)
+
+    def search(self, query: str) -> Any:
+        terms = [
+            self._phrase(term)
+            for term in query.split()
+            if len(term) >= self.MIN_TERM_LENGTH
+        ]
+        if not terms:
+            return super().search(query)
+        weights = ', '.join(str(weight) for weight in self.WEIGHTS)
+        return (
+            sa.select(
+                fts_table.c.rowid.label('product_id'),
+                sa.literal_column(f'bm25({SEARCH_TABLE}, {weights})').label('rank'),
+            )
+            .where(
+                sa.text(f'{SEARCH_TABLE} MATCH :search_query').bindparams(
+                    search_query=' AND '.join(terms)
+                )
+            )
+            .subquery()
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+    CONFIG = 'simple'
+
+    def create_schema(self, connection: Connection) -> bool:
+        exists = connection.execute(
+            sa.text('SELECT to_regclass(:name)'), {'name': SEARCH_TABLE}
+        ).scalar()
+        if exists:
+            return False
+        connection.exec_driver_sql(
+            f'CREATE TABLE {SEARCH_TABLE} ('
+            'product_id INTEGER PRIMARY KEY REFERENCES product (id) ON DELETE CASCADE, '
+            'document TSVECTOR NOT NULL)'
+        )
+        connection.exec_driver_sql(
+            f'CREATE INDEX ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING gin (document)'
+        )
+        # substring name filters stay LIKE queries, served by a trigram index
+        connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        connection.exec_driver_sql(
+            'CREATE INDEX IF NOT EXISTS ix_product_name_trgm '
+            'ON product USING gin (name gin_trgm_ops)'
+        )
+        return True
+
+    def _upsert(self, connection: Connection, where: str, **params: Any) -> None:
+        connection.execute(
+            sa.text(
+                f'INSERT INTO {SEARCH_TABLE} (product_id, document) '
+                'SELECT p.id, '
+                f"setweight(to_tsvector('{self.CONFIG}', p.name), 'A') || "
+                f"setweight(to_tsvector('{self.CONFIG}', coalesce(("
+                "SELECT string_agg(pc.characteristic_value, ' ') "
+                "FROM product_characteristic pc WHERE pc.product_id = p.id), '')), 'B') || "
+                f"setweight(to_tsvector('{self.CONFIG}', p.description), 'C') "
+                f'FROM product p WHERE {where} '
+                'ON CONFLICT (product_id) DO UPDATE SET document = excluded.document'
+            ),
+            params,
+        )
+
+    def reindex(self, connection: Connection, product_ids: Iterable[int]) -> None:
+        self._upsert(connection, 'p.id = ANY(:ids)', ids=list(product_ids))
+
+    def reindex_all(self, connection: Connection) -> None:
+        self._upsert(connection, 'true')
+
+    def search(self, query: str) -> Any:
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return super().search(query)
+        ts_query = sa.func.to_tsquery(
+            self.CONFIG, ' & '.join(f'{term}:*' for term in terms)
+        )
+        document = sa.column('document')
+        return (
+            sa.select(
+                sa.column('product_id'),
+                (-sa.func.ts_rank(document, ts_query)).label('rank'),
+            )
+            .select_from(sa.table(SEARCH_TABLE))
+            .where(document.op('@@')(ts_query))
+            .subquery()
+        )
+
+
+_backends: dict[str, SearchBackend] = {
+    'sqlite': SqliteSearchBackend(),
+    'postgresql': PostgresSearchBackend(),
+}
+
+
+def get_backend(dialect: Dialect) -> SearchBackend:
+    return _backends.get(dialect.name, SearchBackend())
+
+
+# Schema: created along with the tables, filled from existing products
+@event.listens_for(models.Base.metadata, 'after_create', named=True)
+def _create_search_schema(connection: Connection, **_: Any) -> None:
+    backend = get_backend(connection.dialect)
+    if backend.create_schema(connection):
+        backend.reindex_all(connection)
+
+
+@event.listens_for(models.Base.metadata, 'before_drop', named=True)
+def _drop_search_schema(connection: Connection, **_: Any) -> None:
+    connection.exec_driver_sql(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+# Synchronization: remember the products touched by each flush, reindex
+# them once just before the transaction commits
+_PENDING_KEY = 'search_pending_products'
+
+
+def _touched_product_id(instance: Any) -> Optional[int]:
+    if isinstance(instance, models.Product):
+        return instance.id
+    if isinstance(instance, models.ProductCharacteristic):
+        return instance.product_id
+    return None
+
+
+@event.listens_for(Session, 'after_flush', named=True)
+def _collect_touched_products(session: Session, **_: Any) -> None:
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        product_id = _touched_product_id(instance)
+        if product_id is not None:
+            pending.add(product_id)
+
+
+@event.listens_for(Session, 'before_commit')
+def _reindex_touched_products(session: Session) -> None:
+    session.flush()
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        connection = session.connection()
+        get_backend(connection.dialect).reindex(connection, pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_touched_products(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -1,18 +1,150 @@
-from typing import Generator
+import asyncio
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from functools import partial
+from typing import AsyncGenerator, AsyncIterator, Optional
+from weakref import WeakKeyDictionary
 
+from anyio import Semaphore
+from fastapi import Query, Request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from app.db.database import get_session
+from app.config import get_settings
+from app.db import schemas
+from app.db.database import (
+    get_async_read_session,
+    get_async_session,
+    get_read_session,
+    get_session,
+)
+from app.db.pragmas import serializes_writes
+from app.db.replicas import READ_METHODS, read_your_writes_until
 
+# A semaphore only wakes tasks of its own event loop: one per loop (the test
+# client runs several), like the loop's tasks they don't outlive it.
+_session_slots: 'WeakKeyDictionary[asyncio.AbstractEventLoop, Semaphore]' = (
+    WeakKeyDictionary()
+)
+_write_slots: 'WeakKeyDictionary[asyncio.AbstractEventLoop, Semaphore]' = (
+    WeakKeyDictionary()
+)
 
-def get_db() -> Generator[Session, None, None]:
-    session_local = get_session()
-    db = session_local()
-    try:
-        yield db
-        db.commit()
-    except Exception:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+
+def _loop_slots(
+    slots: 'WeakKeyDictionary[asyncio.AbstractEventLoop, Semaphore]', count: int
+) -> Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in slots:
+        slots[loop] = Semaphore(count)
+    return slots[loop]
+
+
+def get_session_slots() -> Semaphore:
+    # A sync request needs a threadpool worker for the endpoint and again for
+    # the response validation, holding its connection in between. Admitting no
+    # more sessions than the pool has connections keeps workers from blocking
+    # on a checkout while the connections wait for a worker.
+    settings = get_settings()
+    return _loop_slots(
+        _session_slots, settings.SQLALCHEMY_POOL_SIZE + settings.SQLALCHEMY_MAX_OVERFLOW
+    )
+
+
+def get_writer_slot() -> Optional[Semaphore]:
+    # The single SQLite writer: the write transactions queue here, on the event
+    # loop, rather than in threadpool workers (or async sessions) blocked on its
+    # connection until the pool timeout; its one connection serializes between
+    # the loops.
+    settings = get_settings()
+    if not serializes_writes(make_url(settings.SQLALCHEMY_DATABASE_URI), settings):
+        return None
+    return _loop_slots(_write_slots, 1)
+
+
+def get_write_slots() -> Semaphore:
+    """The slots of the sync write sessions."""
+    return get_writer_slot() or get_session_slots()
+
+
+@asynccontextmanager
+async def async_session_slot(write: bool) -> AsyncIterator[None]:
+    """Async sessions hold no worker, only the writes to the single writer wait."""
+    slot = get_writer_slot() if write else None
+    if slot is None:
+        yield
+        return
+    async with slot:
+        yield
+
+
+async def get_db(request: Request) -> AsyncGenerator[Session, None]:
+    if request.method in READ_METHODS:
+        # from a replica, or the primary right after the client's own writes
+        slots = get_session_slots()
+        session_local = partial(
+            get_read_session(), sticky_until=read_your_writes_until(request)
+        )
+    else:
+        slots, session_local = get_write_slots(), get_session()
+    async with slots:
+        db = session_local()
+        try:
+            yield db
+            await run_in_threadpool(db.commit)
+        except Exception:
+            await run_in_threadpool(db.rollback)
+            raise
+        finally:
+            await run_in_threadpool(db.close)
+
+
+async def get_async_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    # like the sync writes, queue for the writer on the event loop (instead of
+    # in its pool), without blocking a worker
+    write = request.method not in READ_METHODS
+    if write:
+        session_local = get_async_session()
+    else:
+        session_local = partial(
+            get_async_read_session(), sticky_until=read_your_writes_until(request)
+        )
+    async with async_session_slot(write):
+        db = session_local()
+        try:
+            yield db
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        finally:
+            await db.close()
+
+
+def get_product_filters(  # pylint: disable=too-many-arguments
+    search: Optional[str] = None,
+    filter_by_name: Optional[str] = '',
+    sort_by_price: Optional[bool] = False,
+    sort: Optional[schemas.ProductSort] = None,
+    filter_by_category_name: Optional[str] = None,
+    min_price: Optional[Decimal] = Query(None, ge=0),
+    max_price: Optional[Decimal] = Query(None, ge=0),
+    filter_by_characteristic: list[str] = Query(
+        [],
+        regex=schemas.CHARACTERISTIC_FILTER,
+        description='"characteristic_id:value", see /api/products/facets',
+    ),
+) -> schemas.ProductFilters:
+    # spelled out: FastAPI would read a list field of the model from the body
+    return schemas.ProductFilters(
+        search=search,
+        filter_by_name=filter_by_name,
+        sort_by_price=sort_by_price,
+        sort=sort,
+        filter_by_category_name=filter_by_category_name,
+        min_price=min_price,
+        max_price=max_price,
+        filter_by_characteristic=filter_by_characteristic,
+    )
@@ -1,3 +1,5 @@
+from typing import Iterable
+
 from fastapi import HTTPException, status
 
 CategoryAlreadyRegistered = HTTPException(
@@ -25,6 +27,11 @@ ProductNotFound = HTTPException(
     detail='Product Not Found',
 )
 
+InventoryNotFound = HTTPException(
+    status_code=status.HTTP_404_NOT_FOUND,
+    detail='The product has no inventory record',
+)
+
 DuplicateCharacteristic = HTTPException(
     status_code=status.HTTP_409_CONFLICT,
     detail='You stated the same characteristic several times',
@@ -45,6 +52,23 @@ InsufficientStock = HTTPException(
     detail='Not enough items in stock',
 )
 
+NegativeStock = HTTPException(
+    status_code=status.HTTP_409_CONFLICT,
+    detail='The quantity in stock can not become negative',
+)
+
+
+def negative_stock(product_ids: Iterable[int]) -> HTTPException:
+    """NegativeStock naming the products whose stock would become negative."""
+    ids = ', '.join(str(product_id) for product_id in product_ids)
+    if not ids:
+        return NegativeStock
+    return HTTPException(
+        status_code=NegativeStock.status_code,
+        detail=f'{NegativeStock.detail} (products {ids})',
+    )
+
+
 OrderNotFound = HTTPException(
     status_code=status.HTTP_404_NOT_FOUND,
     detail='Order Not Found',
@@ -59,3 +83,30 @@ OrderAlreadyCompleted = HTTPException(
     status_code=status.HTTP_409_CONFLICT,
     detail='The order is already completed',
 )
+
+IdempotencyKeyReused = HTTPException(
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    detail='The Idempotency-Key was already used for another request',
+)
+
+PaymentAlreadyRecorded = HTTPException(
+    status_code=status.HTTP_409_CONFLICT,
+    detail='The payment of the order is already recorded',
+)
+
+WrongPaymentSecret = HTTPException(
+    status_code=status.HTTP_403_FORBIDDEN,
+    detail='Wrong payment webhook secret',
+)
+
+InvalidCursor = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST,
+    detail='Invalid pagination cursor',
+)
+
+# the relevance of the search matches is computed per query, a cursor can't
+# point into it
+UnsortedSearchCursor = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST,
+    detail='Cursor pages of a search need a sort',
+)
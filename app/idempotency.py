@@ -0,0 +1,55 @@
+"""Idempotency-Key support for POST /api/orders/.
+
+Clients retry order creation on timeouts. A request carrying an
+``Idempotency-Key`` header claims the key in the same transaction that
+creates the order and stores the response next to it, so both commit (or
+roll back) together. A retry finds the key and gets the stored response
+without running the order pipeline again. A concurrent duplicate blocks on
+the claim until the first request's transaction ends: it then replays the
+response, or runs the pipeline itself if the first one failed.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from typing import Callable
+
+from fastapi import Response
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.db import crud
+from app.exceptions import IdempotencyKeyReused
+
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def request_hash(body: str) -> str:
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def idempotent_response(
+    db: Session, key: str, body: str, build: Callable[[], Response]
+) -> Response:
+    """Return ``build()``, or what it returned for the first request with ``key``.
+
+    ``body`` identifies the request; reusing a key for another one is an error.
+    Error responses are not stored: they roll the transaction, and so the
+    claim of the key, back.
+    """
+    body_hash = request_hash(body)
+    expired_before = datetime.now() - timedelta(
+        seconds=get_settings().IDEMPOTENCY_KEY_TTL
+    )
+    if crud.claim_idempotency_key(db, key, body_hash, expired_before):
+        response = build()
+        crud.store_idempotent_response(db, key, response.status_code, response.body)
+        return response
+
+    stored = crud.get_idempotency_key(db, key)
+    if stored is None or stored.request_hash != body_hash:
+        raise IdempotencyKeyReused
+    return Response(
+        stored.response,
+        status_code=stored.status_code,
+        media_type='application/json',
+        headers={REPLAYED_HEADER: 'true'},
+    )
@@ -0,0 +1,53 @@
+"""Maintenance jobs run periodically by the API processes, on the event loop
+next to the payment workers."""
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.db import crud
+from app.payments import run_in_session
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """Runs ``function(db)`` in a transaction every ``interval`` seconds (0: never)."""
+
+    def __init__(
+        self, name: str, function: Callable[[Session], None], interval: float
+    ) -> None:
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.task: Optional[asyncio.Task[None]] = None
+
+    def start(self) -> None:
+        if self.interval:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await run_in_session(self.function)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('The %s failed', self.name)
+
+
+@lru_cache()
+def get_facet_reconciler() -> PeriodicJob:
+    return PeriodicJob(
+        'facet reconciliation',
+        crud.reconcile_facets,
+        get_settings().FACET_RECONCILE_INTERVAL,
+    )
@@ -1,11 +1,67 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi_pagination import add_pagination
 
-from app.routers import orders, products
+from app import jobs, metrics, payments
+from app.config import get_settings
+from app.db.database import (
+    dispose_async_engine,
+    dispose_engine,
+    get_async_engine,
+    get_engine,
+)
+from app.db.debug import NPlusOneMiddleware
+from app.db.replicas import ReadYourWritesMiddleware
+from app.routers import bulk, orders, products
+from app.routers.async_routes import as_async_router
 from app.tags import tags_metadata
 
 app = FastAPI(openapi_tags=tags_metadata)
 
-app.include_router(products.router, prefix='/api')
-app.include_router(orders.router, prefix='/api')
+api_routers = [products.router, bulk.router, orders.router]
+if get_settings().SQLALCHEMY_ASYNC:
+    api_routers = [as_async_router(router) for router in api_routers]
+for api_router in api_routers:
+    app.include_router(api_router, prefix='/api')
 add_pagination(app)
+
+if get_settings().METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware, log=get_settings().METRICS_LOG)
+
+    @app.get('/metrics', include_in_schema=False)
+    def get_metrics() -> Response:
+        return Response(
+            metrics.registry.render(), media_type='text/plain; version=0.0.4'
+        )
+
+
+if get_settings().SQLALCHEMY_REPLICA_URIS:
+    app.add_middleware(ReadYourWritesMiddleware)
+
+if get_settings().N_PLUS_ONE_THRESHOLD:
+    app.add_middleware(
+        NPlusOneMiddleware, threshold=get_settings().N_PLUS_ONE_THRESHOLD
+    )
+
+
+@app.on_event('startup')
+def startup() -> None:
+    if get_settings().SQLALCHEMY_ASYNC:
+        get_async_engine()
+    else:
+        get_engine()
+
+
+@app.on_event('startup')
+async def start_background_tasks() -> None:
+    payments.get_payment_workers().start()
+    jobs.get_facet_reconciler().start()
+
+
+@app.on_event('shutdown')
+async def shutdown() -> None:
+    await payments.get_payment_workers().stop()
+    await jobs.get_facet_reconciler().stop()
+    if get_settings().SQLALCHEMY_ASYNC:
+        await dispose_async_engine()
+    else:
+        dispose_engine()
@@ -0,0 +1,250 @@
+"""Per-request performance metrics, exported for Prometheus on /metrics.
+
+``MetricsMiddleware`` gives every HTTP request a ``RequestStats`` (through a
+context variable, which the threadpool and SQLAlchemy's async greenlets both
+inherit) and records it per route template when the response is sent:
+
+* the request duration,
+* the number of statements and the time spent in them,
+* the rows the SELECTs returned (counted as the results are fetched),
+* the time spent waiting for a pooled connection,
+* the time spent rendering responses (``app.serializers``).
+
+The database figures come from ``app.db.instrumentation``.
+
+The hits, misses and size of the caches passed to ``register_cache`` are
+exported along with them.
+
+With ``METRICS_LOG`` every request is also logged as a JSON line.
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Iterator, Optional, Sequence
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 10_000)
+
+
+@dataclass
+class RequestStats:
+    db_statements: int = 0
+    db_time: float = 0
+    db_rows: int = 0
+    pool_wait: float = 0
+    serialization_time: float = 0
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """The stats of the request being served, None outside of a request."""
+    return _current.get()
+
+
+@contextmanager
+def serialization_timer() -> Iterator[None]:
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialization_time += time.perf_counter() - start
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # label values -> per bucket counts (the last one is +Inf), sum
+        self.series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, labels: tuple[str, ...], value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = series
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        total[0] += value
+
+    def render(self, label_names: Sequence[str]) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, total) in sorted(self.series.items()):
+            label_text = ','.join(
+                f'{name}="{_escape(value)}"' for name, value in zip(label_names, labels)
+            )
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{{label_text}}} {total[0]}'
+            yield f'{self.name}_count{{{label_text}}} {cumulative}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+# the caches exported on /metrics, by name
+_caches: dict[str, TTLCache] = {}
+
+
+def register_cache(name: str, cache: TTLCache) -> None:
+    _caches[name] = cache
+
+
+def _render_caches() -> Iterator[str]:
+    for metric, kind, documentation, stat in (
+        ('cache_hits_total', 'counter', 'Cache lookups which found an entry.', 'hits'),
+        ('cache_misses_total', 'counter', 'Cache lookups which missed.', 'misses'),
+        ('cache_entries', 'gauge', 'Entries in the cache.', 'size'),
+    ):
+        yield f'# HELP {metric} {documentation}'
+        yield f'# TYPE {metric} {kind}'
+        for name, cache in sorted(_caches.items()):
+            yield f'{metric}{{cache="{_escape(name)}"}} {cache.stats()[stat]}'
+
+
+class Registry:
+    LABELS = ('method', 'route')
+
+    def __init__(self) -> None:
+        self.requests: dict[tuple[str, str, str], int] = {}
+        self.duration = Histogram(
+            'http_request_duration_seconds', 'Request duration.', DURATION_BUCKETS
+        )
+        self.db_statements = Histogram(
+            'db_statements_per_request', 'SQL statements per request.', COUNT_BUCKETS
+        )
+        self.db_time = Histogram(
+            'db_time_seconds', 'Time spent in SQL per request.', DURATION_BUCKETS
+        )
+        self.db_rows = Histogram(
+            'db_rows_per_request', 'Rows returned by SQL per request.', COUNT_BUCKETS
+        )
+        self.pool_wait = Histogram(
+            'db_pool_wait_seconds',
+            'Time spent waiting for a pooled connection per request.',
+            DURATION_BUCKETS,
+        )
+        self.serialization_time = Histogram(
+            'serialization_seconds',
+            'Time spent rendering responses per request.',
+            DURATION_BUCKETS,
+        )
+
+    def record(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        duration: float,
+        stats: RequestStats,
+    ) -> None:
+        key = (method, route, str(status))
+        self.requests[key] = self.requests.get(key, 0) + 1
+        labels = (method, route)
+        self.duration.observe(labels, duration)
+        self.db_statements.observe(labels, stats.db_statements)
+        self.db_time.observe(labels, stats.db_time)
+        self.db_rows.observe(labels, stats.db_rows)
+        self.pool_wait.observe(labels, stats.pool_wait)
+        self.serialization_time.observe(labels, stats.serialization_time)
+
+    def render(self) -> str:
+        lines = [
+            '# HELP http_requests_total Requests by route and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(
+                f'http_requests_total{{method="{method}",route="{_escape(route)}",'
+                f'status="{status}"}} {count}'
+            )
+        for histogram in (
+            self.duration,
+            self.db_statements,
+            self.db_time,
+            self.db_rows,
+            self.pool_wait,
+            self.serialization_time,
+        ):
+            lines.extend(histogram.render(self.LABELS))
+        lines.extend(_render_caches())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _route_template(scope: Scope) -> str:
+    # the path as declared (/api/products/{product_id}): one series per route
+    app = scope.get('app')
+    for route in getattr(getattr(app, 'router', None), 'routes', ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return str(getattr(route, 'path', scope['path']))
+    return 'unmatched'
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, log: bool = False) -> None:
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            _current.reset(token)
+            route = _route_template(scope)
+            registry.record(scope['method'], route, status, duration, stats)
+            if self.log:
+                logger.info(
+                    json.dumps(
+                        {
+                            'method': scope['method'],
+                            'route': route,
+                            'status': status,
+                            'duration': duration,
+                            **asdict(stats),
+                        }
+                    )
+                )
@@ -0,0 +1,216 @@
+"""Order payments, taken out of the order request.
+
+An order is created as ``pending_payment`` and the request returns straight
+away. A dispatcher task polls the pending orders and hands them to a pool of
+worker tasks on the event loop, which charge them through the payment
+gateway and record the outcome. Gateways which report on their own can call
+the webhook instead (``POST /api/orders/{order_id}/payment``).
+
+A worker claims an order in the database (``pending_payment`` becomes
+``charging``) before charging it, so an order polled by two workers or two
+API processes is charged by one of them. A claim expires after
+``PAYMENT_CLAIM_TIMEOUT`` seconds, in case its worker died mid-charge; the
+gateway gets the order id as idempotency key, so the charge that follows
+returns the outcome of the first one. Only the first outcome is recorded.
+"""
+import asyncio
+import importlib
+import logging
+import math
+import random
+from decimal import Decimal
+from functools import lru_cache, partial
+from typing import Any, Callable, Optional, Protocol, TypeVar
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import get_settings
+from app.db import crud
+from app.db.database import (
+    get_async_read_session,
+    get_async_session,
+    get_read_session,
+    get_session,
+)
+from app.dependencies import async_session_slot, get_session_slots, get_write_slots
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class PaymentGateway(Protocol):
+    async def charge(self, order_id: int, amount: Decimal) -> bool:
+        """Charge the order (idempotent per order id), True if it is paid."""
+
+
+class FakeGateway:
+    """Local stand-in for a payment gateway: answers after ``latency`` seconds,
+    successfully with the probability ``success_rate``. Like a real gateway,
+    it answers the charges of an order with the outcome of the first one."""
+
+    def __init__(self, latency: float = 0, success_rate: float = 0.8) -> None:
+        self.latency = latency
+        self.success_rate = success_rate
+        self.outcomes: dict[int, bool] = {}
+
+    async def charge(  # pylint: disable=unused-argument
+        self, order_id: int, amount: Decimal
+    ) -> bool:
+        await asyncio.sleep(self.latency)
+        return self.outcomes.setdefault(order_id, random.random() < self.success_rate)
+
+
+@lru_cache()
+def get_gateway() -> PaymentGateway:
+    settings = get_settings()
+    if settings.PAYMENT_GATEWAY == 'fake':
+        return FakeGateway(
+            latency=settings.PAYMENT_GATEWAY_LATENCY,
+            success_rate=settings.PAYMENT_SUCCESS_RATE,
+        )
+    # any other value is the import path of a gateway class
+    module_name, _, class_name = settings.PAYMENT_GATEWAY.rpartition('.')
+    gateway_class = getattr(importlib.import_module(module_name), class_name)
+    return gateway_class()  # type: ignore[no-any-return]
+
+
+async def run_in_session(
+    function: Callable[..., T], *args: Any, read_only: bool = False
+) -> T:
+    """Run ``function(db, *args)`` in a transaction of its own.
+
+    Like the requests, writes queue for the writer (see ``app.dependencies``).
+    Reads don't, but they stick to the primary: the replicas may lag behind
+    the orders and payments they poll for.
+    """
+    if get_settings().SQLALCHEMY_ASYNC:
+        async_session = (
+            partial(get_async_read_session(), sticky_until=math.inf)
+            if read_only
+            else get_async_session()
+        )
+        async with async_session_slot(write=not read_only):
+            async with async_session() as async_db:
+                result = await async_db.run_sync(function, *args)
+                await async_db.commit()
+        return result
+
+    session = (
+        partial(get_read_session(), sticky_until=math.inf)
+        if read_only
+        else get_session()
+    )
+
+    def run() -> T:
+        db: Session
+        with session() as db:
+            result = function(db, *args)
+            db.commit()
+        return result
+
+    async with get_session_slots() if read_only else get_write_slots():
+        return await run_in_threadpool(run)
+
+
+class PaymentWorkers:
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        gateway: PaymentGateway,
+        workers: int,
+        poll_interval: float,
+        retry_delay: float = 1,
+        max_attempts: int = 5,
+        claim_timeout: float = 60,
+    ) -> None:
+        self.gateway = gateway
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.claim_timeout = claim_timeout
+        self.tasks: list[asyncio.Task[None]] = []
+        # orders queued or being charged by this process
+        self.in_flight: set[int] = set()
+        self.queue: Optional[asyncio.Queue[tuple[int, Decimal]]] = None
+
+    def start(self) -> None:
+        if not self.workers:
+            return
+        # a short queue: orders wait in the database, not in memory
+        self.queue = asyncio.Queue(maxsize=self.workers)
+        self.tasks = [asyncio.create_task(self._dispatch())] + [
+            asyncio.create_task(self._work()) for _ in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.in_flight.clear()
+
+    async def _dispatch(self) -> None:
+        assert self.queue is not None
+        while True:
+            try:
+                pending = await run_in_session(
+                    crud.get_pending_payments,
+                    self.workers,
+                    list(self.in_flight),
+                    read_only=True,
+                )
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Could not poll the pending payments')
+                pending = []
+            for order_id, total in pending:
+                self.in_flight.add(order_id)
+                await self.queue.put((order_id, total))
+            if not pending:
+                await asyncio.sleep(self.poll_interval)
+
+    async def _work(self) -> None:
+        assert self.queue is not None
+        while True:
+            order_id, total = await self.queue.get()
+            try:
+                if not await run_in_session(
+                    crud.claim_payment, order_id, self.claim_timeout
+                ):
+                    # charged by another worker, or settled meanwhile
+                    continue
+                paid = await self.gateway.charge(order_id, total)
+                await run_in_session(crud.record_payment, order_id, paid)
+            except Exception:  # pylint: disable=broad-except
+                # the order stays pending and is picked up again once its
+                # retry delay has passed, unless it ran out of attempts
+                logger.exception('Payment of order %s failed', order_id)
+                await self._record_error(order_id)
+            finally:
+                self.in_flight.discard(order_id)
+                self.queue.task_done()
+
+    async def _record_error(self, order_id: int) -> None:
+        try:
+            await run_in_session(
+                crud.record_payment_error,
+                order_id,
+                self.max_attempts,
+                self.retry_delay,
+            )
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Could not record the failed payment of %s', order_id)
+
+
+@lru_cache()
+def get_payment_workers() -> PaymentWorkers:
+    settings = get_settings()
+    return PaymentWorkers(
+        get_gateway(),
+        workers=settings.PAYMENT_WORKERS,
+        poll_interval=settings.PAYMENT_POLL_INTERVAL,
+        retry_delay=settings.PAYMENT_RETRY_DELAY,
+        max_attempts=settings.PAYMENT_MAX_ATTEMPTS,
+        claim_timeout=settings.PAYMENT_CLAIM_TIMEOUT,
+    )
@@ -0,0 +1,163 @@
+"""Cache of the serialized product responses, validated with ETags.
+
+Entries are JSON bodies keyed by the request (path, normalized filters, page)
+and by the catalogue *generation*. Every transaction which writes to a
+catalogue table bumps the generation, which orphans every entry at once. The
+generation is a row of the database, bumped in the transaction of the writes:
+the admin, the API workers and any other process invalidate each other's
+entries, whether those live in memory or in Redis.
+"""
+import hashlib
+import time
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import event, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app import serializers
+from app.cache import TTLCache
+from app.config import get_settings
+from app.db import models
+from app.db.replicas import read_your_writes_until
+
+# tables whose content ends up in the product responses
+CATALOGUE_TABLES = frozenset(
+    {
+        'product',
+        'product_inventory',
+        'product_category',
+        'characteristic',
+        'product_characteristic',
+    }
+)
+
+
+class MemoryCacheBackend:
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.entries.get(key)  # type: ignore[no-any-return]
+
+    def set(self, key: str, body: bytes) -> None:
+        self.entries.set(key, body)
+
+
+class RedisCacheBackend:
+    """Entries in Redis, shared by every process using it."""
+
+    def __init__(self, client: Any, ttl: int, prefix: str = 'response-cache:') -> None:
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)  # type: ignore[no-any-return]
+
+    def set(self, key: str, body: bytes) -> None:
+        self.client.set(self.prefix + key, body, ex=self.ttl)
+
+
+@lru_cache()
+def get_response_cache() -> Any:
+    settings = get_settings()
+    if not settings.RESPONSE_CACHE_REDIS_URL:
+        return MemoryCacheBackend(
+            maxsize=settings.RESPONSE_CACHE_SIZE, ttl=settings.RESPONSE_CACHE_TTL
+        )
+
+    # pylint: disable=import-outside-toplevel,import-error
+    import redis  # type: ignore[import]
+
+    return RedisCacheBackend(
+        redis.Redis.from_url(settings.RESPONSE_CACHE_REDIS_URL),
+        ttl=settings.RESPONSE_CACHE_TTL,
+    )
+
+
+def etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def _matches(if_none_match: Optional[str], tag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip() for candidate in if_none_match.split(',')}
+    # If-None-Match uses the weak comparison
+    return '*' in candidates or tag in candidates or f'W/{tag}' in candidates
+
+
+def generation(db: Session) -> int:
+    """The catalogue generation, as of the snapshot ``db`` reads."""
+    return db.execute(select(models.CacheGeneration.generation)).scalar() or 0
+
+
+def cached_json_response(
+    request: Request,
+    db: Session,
+    key: str,
+    response_model: Any,
+    build: Callable[[], Any],
+) -> Response:
+    """Serve ``build()`` as JSON from the cache, or 304 if the client has it.
+
+    ``build`` only runs on a cache miss; its result is rendered for
+    ``response_model`` the way FastAPI would do it. The generation is read
+    through ``db`` before ``build`` runs, in the same transaction: an entry
+    never holds rows older than its generation. A client reading its own
+    writes (see ``app.db.replicas``) bypasses the cache: an entry may have
+    been read from a replica which lags behind them.
+    """
+    if read_your_writes_until(request) > time.time():
+        body = serializers.render(response_model, build())
+    else:
+        cache = get_response_cache()
+        key = f'{generation(db)}:{key}'
+        body = cache.get(key)
+        if body is None:
+            body = serializers.render(response_model, build())
+            cache.set(key, body)
+
+    tag = etag(body)
+    headers = {'ETag': tag, 'Cache-Control': 'no-cache'}
+    if _matches(request.headers.get('if-none-match'), tag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+# Invalidation: note the catalogue writes executed on a connection (ORM
+# flushes, Core and bulk statements alike), and bump the generation right
+# before the transaction commits, in it: a reader sees both the writes and the
+# new generation, or neither.
+_DIRTY_KEY = 'response_cache_dirty'
+_BUMP = 'UPDATE cache_generation SET generation = generation + 1'
+
+
+@event.listens_for(Engine, 'after_cursor_execute', named=True)
+def _note_catalogue_write(conn: Connection, context: Any, **_: Any) -> None:
+    if context is None or not (
+        context.isinsert or context.isupdate or context.isdelete
+    ):
+        return
+    table = getattr(context.compiled.statement, 'table', None)
+    if getattr(table, 'name', None) in CATALOGUE_TABLES:
+        conn.info[_DIRTY_KEY] = True
+
+
+@event.listens_for(Engine, 'commit')
+def _bump_generation(conn: Connection) -> None:
+    if conn.info.pop(_DIRTY_KEY, False):
+        # on the DBAPI connection: the Connection is in the middle of its commit
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(_BUMP)
+        finally:
+            cursor.close()
+
+
+@event.listens_for(Engine, 'rollback')
+def _forget_catalogue_writes(conn: Connection) -> None:
+    conn.info.pop(_DIRTY_KEY, None)
@@ -0,0 +1,96 @@
+"""Serve the routers from the event loop on an ``AsyncSession``.
+
+The endpoints and ``crud`` are written against a plain ``Session``. In async
+mode each endpoint runs through ``AsyncSession.run_sync``: the same code
+executes in a greenlet whose database IO is awaited on the asyncio driver,
+so a request waiting for the database holds no threadpool worker. The
+response is validated inside that greenlet too, where lazy loads still work.
+"""
+import inspect
+from typing import Any, Awaitable, Callable
+
+from fastapi import APIRouter, Depends, Response, params
+from fastapi.routing import APIRoute
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.dependencies import get_async_db, get_db
+from app.metrics import serialization_timer
+
+
+def _call_endpoint(
+    db: Session, route: APIRoute, db_name: str, kwargs: dict[str, Any]
+) -> Any:
+    result = route.endpoint(**kwargs, **{db_name: db})
+    # like FastAPI, pass responses built by the endpoint through as they are
+    if route.response_field is None or isinstance(result, Response):
+        return result
+
+    with serialization_timer():
+        value, errors = route.response_field.validate(result, {}, loc=('response',))
+    if errors:
+        raise ValidationError(
+            errors if isinstance(errors, list) else [errors],  # type: ignore[arg-type]
+            route.response_field.type_,
+        )
+    return value
+
+
+def _is_db_dependency(parameter: inspect.Parameter) -> bool:
+    return (
+        isinstance(parameter.default, params.Depends)
+        and parameter.default.dependency is get_db
+    )
+
+
+def as_async_endpoint(route: APIRoute) -> Callable[..., Awaitable[Any]]:
+    signature = inspect.signature(route.endpoint)
+    db_name = next(
+        name
+        for name, parameter in signature.parameters.items()
+        if _is_db_dependency(parameter)
+    )
+
+    async def endpoint(**kwargs: Any) -> Any:
+        db: AsyncSession = kwargs.pop(db_name)
+        return await db.run_sync(_call_endpoint, route, db_name, kwargs)
+
+    # FastAPI reads the dependencies from the signature: same parameters,
+    # but the session comes from the async engine
+    endpoint.__signature__ = signature.replace(  # type: ignore[attr-defined]
+        parameters=[
+            parameter.replace(default=Depends(get_async_db), annotation=AsyncSession)
+            if _is_db_dependency(parameter)
+            else parameter
+            for parameter in signature.parameters.values()
+        ]
+    )
+    endpoint.__name__ = route.endpoint.__name__
+    endpoint.__doc__ = route.endpoint.__doc__
+    return endpoint
+
+
+def as_async_router(router: APIRouter) -> APIRouter:
+    async_router = APIRouter()
+    for route in router.routes:
+        assert isinstance(route, APIRoute)
+        async_router.add_api_route(
+            route.path,
+            as_async_endpoint(route),
+            response_model=route.response_model,
+            status_code=route.status_code,
+            tags=route.tags,
+            dependencies=route.dependencies,
+            summary=route.summary,
+            description=route.description,
+            response_description=route.response_description,
+            responses=route.responses,
+            deprecated=route.deprecated,
+            methods=route.methods,
+            operation_id=route.operation_id,
+            include_in_schema=route.include_in_schema,
+            response_class=route.response_class,
+            name=route.name,
+        )
+    return async_router
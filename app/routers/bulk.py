@@ -0,0 +1,67 @@
+import codecs
+from collections import defaultdict
+
+from fastapi import APIRouter, Depends, File, UploadFile
+from sqlalchemy.orm import Session
+
+from app.db import bulk_import, crud, models, schemas
+from app.db.schemas import HTTPError
+from app.dependencies import get_db
+from app.exceptions import NegativeStock, ProductNotFound, negative_stock
+
+router = APIRouter(
+    prefix='/products',
+    tags=['products'],
+)
+
+
+@router.post('/import', response_model=schemas.ImportReport)
+def import_products(
+    feed: UploadFile = File(..., description='NDJSON, or CSV if named *.csv'),
+    db: Session = Depends(get_db),
+) -> schemas.ImportReport:
+    is_csv = feed.content_type == 'text/csv' or (feed.filename or '').endswith('.csv')
+    read_rows = bulk_import.read_csv if is_csv else bulk_import.read_ndjson
+    # the upload is spooled to disk, rows are decoded and imported as they are read
+    lines = codecs.iterdecode(feed.file, 'utf-8', errors='replace')
+    return bulk_import.import_products(db, read_rows(lines))
+
+
+@router.patch(
+    '/inventory',
+    response_model=list[schemas.ProductInventory],
+    responses={
+        ProductNotFound.status_code: {
+            'model': HTTPError,
+            'description': ProductNotFound.detail,
+        },
+        NegativeStock.status_code: {
+            'model': HTTPError,
+            'description': NegativeStock.detail,
+        },
+    },
+)
+def adjust_inventory(
+    adjustments: list[schemas.InventoryAdjustment], db: Session = Depends(get_db)
+) -> list[models.ProductInventory]:
+    skus = {adjustment.sku for adjustment in adjustments if adjustment.sku is not None}
+    product_ids = crud.get_product_ids_by_sku(db, skus) if skus else {}
+    if len(product_ids) != len(skus):
+        raise ProductNotFound
+
+    deltas: dict[int, int] = defaultdict(int)
+    for adjustment in adjustments:
+        if adjustment.sku is not None:
+            deltas[product_ids[adjustment.sku]] += adjustment.delta
+        elif adjustment.product_id is not None:
+            deltas[adjustment.product_id] += adjustment.delta
+    if len(crud.lock_inventory(db, deltas)) != len(deltas):
+        raise ProductNotFound
+
+    # all or nothing: the whole batch is rolled back on error
+    inventory = crud.adjust_inventory(db, deltas)
+    if inventory is None:
+        # the quantities are read again as they were before the batch
+        db.rollback()
+        raise negative_stock(crud.get_short_stock(db, deltas))
+    return inventory
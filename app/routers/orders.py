@@ -1,16 +1,22 @@
-import random
+import hmac
+from typing import Optional
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Header, Response, status
 from sqlalchemy.orm import Session
 
+from app import idempotency, serializers
+from app.config import get_settings
 from app.db import crud, models, schemas
 from app.db.schemas import HTTPError
 from app.dependencies import get_db
 from app.exceptions import (
+    IdempotencyKeyReused,
     InsufficientStock,
     OrderAlreadyCompleted,
     OrderNotFound,
     OrderNotPaid,
+    PaymentAlreadyRecorded,
+    WrongPaymentSecret,
 )
 
 router = APIRouter(
@@ -19,65 +25,69 @@ router = APIRouter(
 )
 
 
-# So far dummy function that returns the payment status (80% - probability of success)
-def pay_order() -> bool:
-    if random.random() > 0.8:
-        return False
-    return True
-
-
 @router.post(
     '/',
     status_code=status.HTTP_200_OK,
-    response_model=schemas.Order,
+    response_model=schemas.CreatedOrder,
     responses={
         InsufficientStock.status_code: {
             'model': HTTPError,
             'description': InsufficientStock.detail,
         },
+        IdempotencyKeyReused.status_code: {
+            'model': HTTPError,
+            'description': IdempotencyKeyReused.detail,
+        },
     },
 )
-def create_order(order: schemas.Order, db: Session = Depends(get_db)) -> models.Order:
-    # check if there's already record about this user
-    db_user = crud.get_user_by_login(db=db, login=order.user.login)
-    if db_user:
-        db_user_info = schemas.User.from_orm(db_user)
-        # if the user has specified new info update it
-        if db_user_info != order.user.dict():
-            crud.update_user_information(
-                db=db, user_id=db_user.id, user_info=order.user
-            )
-    else:
-        # otherwise, just create a new record
-        db_user = crud.create_order_user(db=db, order_user=order.user)
-
-    # create shipping address
-    db_shipping_address = crud.create_shipping_address(
-        db=db, shipping_address=order.shipping_address
+def create_order(
+    order: schemas.Order,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: Session = Depends(get_db),
+) -> Response:
+    if idempotency_key is None:
+        return _create_order(db, order)
+    # retries (and concurrent duplicates) get the response of the first request
+    return idempotency.idempotent_response(
+        db, idempotency_key, order.json(), lambda: _create_order(db, order)
     )
 
-    # payment emulation
-    is_paid = pay_order()
 
-    # create order
+def _create_order(db: Session, order: schemas.Order) -> Response:
+    # new, returning and updated customers alike: one statement, written only
+    # if the details differ; user_id is the customer's id as a subquery
+    user_id = crud.upsert_order_user(db=db, order_user=order.user)
+
+    # addresses already shipped to are reused, the same way
+    shipping_address_id = crud.upsert_shipping_address(
+        db=db, shipping_address=order.shipping_address
+    )
+
+    # create order, the payment workers take it from here (app.payments)
     db_order = crud.create_order(
         db=db,
         total=order.total,
-        is_paid=is_paid,
-        user_id=db_user.id,
-        shipping_address_id=db_shipping_address.id,
+        user_id=user_id,
+        shipping_address_id=shipping_address_id,
     )
 
-    # add items in order (their ids are correct by default)
-    for item in order.items:
-        db_product = crud.get_product_by_id(db=db, product_id=item.product.id)
-        # check if there's enough items in stock
-        if db_product.product_inventory.quantity < item.quantity:  # type: ignore
-            raise InsufficientStock
-        db_product.decrease_quantity(item.quantity)  # type: ignore
-        crud.add_order_item(db=db, order_item=item, order_id=db_order.id)
-
-    return db_order
+    # take all the items out of stock at once (their ids are correct by default)
+    if not crud.reserve_order_items(db=db, order_id=db_order.id, items=order.items):
+        raise InsufficientStock
+
+    # the user, address and item rows now hold exactly the details of the
+    # request: answer from it rather than loading them (and a product per item)
+    return serializers.json_response(
+        schemas.CreatedOrder,
+        {
+            'id': db_order.id,
+            'payment_status': db_order.payment_status,
+            'total': db_order.total,
+            'user': order.user,
+            'shipping_address': order.shipping_address,
+            'items': order.items,
+        },
+    )
 
 
 @router.patch(
@@ -98,10 +108,8 @@ def create_order(order: schemas.Order, db: Session = Depends(get_db)) -> models.
         },
     },
 )
-def complete_order(
-    order_id: int, db: Session = Depends(get_db)
-) -> models.ProductInventory:
-    db_order = crud.get_order_by_id(db, order_id=order_id)
+def complete_order(order_id: int, db: Session = Depends(get_db)) -> Response:
+    db_order = crud.get_order_by_id(db, order_id=order_id, with_items=True)
     if not db_order:
         raise OrderNotFound
 
@@ -112,4 +120,64 @@ def complete_order(
         raise OrderNotPaid
 
     db_order.complete()
+    return serializers.json_response(schemas.ProcessedOrder, db_order)
+
+
+@router.get(
+    '/{order_id}/payment',
+    response_model=schemas.OrderPayment,
+    responses={
+        OrderNotFound.status_code: {
+            'model': HTTPError,
+            'description': OrderNotFound.detail,
+        },
+    },
+)
+def get_order_payment(order_id: int, db: Session = Depends(get_db)) -> models.Order:
+    db_order = crud.get_order_by_id(db, order_id=order_id)
+    if not db_order:
+        raise OrderNotFound
     return db_order
+
+
+@router.post(
+    '/{order_id}/payment',
+    response_model=schemas.OrderPayment,
+    responses={
+        WrongPaymentSecret.status_code: {
+            'model': HTTPError,
+            'description': WrongPaymentSecret.detail,
+        },
+        OrderNotFound.status_code: {
+            'model': HTTPError,
+            'description': OrderNotFound.detail,
+        },
+        PaymentAlreadyRecorded.status_code: {
+            'model': HTTPError,
+            'description': PaymentAlreadyRecorded.detail,
+        },
+    },
+)
+def notify_order_payment(
+    order_id: int,
+    notification: schemas.PaymentNotification,
+    x_payment_secret: str = Header(''),
+    db: Session = Depends(get_db),
+) -> schemas.OrderPayment:
+    """Webhook for the payment gateway."""
+    secret = get_settings().PAYMENT_WEBHOOK_SECRET
+    if not secret or not hmac.compare_digest(x_payment_secret, secret):
+        raise WrongPaymentSecret
+
+    if not crud.get_order_by_id(db, order_id=order_id):
+        raise OrderNotFound
+    if not crud.record_payment(db, order_id=order_id, paid=notification.paid):
+        raise PaymentAlreadyRecorded
+
+    return schemas.OrderPayment(
+        id=order_id,
+        payment_status=models.Order.PAID
+        if notification.paid
+        else models.Order.PAYMENT_FAILED,
+        is_paid=notification.paid,
+    )
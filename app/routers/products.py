@@ -1,23 +1,28 @@
-from typing import Any
+from typing import Any, Optional, cast
 
-from fastapi import APIRouter, Depends, status
-from fastapi_pagination import Page
-from fastapi_pagination.bases import AbstractPage
-from fastapi_pagination.ext.sqlalchemy import paginate
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from fastapi_pagination import Page, Params, resolve_params
+from fastapi_pagination.ext.sqlalchemy import paginate_query
+from sqlalchemy.engine import Row
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.db import crud, models, schemas
+from app import response_cache, serializers
+from app.db import crud, keyset, models, schemas
 from app.db.schemas import HTTPError
-from app.dependencies import get_db
+from app.dependencies import get_db, get_product_filters
 from app.exceptions import (
     CategoryAlreadyRegistered,
     CategoryNotFound,
     CharacteristicAlreadyRegistered,
     CharacteristicNotFound,
     DuplicateCharacteristic,
+    InvalidCursor,
+    InventoryNotFound,
+    NegativeStock,
     ProductAlreadyRegistered,
     ProductNotFound,
+    UnsortedSearchCursor,
     WrongPrice,
 )
 
@@ -98,7 +103,7 @@ def add_characteristic(
 )
 def add_product(
     product: schemas.ProductCreate, db: Session = Depends(get_db)
-) -> models.Product:
+) -> Optional[models.Product]:
     db_category = crud.get_product_category_by_id(
         db=db, category_id=product.category_id
     )
@@ -130,25 +135,83 @@ def add_product(
             db=db, characteristics=product.characteristics, product_id=db_product.id
         )
 
-    return db_product
+    # with its category and characteristics, rather than lazily one by one
+    return crud.get_product_by_id(db=db, product_id=db_product.id)
 
 
 def add_characteristics(
     db: Session, characteristics: list[schemas.ProductCharacteristic], product_id: int
 ) -> None:
-    for characteristic in characteristics:
-        characteristic_db = crud.get_characteristic_by_id(
-            db=db, characteristic_id=characteristic.characteristic_id
+    # one lookup and one insert for all of them, not a round trip per item
+    characteristic_ids = [
+        characteristic.characteristic_id for characteristic in characteristics
+    ]
+    known = crud.get_characteristics_by_ids(
+        db=db, characteristic_ids=characteristic_ids
+    )
+    if len(known) != len(set(characteristic_ids)):
+        raise CharacteristicNotFound
+    if len(set(characteristic_ids)) != len(characteristic_ids):
+        raise DuplicateCharacteristic
+
+    try:
+        crud.add_product_characteristics(
+            db=db, product_characteristics=characteristics, product_id=product_id
+        )
+    except IntegrityError as err:
+        raise DuplicateCharacteristic from err
+
+
+@router.get('/facets', response_model=schemas.Facets)
+def get_facets(db: Session = Depends(get_db)) -> dict[str, list[Row]]:
+    return {
+        'categories': crud.get_category_facets(db),
+        'characteristics': crud.get_characteristic_facets(db),
+    }
+
+
+@router.get(
+    '/cursor',
+    response_model=schemas.CursorPage[schemas.ProductExt],
+    responses={
+        InvalidCursor.status_code: {
+            'model': HTTPError,
+            'description': f'{InvalidCursor.detail}, or '
+            f'{UnsortedSearchCursor.detail.lower()}',
+        }
+    },
+)
+def get_products_by_cursor(
+    product_filters: schemas.ProductFilters = Depends(get_product_filters),
+    cursor: Optional[str] = None,
+    size: int = Query(50, ge=1, le=100),
+    include_total: bool = False,
+    db: Session = Depends(get_db),
+) -> Response:
+    if product_filters.by_relevance():
+        raise UnsortedSearchCursor
+    try:
+        items, next_cursor, previous_cursor = keyset.paginate(
+            crud.get_filtered_products_query(db, product_filters),
+            crud.get_product_sort_keys(product_filters),
+            size=size,
+            cursor=cursor,
         )
-        if not characteristic_db:
-            raise CharacteristicNotFound
+    except ValueError as err:
+        raise InvalidCursor from err
 
-        try:
-            crud.add_product_characteristic(
-                db=db, product_characteristic=characteristic, product_id=product_id
-            )
-        except IntegrityError as err:
-            raise DuplicateCharacteristic from err
+    return serializers.json_response(
+        schemas.CursorPage[schemas.ProductExt],
+        {
+            'items': items,
+            'size': size,
+            'next_cursor': next_cursor,
+            'previous_cursor': previous_cursor,
+            'total': crud.count_filtered_products(db, product_filters)
+            if include_total
+            else None,
+        },
+    )
 
 
 @router.get(
@@ -161,21 +224,48 @@ def add_characteristics(
         }
     },
 )
-def get_product(product_id: int, db: Session = Depends(get_db)) -> models.Product:
-    db_product = crud.get_product_by_id(db, product_id=product_id)
-    if not db_product:
-        raise ProductNotFound
-    return db_product
+def get_product(
+    product_id: int, request: Request, db: Session = Depends(get_db)
+) -> Response:
+    def build() -> models.Product:
+        db_product = crud.get_product_by_id(db, product_id=product_id)
+        if not db_product:
+            raise ProductNotFound
+        return db_product
+
+    return response_cache.cached_json_response(
+        request, db, request.url.path, schemas.ProductExt, build
+    )
 
 
-@router.get(  # pragma: no cover  Can't construct query object without db connection
+@router.get(
     '/',
     response_model=Page[schemas.ProductExt],
 )
 def get_products(
-    product_filters: schemas.ProductFilters = Depends(), db: Session = Depends(get_db)
-) -> AbstractPage[Any]:
-    return paginate(crud.get_filtered_products_query(db, product_filters))
+    request: Request,
+    product_filters: schemas.ProductFilters = Depends(get_product_filters),
+    db: Session = Depends(get_db),
+) -> Response:
+    params = cast(Params, resolve_params())
+
+    def build() -> dict[str, Any]:
+        # the page as a plain dict of ORM objects, rendered by the serializers
+        query = crud.get_filtered_products_query(db, product_filters)
+        return {
+            'items': paginate_query(query, params).all(),
+            'total': query.count(),
+            'page': params.page,
+            'size': params.size,
+        }
+
+    return response_cache.cached_json_response(
+        request,
+        db,
+        f'{request.url.path}?{product_filters.json()}&{params.json()}',
+        Page[schemas.ProductExt],
+        build,
+    )
 
 
 @router.patch(
@@ -184,15 +274,24 @@ def get_products(
     responses={
         ProductNotFound.status_code: {
             'model': HTTPError,
-            'description': ProductNotFound.detail,
-        }
+            'description': f'{ProductNotFound.detail}, or '
+            f'{InventoryNotFound.detail.lower()}',
+        },
+        NegativeStock.status_code: {
+            'model': HTTPError,
+            'description': NegativeStock.detail,
+        },
     },
 )
 def increase_product_quantity(
     product_id: int, inc_value: int, db: Session = Depends(get_db)
-) -> models.ProductInventory:
-    db_product = crud.get_product_by_id(db, product_id=product_id)
-    if not db_product:
-        raise ProductNotFound
-    db_product.increase_quantity(inc_value)
-    return db_product.product_inventory
+) -> Row:
+    inventory = crud.adjust_product_quantity(db, product_id=product_id, delta=inc_value)
+    if inventory is None:
+        # nothing matched: no product, no stock to adjust, or not enough of it
+        if not crud.get_product_by_id(db, product_id=product_id):
+            raise ProductNotFound
+        if not crud.lock_inventory(db, [product_id]):
+            raise InventoryNotFound
+        raise NegativeStock
+    return inventory
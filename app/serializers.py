@@ -0,0 +1,126 @@
+"""Fast JSON rendering of the hot responses.
+
+FastAPI validates what an endpoint returns against its response_model
+(``from_orm`` builds a model instance per object, field by field) and then
+walks the instances again with ``jsonable_encoder``. The serializers compiled
+here read the same attributes once, straight into dicts, which orjson encodes.
+The bytes are the same as the pydantic path produces (tests/test_serializers.py);
+values whose JSON would differ make ``render`` fall back to that path.
+"""
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+import orjson
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, parse_obj_as
+from pydantic.fields import SHAPE_LIST, SHAPE_SEQUENCE, SHAPE_SINGLETON, ModelField
+from pydantic.json import decimal_encoder
+from pydantic.utils import lenient_issubclass
+from pydantic.validators import decimal_validator
+
+from app.config import get_settings
+from app.metrics import serialization_timer
+
+Serializer = Callable[[Any], Any]
+
+
+class Incompatible(ValueError):
+    """The value would be rendered differently from the pydantic path."""
+
+
+def _decimal(value: Any) -> Any:
+    # the same conversions as pydantic's validation and jsonable_encoder (an int
+    # without fractional digits, a float otherwise); json and orjson only write
+    # floats differently in exponent notation (below 1e-4 or from 1e16 on)
+    if value is None:
+        raise Incompatible(value)
+    number = decimal_encoder(decimal_validator(value))
+    if isinstance(number, float) and number and not 1e-4 <= abs(number) < 1e16:
+        raise Incompatible(value)
+    return number
+
+
+def _scalar(value: Any) -> Any:
+    # None in a required field fails the pydantic validation, it must not be
+    # rendered as null (nullable fields don't get here with None)
+    if value is None:
+        raise Incompatible(value)
+    return value
+
+
+def _value_serializer(field: ModelField) -> Serializer:
+    if lenient_issubclass(field.type_, BaseModel):
+        return compile_serializer(field.type_)
+    if lenient_issubclass(field.type_, Decimal):
+        return _decimal
+    if lenient_issubclass(field.type_, (str, int)):
+        return _scalar
+    raise TypeError(f'No fast serializer for {field.type_!r} ({field.name})')
+
+
+def _field_serializer(field: ModelField) -> Serializer:
+    serialize_value = _value_serializer(field)
+    if field.shape == SHAPE_SINGLETON:
+        serialize = serialize_value
+    elif field.shape in (SHAPE_LIST, SHAPE_SEQUENCE):
+
+        def serialize(values: Any) -> Any:
+            return [serialize_value(value) for value in values]
+
+    else:
+        raise TypeError(f'No fast serializer for {field.outer_type_!r} ({field.name})')
+
+    if not field.allow_none:
+        return serialize
+    return lambda value: None if value is None else serialize(value)
+
+
+@lru_cache()
+def compile_serializer(model: type[BaseModel]) -> Serializer:
+    """Serializer of ORM objects (or dicts) into what the model would dump."""
+    fields = [
+        (field.alias, field.default, _field_serializer(field))
+        for field in model.__fields__.values()
+    ]
+
+    def serialize(obj: Any) -> dict[str, Any]:
+        if obj is None:
+            # not an object of nulls: the pydantic path rejects it
+            raise Incompatible(model)
+        if isinstance(obj, dict):
+            return {
+                name: serialize_field(obj.get(name, default))
+                for name, default, serialize_field in fields
+            }
+        return {
+            name: serialize_field(getattr(obj, name, default))
+            for name, default, serialize_field in fields
+        }
+
+    return serialize
+
+
+def render(response_model: Any, content: Any) -> bytes:
+    """JSON of ``content`` as FastAPI would return it for ``response_model``."""
+    with serialization_timer():
+        if get_settings().FAST_SERIALIZATION:
+            try:
+                return orjson.dumps(compile_serializer(response_model)(content))
+            except Incompatible:
+                pass
+        return JSONResponse(
+            jsonable_encoder(parse_obj_as(response_model, content))
+        ).body
+
+
+def json_response(
+    response_model: Any, content: Any, headers: Optional[dict[str, str]] = None
+) -> Response:
+    return Response(
+        render(response_model, content),
+        media_type='application/json',
+        headers=headers or {},
+    )
@@ -0,0 +1,52 @@
+"""GET /api/products/{id} throughput: engine per request vs. process-wide engine.
+
+    python -m benchmarks.bench_engine [--requests N]
+"""
+import argparse
+from typing import Generator
+
+from benchmarks.common import requests_per_second, seed_catalogue, temporary_database
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import get_settings
+from app.db.database import create_db_engine
+from app.dependencies import get_db
+from app.main import app
+
+
+def get_db_engine_per_request() -> Generator[Session, None, None]:
+    # what get_db used to do: a brand-new engine (and pool) for every request
+    engine = create_db_engine(get_settings())
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield db
+        db.commit()
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    with temporary_database():
+        seed_catalogue(products=100)
+        client = TestClient(app)
+
+        def call() -> None:
+            assert client.get('/api/products/42').status_code == 200
+
+        app.dependency_overrides[get_db] = get_db_engine_per_request
+        before = requests_per_second(call, args.requests)
+        app.dependency_overrides.clear()
+        after = requests_per_second(call, args.requests)
+
+    print(f'engine per request:    {before:8.1f} req/s')
+    print(f'process-wide engine:   {after:8.1f} req/s')
+
+
+if __name__ == '__main__':
+    main()
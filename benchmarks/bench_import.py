@@ -0,0 +1,74 @@
+"""Bulk import throughput: the NDJSON importer vs. POST /api/products/ per row.
+
+    python -m benchmarks.bench_import [--products 50000] [--single 500]
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import product_name, temporary_database
+from fastapi.testclient import TestClient
+
+from app.db import bulk_import, models
+from app.db.database import get_session
+from app.main import app
+
+
+def feed(first: int, count: int) -> list[str]:
+    return [
+        json.dumps(
+            {
+                'name': product_name(i),
+                'sku': f'SKU{i:08d}',
+                'description': 'Прыгай как Тайсон!',
+                'price': 100 + i % 5000,
+                'category_id': i % 10 + 1,
+                'characteristics': [
+                    {'characteristic_id': 1, 'characteristic_value': f'{i % 4 + 2} м.'},
+                    {'characteristic_id': 2, 'characteristic_value': 'Синий'},
+                ],
+            }
+        )
+        for i in range(first, first + count)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=50_000)
+    parser.add_argument('--single', type=int, default=500)
+    args = parser.parse_args()
+
+    with temporary_database():
+        session_local = get_session()
+        with session_local() as db, db.begin():
+            db.add_all(
+                models.ProductCategory(id=i, name=f'Категория {i}', description='')
+                for i in range(1, 11)
+            )
+            db.add_all(
+                [
+                    models.Characteristic(id=1, name='Длина троса'),
+                    models.Characteristic(id=2, name='Цвет'),
+                ]
+            )
+
+        lines = feed(1, args.products)
+        start = time.perf_counter()
+        with session_local() as db, db.begin():
+            report = bulk_import.import_products(db, bulk_import.read_ndjson(lines))
+        elapsed = time.perf_counter() - start
+        assert report.imported == args.products, report.errors[:5]
+        print(f'bulk import:     {args.products / elapsed:10.0f} products/s')
+
+        client = TestClient(app)
+        lines = feed(args.products + 1, args.single)
+        start = time.perf_counter()
+        for line in lines:
+            client.post('/api/products/', data=line).raise_for_status()
+        elapsed = time.perf_counter() - start
+        print(f'one by one:      {args.single / elapsed:10.0f} products/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Concurrent stock increments: ORM read-modify-write vs. one atomic UPDATE.
+
+    python -m benchmarks.bench_increments [--threads 8] [--increments 500]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from benchmarks.common import seed_catalogue, temporary_database
+from sqlalchemy.orm import Session
+
+from app.db import crud, models
+from app.db.database import get_session
+
+
+def read_modify_write(db: Session, product_id: int) -> None:
+    # what PATCH /api/products/{id}/inventory used to do
+    product = crud.get_product_by_id(db, product_id=product_id)
+    product.product_inventory.quantity += 1
+
+
+def atomic_update(db: Session, product_id: int) -> None:
+    crud.adjust_product_quantity(db, product_id=product_id, delta=1)
+
+
+def run(
+    increment: Callable[[Session, int], None], threads: int, increments: int
+) -> tuple[float, int]:
+    session_local = get_session()
+
+    def worker(_: int) -> None:
+        for _ in range(increments):
+            with session_local() as db, db.begin():
+                increment(db, 1)
+
+    with session_local() as db:
+        before = db.get(models.ProductInventory, 1).quantity
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(worker, range(threads)))
+    elapsed = time.perf_counter() - start
+    with session_local() as db:
+        after = db.get(models.ProductInventory, 1).quantity
+    return threads * increments / elapsed, threads * increments - (after - before)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--increments', type=int, default=500)
+    args = parser.parse_args()
+
+    with temporary_database():
+        seed_catalogue(products=1000)
+        for name, increment in (
+            ('read-modify-write', read_modify_write),
+            ('atomic UPDATE', atomic_update),
+        ):
+            rate, lost = run(increment, args.threads, args.increments)
+            print(f'{name:18} {rate:8.0f} increments/s, {lost} lost updates')
+
+
+if __name__ == '__main__':
+    main()
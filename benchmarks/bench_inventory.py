@@ -0,0 +1,43 @@
+"""Warehouse sync: one batch PATCH /api/products/inventory vs. a PATCH per product.
+
+    python -m benchmarks.bench_inventory [--products 10000] [--single 500]
+"""
+import argparse
+import time
+
+from benchmarks.common import seed_catalogue, temporary_database
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--single', type=int, default=500)
+    args = parser.parse_args()
+
+    with temporary_database():
+        seed_catalogue(products=args.products)
+        client = TestClient(app)
+
+        adjustments = [
+            {'sku': f'SKU{i:08d}', 'delta': i % 7 - 3}
+            for i in range(1, args.products + 1)
+        ]
+        start = time.perf_counter()
+        client.patch('/api/products/inventory', json=adjustments).raise_for_status()
+        elapsed = time.perf_counter() - start
+        print(f'batch:      {args.products / elapsed:10.0f} products/s')
+
+        start = time.perf_counter()
+        for i in range(1, args.single + 1):
+            client.patch(
+                f'/api/products/{i}/inventory', params={'inc_value': 1}
+            ).raise_for_status()
+        elapsed = time.perf_counter() - start
+        print(f'one by one: {args.single / elapsed:10.0f} products/s')
+
+
+if __name__ == '__main__':
+    main()
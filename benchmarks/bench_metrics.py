@@ -0,0 +1,52 @@
+"""Overhead of the request metrics: the same load with METRICS_ENABLED off and on.
+
+    python -m benchmarks.bench_metrics [--clients 10] [--duration 10] [--rounds 2]
+"""
+import argparse
+import asyncio
+import json
+
+from benchmarks.common import seed_catalogue, temporary_database
+from benchmarks.http_client import run_load
+from benchmarks.loadtest_async import HOST, free_port, start_server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--rounds', type=int, default=2)
+    parser.add_argument('--products', type=int, default=10_000)
+    args = parser.parse_args()
+
+    def request(number: int) -> tuple[str, str, bytes]:
+        if number % 2:
+            return 'GET', f'/api/products/{number % args.products + 1}', b''
+        return 'GET', f'/api/products/?page={number % 50 + 1}&size=20', b''
+
+    rps: dict[str, list[float]] = {'off': [], 'on': []}
+    with temporary_database():
+        seed_catalogue(products=args.products)
+        # alternate the modes, so that drift affects both the same way
+        for _ in range(args.rounds):
+            for mode, enabled in (('off', 'false'), ('on', 'true')):
+                port = free_port()
+                server = start_server(
+                    port,
+                    {'METRICS_ENABLED': enabled, 'RESPONSE_CACHE_TTL': '0'},
+                )
+                try:
+                    result = asyncio.run(
+                        run_load(HOST, port, args.clients, args.duration, request)
+                    )
+                finally:
+                    server.terminate()
+                    server.wait()
+                rps[mode].append(result['rps'])
+
+    off, on = max(rps['off']), max(rps['on'])
+    print(json.dumps({**rps, 'overhead_percent': (off - on) / off * 100}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Order creation under different payment gateway latencies.
+
+The payment is taken by the background workers, so POST /api/orders/ should
+keep the same throughput whatever the gateway latency:
+
+    python -m benchmarks.bench_orders [--latencies 0 0.5 2] [--clients 4]
+"""
+import argparse
+import asyncio
+import json
+
+import sqlalchemy as sa
+from benchmarks.common import seed_catalogue, temporary_database
+from benchmarks.http_client import run_load
+from benchmarks.loadtest_async import HOST, free_port, start_server
+
+from app.db import models
+from app.db.database import get_engine
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latencies', type=float, nargs='+', default=[0, 0.5, 2])
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--products', type=int, default=10_000)
+    args = parser.parse_args()
+
+    def create_order(number: int) -> tuple[str, str, bytes]:
+        order = {
+            'total': '1399.00',
+            'user': {
+                'login': f'customer{number % 1000}@example.com',
+                'first_name': 'Иван',
+                'last_name': 'Иванов',
+            },
+            'shipping_address': {
+                'country': 'Россия',
+                'city': 'Москва',
+                'postcode': '119991',
+                'address': f'Улица {number % 1000}',
+            },
+            'items': [
+                {
+                    'product': {'id': number % args.products + 1},
+                    'quantity': 1,
+                    'price_per_item': 1399,
+                }
+            ],
+        }
+        return 'POST', '/api/orders/', json.dumps(order).encode()
+
+    results = {}
+    for latency in args.latencies:
+        with temporary_database():
+            seed_catalogue(products=args.products)
+            port = free_port()
+            server = start_server(port, {'PAYMENT_GATEWAY_LATENCY': str(latency)})
+            try:
+                result = asyncio.run(
+                    run_load(HOST, port, args.clients, args.duration, create_order)
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            with get_engine().connect() as connection:
+                result['paid_or_failed'] = connection.execute(
+                    sa.select(sa.func.count()).where(
+                        models.Order.payment_status != models.Order.PENDING_PAYMENT
+                    )
+                ).scalar_one()
+            results[f'gateway latency {latency}s'] = result
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Product name/search filter latency: LIKE '%x%' scan vs. the full-text index.
+
+    python -m benchmarks.bench_search [--products 1000000] [--repeat 20]
+"""
+import argparse
+import statistics
+import time
+from typing import Callable
+
+from benchmarks.common import seed_catalogue, temporary_database
+
+from app.db import crud, models, schemas
+from app.db.database import get_session
+
+# a rare model code, a medium and a common combination of words
+QUERIES = ['ixgnv', 'Профессиональная подшипник', 'скакалка синий']
+
+
+def median_ms(call: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args()
+
+    with temporary_database():
+        start = time.perf_counter()
+        seed_catalogue(products=args.products)
+        print(f'seeded {args.products} products in {time.perf_counter() - start:.1f}s')
+
+        db = get_session()()
+        for text in QUERIES:
+            like = (
+                db.query(models.Product)
+                .filter(*(models.Product.name.contains(term) for term in text.split()))
+                .order_by(models.Product.id)
+            )
+            indexed = crud.get_filtered_products_query(
+                db, schemas.ProductFilters(search=text)
+            )
+            # the offset listing also counts all the matches
+            print(
+                f'{text!r:30} LIKE scan: page {median_ms(like.limit(args.page_size).all, args.repeat):8.2f} ms,'
+                f' count {median_ms(like.count, args.repeat):8.2f} ms   '
+                f'full-text: page {median_ms(indexed.limit(args.page_size).all, args.repeat):8.2f} ms,'
+                f' count {median_ms(indexed.count, args.repeat):8.2f} ms'
+            )
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Rendering a page of products: pydantic validation + jsonable_encoder vs. orjson.
+
+    python -m benchmarks.bench_serialization [--size 100] [--repeat 200]
+"""
+import argparse
+import time
+
+from benchmarks.common import seed_catalogue, temporary_database
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi_pagination import Page
+from pydantic import parse_obj_as
+
+from app import serializers
+from app.db import models, schemas
+from app.db.database import get_session
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with temporary_database():
+        seed_catalogue(products=args.size)
+        db = get_session()()
+        products = db.query(models.Product).limit(args.size).all()
+        page = {'items': products, 'total': args.size, 'page': 1, 'size': args.size}
+        model = Page[schemas.ProductExt]
+        # load the relationships once, both paths then only read attributes
+        assert (
+            serializers.render(model, page)
+            == JSONResponse(jsonable_encoder(parse_obj_as(model, page))).body
+        )
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            JSONResponse(jsonable_encoder(parse_obj_as(model, page))).body
+        elapsed = time.perf_counter() - start
+        print(f'pydantic: {elapsed / args.repeat * 1000:8.2f} ms/page')
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            serializers.render(model, page)
+        elapsed = time.perf_counter() - start
+        print(f'fast:     {elapsed / args.repeat * 1000:8.2f} ms/page')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
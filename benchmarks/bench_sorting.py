@@ -0,0 +1,90 @@
+"""Sorted listings: the sort indexes vs. sorting the matches at query time.
+
+Times the first page, a page deep in the listing (from a keyset cursor) and a
+page of a price range, for every sort, then again without the sort indexes:
+
+    python -m benchmarks.bench_sorting [--products 1000000] [--repeat 20]
+"""
+import argparse
+import time
+
+from benchmarks.bench_search import median_ms
+from benchmarks.common import seed_catalogue, temporary_database
+from sqlalchemy.orm import Session
+
+from app.db import crud, keyset, models, schemas
+from app.db.database import get_session
+
+# the indexes which serve the sorts, besides the primary key
+SORT_INDEXES = [
+    index for index in models.Product.__table__.indexes if index.name != 'ix_product_id'
+]
+
+
+def page_timings(db: Session, args: argparse.Namespace) -> dict[str, list[float]]:
+    timings = {}
+    for sort in schemas.ProductSort:
+        product_filters = schemas.ProductFilters(sort=sort)
+        keys = crud.get_product_sort_keys(product_filters)
+        query = crud.get_filtered_products_query(db, product_filters)
+        # the cursor of the row in the middle of the listing
+        middle = query.offset(args.products // 2).first()
+        cursor = keyset.encode_cursor(
+            [getattr(middle, column.key) for column, _ in keys], backwards=False
+        )
+        in_range = crud.get_filtered_products_query(
+            db, schemas.ProductFilters(sort=sort, min_price=1000, max_price=1100)
+        )
+        timings[sort.value] = [
+            median_ms(
+                lambda query=query: keyset.paginate(query, keys, args.page_size),
+                args.repeat,
+            ),
+            median_ms(
+                lambda query=query, cursor=cursor: keyset.paginate(
+                    query, keys, args.page_size, cursor
+                ),
+                args.repeat,
+            ),
+            median_ms(
+                lambda in_range=in_range: keyset.paginate(
+                    in_range, keys, args.page_size
+                ),
+                args.repeat,
+            ),
+        ]
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args()
+
+    with temporary_database():
+        start = time.perf_counter()
+        seed_catalogue(products=args.products)
+        print(f'seeded {args.products} products in {time.perf_counter() - start:.1f}s')
+
+        db = get_session()()
+        indexed = page_timings(db, args)
+        for index in SORT_INDEXES:
+            index.drop(db.connection())
+        db.commit()
+        unindexed = page_timings(db, args)
+        db.close()
+
+    print(f'{"sort":16} {"first page":>24} {"deep page":>24} {"price range":>24}')
+    print(f'{"":16}' + f'{"indexes":>13} {"none":>10}' * 3)
+    for sort, timings in indexed.items():
+        columns = ''.join(
+            f'{with_index:10.2f} ms {without_index:7.2f} ms'
+            for with_index, without_index in zip(timings, unindexed[sort])
+        )
+        print(f'{sort:16}{columns}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Concurrent order creation on SQLite: its defaults vs. the tuned profile.
+
+Half of the clients create orders, the others read products, first with
+SQLite's own settings (rollback journal, synchronous FULL, one pool for
+reads and writes), then with the profile of app.db.pragmas:
+
+    python -m benchmarks.bench_sqlite [--clients 50] [--duration 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+from benchmarks.common import seed_catalogue, temporary_database
+from benchmarks.http_client import Connection, run_workload
+from benchmarks.loadtest_async import HOST, free_port, start_server
+
+from app.config import get_settings
+
+PROFILES = {
+    # what SQLite and the sqlite3 module (5 s timeout) do out of the box
+    'sqlite defaults': {
+        'SQLITE_JOURNAL_MODE': 'delete',
+        'SQLITE_SYNCHRONOUS': 'full',
+        'SQLITE_BUSY_TIMEOUT': '5000',
+        'SQLITE_CACHE_SIZE': '-2000',
+        'SQLITE_MMAP_SIZE': '0',
+        'SQLITE_TEMP_STORE': 'default',
+        'SQLITE_SERIALIZE_WRITES': 'false',
+    },
+    'tuned': {},
+}
+
+
+@contextmanager
+def environment(variables: dict[str, str]) -> Iterator[None]:
+    # the journal mode sticks to the database file: seed it with the profile too
+    os.environ.update(variables)
+    get_settings.cache_clear()
+    try:
+        yield
+    finally:
+        for name in variables:
+            del os.environ[name]
+        get_settings.cache_clear()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--products', type=int, default=10_000)
+    args = parser.parse_args()
+
+    def make_request(number: int) -> tuple[str, str, str, bytes]:
+        product_id = number % args.products + 1
+        if number % 2:
+            return 'detail', 'GET', f'/api/products/{product_id}', b''
+        order = {
+            'total': '1399.00',
+            'user': {
+                'login': f'customer{number % 1000}@example.com',
+                'first_name': 'Иван',
+                'last_name': 'Иванов',
+            },
+            'shipping_address': {
+                'country': 'Россия',
+                'city': 'Москва',
+                'postcode': '119991',
+                'address': f'Улица {number % 1000}',
+            },
+            'items': [
+                {'product': {'id': product_id}, 'quantity': 1, 'price_per_item': 1399}
+            ],
+        }
+        return 'create_order', 'POST', '/api/orders/', json.dumps(order).encode()
+
+    results = {}
+    for name, variables in PROFILES.items():
+        with environment(variables), temporary_database():
+            seed_catalogue(products=args.products)
+            port = free_port()
+            server = start_server(
+                port, {'PAYMENT_WORKERS': '0', 'RESPONSE_CACHE_TTL': '0'}
+            )
+            try:
+                results[name] = asyncio.run(
+                    run_workload(
+                        lambda: Connection(HOST, port),
+                        args.clients,
+                        args.duration,
+                        make_request,
+                    )
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
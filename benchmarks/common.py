@@ -0,0 +1,196 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Iterator
+
+from app.config import get_settings
+from app.db import facets, models, search
+from app.db.database import dispose_engine, get_engine
+
+
+@contextmanager
+def temporary_database() -> Iterator[str]:
+    """Point the application settings to a fresh sqlite file for the duration."""
+    db_fd, db_file = tempfile.mkstemp(suffix='.db')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_file}'
+    get_settings.cache_clear()
+    models.Base.metadata.create_all(bind=get_engine())
+    try:
+        yield db_file
+    finally:
+        dispose_engine()
+        get_settings.cache_clear()
+        del os.environ['SQLALCHEMY_DATABASE_URI']
+        os.close(db_fd)
+        os.unlink(db_file)
+
+
+ADJECTIVES = ['Скоростная', 'Бисерная', 'Кожаная', 'Детская', 'Профессиональная']
+NOUNS = ['скакалка', 'ручка', 'трос', 'коврик', 'сумка', 'подшипник', 'массажёр']
+COLOURS = ['красный', 'синий', 'зелёный', 'чёрный', 'белый']
+BATCH_SIZE = 10_000
+
+
+def product_code(i: int) -> str:
+    # a unique, evenly spread five-letter "model" code (7919 is coprime with 26)
+    code = i * 7919 % 26**5
+    letters = []
+    for _ in range(5):
+        code, letter = divmod(code, 26)
+        letters.append(chr(ord('a') + letter))
+    return ''.join(letters)
+
+
+def product_name(i: int) -> str:
+    return (
+        f'{ADJECTIVES[i % len(ADJECTIVES)]} {NOUNS[i // 7 % len(NOUNS)]} '
+        f'{COLOURS[i // 49 % len(COLOURS)]} {product_code(i)}'
+    )
+
+
+def characteristic_value(i: int, characteristic: int) -> str:
+    # a digit of i in base 5 per characteristic: every value has a fifth of
+    # the products, whatever the values of the other characteristics
+    return COLOURS[i // len(COLOURS) ** (characteristic - 1) % len(COLOURS)]
+
+
+def seed_catalogue(
+    products: int, categories: int = 10, characteristics: int = 0
+) -> None:
+    """Bulk-load a synthetic catalogue, index it for search, count its facets.
+
+    Every product gets a value for each of the ``characteristics``.
+    """
+    engine = get_engine()
+    with engine.begin() as connection:
+        connection.execute(
+            models.ProductCategory.__table__.insert(),
+            [
+                {'id': i, 'name': f'Категория {i}', 'description': 'Описание'}
+                for i in range(1, categories + 1)
+            ],
+        )
+        if characteristics:
+            connection.execute(
+                models.Characteristic.__table__.insert(),
+                [
+                    {'id': i, 'name': f'Характеристика {i}'}
+                    for i in range(1, characteristics + 1)
+                ],
+            )
+        for start in range(1, products + 1, BATCH_SIZE):
+            ids = range(start, min(start + BATCH_SIZE, products + 1))
+            connection.execute(
+                models.Product.__table__.insert(),
+                [
+                    {
+                        'id': i,
+                        'name': product_name(i),
+                        'sku': f'SKU{i:08d}',
+                        'description': 'Прыгай как Тайсон!',
+                        'price': Decimal(100 + i % 5000),
+                        'category_id': i % categories + 1,
+                    }
+                    for i in ids
+                ],
+            )
+            connection.execute(
+                models.ProductInventory.__table__.insert(),
+                [{'product_id': i, 'quantity': 100} for i in ids],
+            )
+            if characteristics:
+                connection.execute(
+                    models.ProductCharacteristic.__table__.insert(),
+                    [
+                        {
+                            'product_id': i,
+                            'characteristic_id': c,
+                            'characteristic_value': characteristic_value(i, c),
+                        }
+                        for i in ids
+                        for c in range(1, characteristics + 1)
+                    ],
+                )
+        search.get_backend(connection.dialect).reindex_all(connection)
+        facets.reconcile(connection)
+
+
+def seed_orders(orders: int, users: int, products: int, items: int = 3) -> None:
+    """Bulk-load customers and paid, not yet processed, orders of ``items``
+    products each, ids from 1: ready to be completed."""
+    engine = get_engine()
+    with engine.begin() as connection:
+        connection.execute(
+            models.User.__table__.insert(),
+            [
+                {
+                    'id': i,
+                    'login': f'customer{i}@example.com',
+                    'first_name': 'Иван',
+                    'last_name': 'Иванов',
+                }
+                for i in range(1, users + 1)
+            ],
+        )
+        addresses = [
+            {
+                'id': i,
+                'country': 'Россия',
+                'city': 'Москва',
+                'postcode': '119991',
+                'address': f'Улица {i}',
+                'apartment': None,
+            }
+            for i in range(1, users + 1)
+        ]
+        connection.execute(
+            models.ShippingAddress.__table__.insert(),
+            [
+                {
+                    **address,
+                    'content_hash': models.ShippingAddress.content_hash_of(address),
+                }
+                for address in addresses
+            ],
+        )
+        for start in range(1, orders + 1, BATCH_SIZE):
+            ids = range(start, min(start + BATCH_SIZE, orders + 1))
+            connection.execute(
+                models.Order.__table__.insert(),
+                [
+                    {
+                        'id': i,
+                        'creation_date': datetime.now(),
+                        'total': Decimal(items * 1000),
+                        'is_paid': True,
+                        'is_processed': False,
+                        'payment_status': models.Order.PAID,
+                        'user_id': i % users + 1,
+                        'shipping_address_id': i % users + 1,
+                    }
+                    for i in ids
+                ],
+            )
+            connection.execute(
+                models.OrderItems.__table__.insert(),
+                [
+                    {
+                        'order_id': i,
+                        'product_id': (i * items + item) % products + 1,
+                        'quantity': 1,
+                        'price_per_item': Decimal(1000),
+                    }
+                    for i in ids
+                    for item in range(items)
+                ],
+            )
+
+
+def requests_per_second(call: Callable[[], object], requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        call()
+    return requests / (time.perf_counter() - start)
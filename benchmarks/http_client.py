@@ -0,0 +1,195 @@
+"""Minimal keep-alive HTTP/1.1 load generator on asyncio streams.
+
+The same load can also be sent to an ASGI app in the same process, which
+leaves the HTTP server (and the parsing) out of the measure.
+"""
+import asyncio
+import statistics
+import time
+from typing import Any, Callable, Optional, Protocol
+from urllib.parse import urlsplit
+
+from starlette.types import ASGIApp, Message
+
+
+class Connection:
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(
+        self, method: str, path: str, body: bytes = b''
+    ) -> tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        assert self.reader is not None
+        head = (
+            f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'
+        )
+        self.writer.write(head.encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode().partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        return int(status_line.split()[1]), await self.reader.readexactly(length)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ASGIConnection:
+    """Same interface as ``Connection``, calling the app directly."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def request(
+        self, method: str, path: str, body: bytes = b''
+    ) -> tuple[int, bytes]:
+        url = urlsplit(path)
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': url.path,
+            'raw_path': url.path.encode(),
+            'query_string': url.query.encode(),
+            'root_path': '',
+            'headers': [
+                (b'host', b'benchmark'),
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('benchmark', 80),
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        status = 500
+        chunks = []
+
+        async def receive() -> Message:
+            return messages.pop() if messages else {'type': 'http.disconnect'}
+
+        async def send(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+
+        await self.app(scope, receive, send)
+        return status, b''.join(chunks)
+
+    def close(self) -> None:
+        pass
+
+
+class AnyConnection(Protocol):
+    async def request(
+        self, method: str, path: str, body: bytes = b''
+    ) -> tuple[int, bytes]:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+RequestFactory = Callable[[int], tuple[str, str, bytes]]
+# the same, with the name the request is reported under first
+NamedRequestFactory = Callable[[int], tuple[str, str, str, bytes]]
+
+
+def summarize(latencies: list[float], errors: int, duration: float) -> dict[str, Any]:
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    latencies = sorted(latencies)
+    quantiles = (
+        statistics.quantiles(latencies, n=100, method='inclusive')
+        if len(latencies) > 1
+        else []
+    )
+
+    def percentile(number: int) -> float:
+        return (quantiles[number - 1] if quantiles else latencies[0]) * 1000
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / duration,
+        'p50_ms': percentile(50),
+        'p90_ms': percentile(90),
+        'p99_ms': percentile(99),
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+async def run_workload(
+    connect: Callable[[], AnyConnection],
+    clients: int,
+    duration: float,
+    make_request: NamedRequestFactory,
+) -> dict[str, dict[str, Any]]:
+    """Keep ``clients`` connections busy for ``duration`` seconds.
+
+    Returns the stats of all the requests (under 'total') and by name.
+    """
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    deadline = time.perf_counter() + duration
+
+    async def client(number: int) -> None:
+        connection = connect()
+        sent = 0
+        name = 'connection'
+        try:
+            while time.perf_counter() < deadline:
+                name, method, path, body = make_request(number * 1_000_003 + sent)
+                sent += 1
+                start = time.perf_counter()
+                status, _ = await connection.request(method, path, body)
+                latencies.setdefault(name, []).append(time.perf_counter() - start)
+                errors[name] = errors.get(name, 0) + (status >= 400)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            errors[name] = errors.get(name, 0) + 1
+        finally:
+            connection.close()
+
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    stats = {
+        'total': summarize(
+            [latency for values in latencies.values() for latency in values],
+            sum(errors.values()),
+            duration,
+        )
+    }
+    for name in sorted(errors):
+        stats[name] = summarize(latencies.get(name, []), errors[name], duration)
+    return stats
+
+
+async def run_load(
+    host: str, port: int, clients: int, duration: float, make_request: RequestFactory
+) -> dict[str, Any]:
+    """Keep ``clients`` connections to the server busy for ``duration`` seconds."""
+    stats = await run_workload(
+        lambda: Connection(host, port),
+        clients,
+        duration,
+        lambda number: ('total', *make_request(number)),
+    )
+    return stats['total']
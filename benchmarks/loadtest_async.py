@@ -0,0 +1,86 @@
+"""p99 latency of the sync (threadpool) and async (event loop) database modes.
+
+Starts the app under uvicorn once per mode and keeps 500 concurrent clients
+busy with GET /api/products/{id}:
+
+    python -m benchmarks.loadtest_async [--clients 500] [--duration 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.common import seed_catalogue, temporary_database
+from benchmarks.http_client import run_load
+
+HOST = '127.0.0.1'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_listening(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('uvicorn did not start')
+
+
+def start_server(port: int, env: dict[str, str]) -> subprocess.Popen:  # type: ignore[type-arg]
+    server = subprocess.Popen(  # pylint: disable=consider-using-with
+        [
+            sys.executable,
+            '-m',
+            'uvicorn',
+            'app.main:app',
+            f'--host={HOST}',
+            f'--port={port}',
+            '--log-level=warning',
+            '--backlog=4096',
+        ],
+        env={**os.environ, **env},
+    )
+    wait_until_listening(port)
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--products', type=int, default=10_000)
+    args = parser.parse_args()
+
+    def product_detail(number: int) -> tuple[str, str, bytes]:
+        return 'GET', f'/api/products/{number % args.products + 1}', b''
+
+    results = {}
+    with temporary_database():
+        seed_catalogue(products=args.products)
+        for mode, is_async in (('sync', 'false'), ('async', 'true')):
+            port = free_port()
+            server = start_server(port, {'SQLALCHEMY_ASYNC': is_async})
+            try:
+                results[mode] = asyncio.run(
+                    run_load(HOST, port, args.clients, args.duration, product_detail)
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""Throughput and latency of the API under a mixed workload.
+
+Seeds a synthetic store, then keeps ``--clients`` clients busy with product
+listings (with filters), product details, order creations and completions and
+inventory patches, both in-process (ASGI calls, no HTTP server) and over
+uvicorn. Prints the stats, overall and per request kind, as JSON:
+
+    python -m benchmarks.suite [--modes in_process uvicorn] [--duration 10]
+        [--output results.json] [--baseline previous-results.json]
+
+With ``--baseline`` the results of another commit are compared in
+``changes`` (percents). ``make bench`` runs it with the defaults.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import subprocess
+from typing import Any, Callable, Optional
+from urllib.parse import urlencode
+
+from benchmarks.common import seed_catalogue, seed_orders, temporary_database
+from benchmarks.http_client import ASGIConnection, Connection, run_workload
+from benchmarks.loadtest_async import HOST, free_port, start_server
+
+# request kind: weight
+WORKLOAD = {
+    'listing': 35,
+    'detail': 35,
+    'create_order': 10,
+    'complete_order': 10,
+    'inventory': 10,
+}
+MODES = ('in_process', 'uvicorn')
+# the payments are left out: the workers would compete for the database
+SERVER_ENV = {'PAYMENT_WORKERS': '0'}
+
+
+def make_workload(
+    args: argparse.Namespace,
+) -> Callable[[int], tuple[str, str, str, bytes]]:
+    kinds, weights = zip(*WORKLOAD.items())
+    # every seeded order is completed once
+    orders_to_complete = itertools.count(1)
+
+    def listing(rng: random.Random) -> str:
+        params: dict[str, Any] = {'page': rng.randint(1, 50), 'size': 20}
+        filters = rng.randrange(4)
+        if filters == 1:
+            category = rng.randint(1, args.categories)
+            params['filter_by_category_name'] = f'Категория {category}'
+        elif filters == 2:
+            params['sort_by_price'] = 'true'
+        elif filters == 3:
+            params['search'] = rng.choice(['скакалка', 'синий', 'Кожаная'])
+        return f'/api/products/?{urlencode(params)}'
+
+    def order(rng: random.Random) -> bytes:
+        customer = rng.randint(1, args.users)
+        return json.dumps(
+            {
+                'total': '2798.00',
+                'user': {
+                    'login': f'customer{customer}@example.com',
+                    'first_name': 'Иван',
+                    'last_name': 'Иванов',
+                },
+                'shipping_address': {
+                    'country': 'Россия',
+                    'city': 'Москва',
+                    'postcode': '119991',
+                    'address': f'Улица {customer}',
+                },
+                'items': [
+                    {
+                        'product': {'id': rng.randint(1, args.products)},
+                        'quantity': 1,
+                        'price_per_item': 1399,
+                    }
+                    for _ in range(2)
+                ],
+            }
+        ).encode()
+
+    def make_request(number: int) -> tuple[str, str, str, bytes]:
+        rng = random.Random(number)
+        kind = rng.choices(kinds, weights)[0]
+        product_id = rng.randint(1, args.products)
+        if kind == 'listing':
+            return kind, 'GET', listing(rng), b''
+        if kind == 'detail':
+            return kind, 'GET', f'/api/products/{product_id}', b''
+        if kind == 'create_order':
+            return kind, 'POST', '/api/orders/', order(rng)
+        if kind == 'complete_order':
+            return kind, 'PATCH', f'/api/orders/{next(orders_to_complete)}', b''
+        return kind, 'PATCH', f'/api/products/{product_id}/inventory?inc_value=1', b''
+
+    return make_request
+
+
+def run_mode(mode: str, args: argparse.Namespace) -> dict[str, Any]:
+    # each mode gets the same fresh store
+    with temporary_database():
+        seed_catalogue(
+            products=args.products,
+            categories=args.categories,
+            characteristics=args.characteristics,
+        )
+        seed_orders(orders=args.orders, users=args.users, products=args.products)
+
+        if mode == 'in_process':
+            from app.main import app  # pylint: disable=import-outside-toplevel
+
+            return asyncio.run(
+                run_workload(
+                    lambda: ASGIConnection(app),
+                    args.clients,
+                    args.duration,
+                    make_workload(args),
+                )
+            )
+
+        port = free_port()
+        server = start_server(port, SERVER_ENV)
+        try:
+            return asyncio.run(
+                run_workload(
+                    lambda: Connection(HOST, port),
+                    args.clients,
+                    args.duration,
+                    make_workload(args),
+                )
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def compare(
+    results: dict[str, Any], baseline: dict[str, Any]
+) -> dict[str, dict[str, dict[str, float]]]:
+    """Change (percent) of the throughput and latencies since the baseline."""
+    changes: dict[str, dict[str, dict[str, float]]] = {}
+    for mode in MODES:
+        for kind, stats in results.get(mode, {}).items():
+            previous = baseline.get(mode, {}).get(kind, {})
+            changes.setdefault(mode, {})[kind] = {
+                metric: (stats[metric] - previous[metric]) / previous[metric] * 100
+                for metric in ('rps', 'p50_ms', 'p99_ms')
+                if stats.get(metric) and previous.get(metric)
+            }
+    return changes
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--characteristics', type=int, default=3)
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--orders', type=int, default=20_000)
+    parser.add_argument('--output', help='also write the results to this file')
+    parser.add_argument('--baseline', help='results of an earlier run to compare')
+    args = parser.parse_args()
+
+    results: dict[str, Any] = {
+        'commit': current_commit(),
+        'parameters': {
+            name: value
+            for name, value in vars(args).items()
+            if name not in ('output', 'baseline')
+        },
+    }
+    for mode in args.modes:
+        results[mode] = run_mode(mode, args)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline:
+            results['changes'] = compare(results, json.load(baseline))
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
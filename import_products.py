@@ -0,0 +1,35 @@
+import argparse
+import sys
+
+from app.db.bulk_import import CHUNK_SIZE, READERS, import_products
+from app.db.database import get_session
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Import products from a feed.')
+    parser.add_argument('feed', help='NDJSON or CSV file, "-" for stdin')
+    parser.add_argument(
+        '--format',
+        choices=READERS,
+        help='feed format (default: csv for *.csv files, ndjson otherwise)',
+    )
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    feed_format = args.format or ('csv' if args.feed.endswith('.csv') else 'ndjson')
+    path = sys.stdin.fileno() if args.feed == '-' else args.feed
+    session_local = get_session()
+    with open(path, encoding='utf-8', errors='replace', newline='') as feed:
+        with session_local() as db, db.begin():
+            report = import_products(
+                db, READERS[feed_format](feed), chunk_size=args.chunk_size
+            )
+
+    for error in report.errors:
+        print(f'line {error.row}: {error.error}', file=sys.stderr)
+    print(f'Imported {report.imported} products, {len(report.errors)} rows rejected')
+    return 1 if report.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,7 +2,8 @@ from app.db.init_db import init_db
 
 
 def main() -> None:
-    init_db()
+    for description in init_db():
+        print(f'Applied migration: {description}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,24 @@
+# pylint: disable=W0621
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy.engine import Engine
+
+from app.db.debug import StatementCounter
+
+# more runs of one statement shape than this within a block is an N+1
+N_PLUS_ONE_THRESHOLD = 3
+
+
+@pytest.fixture()
+def n_plus_one():
+    """Fails the test if a ``with n_plus_one():`` block, on any engine, runs a
+    statement shape more than ``N_PLUS_ONE_THRESHOLD`` times."""
+
+    @contextmanager
+    def detect(threshold=N_PLUS_ONE_THRESHOLD):
+        with StatementCounter(Engine) as counter:
+            yield counter
+        counter.check_n_plus_one(threshold)
+
+    return detect
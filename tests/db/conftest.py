@@ -9,7 +9,7 @@ import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-from app.db import models
+from app.db import characteristic_index, crud, models
 
 
 def get_engine(db_file):
@@ -36,6 +36,14 @@ def create_session(engine):
         session.close()
 
 
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    yield
+    crud.product_count_cache.clear()
+    crud.reference_cache.clear()
+    characteristic_index.index.clear()
+
+
 @pytest.fixture()
 def _init_db():
     db_fd, db_file = tempfile.mkstemp()
@@ -128,6 +136,33 @@ def products(db_session):
     db_session.commit()
 
 
+@pytest.fixture()
+def products_characteristics(products, db_session):  # pylint: disable=unused-argument
+    db_session.add(models.Characteristic(id=1, name='Длина троса'))
+    db_session.add(models.Characteristic(id=2, name='Цвет'))
+    for product_id in (1, 2, 3):
+        db_session.add(
+            models.ProductCharacteristic(
+                product_id=product_id, characteristic_id=1, characteristic_value='3 м.'
+            )
+        )
+        db_session.add(
+            models.ProductCharacteristic(
+                product_id=product_id, characteristic_id=2, characteristic_value='Синий'
+            )
+        )
+    db_session.commit()
+
+
+@pytest.fixture()
+def products_inventory(products, db_session):  # pylint: disable=unused-argument
+    for product_id, quantity in ((1, 5), (2, 1), (3, 0)):
+        db_session.add(
+            models.ProductInventory(product_id=product_id, quantity=quantity)
+        )
+    db_session.commit()
+
+
 @pytest.fixture()
 def user(db_session):
     user = models.User(
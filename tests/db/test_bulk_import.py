@@ -0,0 +1,132 @@
+import json
+
+import pytest
+
+from app.db import bulk_import, crud, models, schemas
+from app.exceptions import (
+    CategoryNotFound,
+    CharacteristicNotFound,
+    DuplicateCharacteristic,
+    ProductAlreadyRegistered,
+    WrongPrice,
+)
+
+
+def feed_line(sku, **fields):
+    return json.dumps(
+        {
+            'name': f'Скакалка {sku}',
+            'sku': sku,
+            'description': 'Прыгай как Тайсон!',
+            'price': 1399.0,
+            'category_id': 1,
+            **fields,
+        }
+    )
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_import_products(db_session):
+    lines = [
+        feed_line(
+            'NEW001',
+            characteristics=[
+                {'characteristic_id': 1, 'characteristic_value': '2.5 м.'},
+                {'characteristic_id': 2, 'characteristic_value': 'Красный'},
+            ],
+        ),
+        feed_line('NEW002', category_id=2),
+        '',
+        feed_line('NEW003', name='Бирюзовая скакалка'),
+    ]
+
+    report = bulk_import.import_products(
+        db_session, bulk_import.read_ndjson(lines), chunk_size=2
+    )
+
+    assert report == schemas.ImportReport(imported=3, errors=[])
+    product = crud.get_product_by_sku(db_session, 'NEW001')
+    assert product is not None
+    assert product.product_inventory.quantity == 0
+    assert {
+        (value.characteristic.name, value.characteristic_value)
+        for value in product.characteristics
+    } == {('Длина троса', '2.5 м.'), ('Цвет', 'Красный')}
+    # bulk inserts are indexed for search as well
+    found = crud.get_filtered_products_query(
+        db_session, schemas.ProductFilters(search='бирюзовая')
+    ).all()
+    assert [product.sku for product in found] == ['NEW003']
+    # and counted in the facets
+    db_session.commit()
+    assert [tuple(facet) for facet in crud.get_category_facets(db_session)] == [
+        (2, 'Массажёры', 2),
+        (1, 'Скакалки', 4),
+    ]
+    assert (1, 'Длина троса', '2.5 м.', 1) in crud.get_characteristic_facets(db_session)
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_import_products_reports_rejected_rows(db_session):
+    lines = [
+        feed_line('NEW001'),
+        feed_line('ABC123'),
+        feed_line('NEW001'),
+        feed_line('NEW002', category_id=42),
+        feed_line(
+            'NEW003',
+            characteristics=[{'characteristic_id': 42, 'characteristic_value': '1'}],
+        ),
+        feed_line(
+            'NEW004',
+            characteristics=[
+                {'characteristic_id': 1, 'characteristic_value': '1 м.'},
+                {'characteristic_id': 1, 'characteristic_value': '2 м.'},
+            ],
+        ),
+        feed_line('NEW005', price=0),
+        feed_line('NEW006', price='дорого'),
+        '{"sku": ',
+        feed_line('NEW007'),
+        b'{"sku": "NEW008", "name": "\xd1\xea\xe0\xea\xe0\xeb\xea\xe0"}'.decode(
+            'utf-8', errors='replace'
+        ),
+    ]
+
+    report = bulk_import.import_products(
+        db_session, bulk_import.read_ndjson(lines), chunk_size=3
+    )
+
+    assert report.imported == 2
+    assert [(error.row, error.error) for error in report.errors[:7]] == [
+        (2, ProductAlreadyRegistered.detail),
+        (3, ProductAlreadyRegistered.detail),
+        (4, CategoryNotFound.detail),
+        (5, CharacteristicNotFound.detail),
+        (6, DuplicateCharacteristic.detail),
+        (7, WrongPrice.detail),
+        (8, 'price: value is not a valid decimal'),
+    ]
+    assert report.errors[7].row == 9
+    assert report.errors[7].error.startswith('invalid JSON')
+    assert (report.errors[8].row, report.errors[8].error) == (11, 'invalid UTF-8')
+    skus = {sku for (sku,) in db_session.query(models.Product.sku)}
+    assert skus == {'ABC123', 'DCE123', 'FOSAF1', 'NEW001', 'NEW007'}
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_import_products_from_csv(db_session):
+    lines = [
+        'sku,name,description,price,category_id,characteristic_1,characteristic_2\r\n',
+        'NEW001,Скакалка,"Прыгай, как Тайсон!",999.5,1,3 м.,\r\n',
+        'NEW002,Скакалка,Прыгай,-1,1,,\r\n',
+    ]
+
+    report = bulk_import.import_products(db_session, bulk_import.read_csv(lines))
+
+    assert report.imported == 1
+    assert report.errors == [schemas.ImportRowError(row=3, error=WrongPrice.detail)]
+    product = crud.get_product_by_sku(db_session, 'NEW001')
+    assert product is not None
+    assert product.description == 'Прыгай, как Тайсон!'
+    assert [value.characteristic_value for value in product.characteristics] == ['3 м.']
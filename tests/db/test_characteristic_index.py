@@ -0,0 +1,189 @@
+# pylint: disable=protected-access
+import time
+from array import array
+
+import pytest
+import sqlalchemy as sa
+
+from app.db import characteristic_index, crud, models, schemas
+from app.db.debug import StatementCounter
+
+
+def _filtered(db_session, *characteristic_filters):
+    query = crud.get_filtered_products_query(
+        db_session,
+        schemas.ProductFilters(filter_by_characteristic=list(characteristic_filters)),
+    )
+    return sorted(product.id for product in query)
+
+
+def _matching(db_session, **characteristic_values):
+    bitmap = characteristic_index.index.match(
+        db_session,
+        {
+            int(characteristic_id[1:]): values
+            for characteristic_id, values in characteristic_values.items()
+        },
+    )
+    return characteristic_index.ids_of(bitmap)
+
+
+@pytest.mark.parametrize(
+    'ids, form',
+    [([], array), ([0], int), ([1, 2, 3], int), ([7, 8, 63, 64, 1000], array)],
+)
+def test_postings(ids, form):
+    postings = characteristic_index._postings_of(ids)
+
+    assert isinstance(postings, form)
+    assert characteristic_index.ids_of(postings) == ids
+    assert characteristic_index.count(postings) == len(ids)
+    assert characteristic_index.ids_of(characteristic_index._bitmap_of(ids)) == ids
+
+
+def test_sparse_and_dense_values():
+    index = characteristic_index.CharacteristicIndex(ttl=60)
+    index._postings = {}
+    index._loaded_at = time.monotonic()
+    index.apply(
+        [
+            (1000, (1, 'a'), True),
+            (1, (2, 'b'), True),
+            (1000, (2, 'b'), True),
+            (1000, (2, 'c'), True),
+            (2000, (2, 'c'), True),
+        ]
+    )
+    assert isinstance(index._postings[(1, 'a')], array)
+    assert isinstance(index._postings[(2, 'b')], int)
+
+    def matching(characteristic_values):
+        return characteristic_index.ids_of(index.match(None, characteristic_values))
+
+    assert matching({1: ['a'], 2: ['b']}) == [1000]
+    assert matching({2: ['b'], 1: ['a', 'x']}) == [1000]
+    assert matching({2: ['b', 'c']}) == [1, 1000, 2000]
+    assert matching({2: ['c'], 1: ['a']}) == [1000]
+    assert matching({1: ['a'], 2: ['x']}) == []
+
+    # a sparse value turns into a bitmap once it's common
+    index.apply([(product_id, (1, 'a'), True) for product_id in range(100)])
+    assert isinstance(index._postings[(1, 'a')], int)
+    index.apply([(1000, (1, 'a'), False), (2000, (2, 'c'), False)])
+    assert matching({1: ['a'], 2: ['b', 'c']}) == [1]
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_index_follows_commits(db_session):
+    assert _matching(db_session, c2=['Синий']) == [1, 2, 3]
+
+    value = (
+        db_session.query(models.ProductCharacteristic)
+        .filter_by(product_id=2, characteristic_id=2)
+        .one()
+    )
+    value.characteristic_value = 'Красный'
+    db_session.delete(
+        db_session.query(models.ProductCharacteristic)
+        .filter_by(product_id=3, characteristic_id=1)
+        .one()
+    )
+    db_session.add(models.Characteristic(id=3, name='Материал'))
+    db_session.flush()
+    crud.add_product_characteristics(
+        db_session,
+        [
+            schemas.ProductCharacteristic(
+                characteristic_id=3, characteristic_value='ПВХ'
+            )
+        ],
+        product_id=1,
+    )
+    db_session.commit()
+
+    # from the index as it was loaded, updated in place
+    with StatementCounter(db_session.get_bind()) as counter:
+        assert _matching(db_session, c2=['Синий']) == [1, 3]
+        assert _matching(db_session, c2=['Синий', 'Красный']) == [1, 2, 3]
+        assert _matching(db_session, c1=['3 м.'], c3=['ПВХ']) == [1]
+        assert _matching(db_session, c1=['3 м.'], c2=['Синий']) == [1]
+    assert counter.count == 0
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_index_ignores_rolled_back_changes(db_session):
+    assert _matching(db_session, c1=['3 м.']) == [1, 2, 3]
+
+    db_session.execute(sa.delete(models.ProductCharacteristic))
+    crud.add_product_characteristics(
+        db_session,
+        [
+            schemas.ProductCharacteristic(
+                characteristic_id=1, characteristic_value='5 м.'
+            )
+        ],
+        product_id=1,
+    )
+    db_session.rollback()
+
+    assert _matching(db_session, c1=['3 м.']) == [1, 2, 3]
+    assert _matching(db_session, c1=['5 м.']) == []
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_index_is_reloaded(db_session, monkeypatch):
+    assert _matching(db_session, c1=['3 м.']) == [1, 2, 3]
+    # written by another process
+    db_session.execute(
+        sa.delete(models.ProductCharacteristic).where(
+            models.ProductCharacteristic.product_id == 1
+        )
+    )
+    monkeypatch.setattr(characteristic_index.index, 'ttl', 0)
+
+    assert _matching(db_session, c1=['3 м.']) == [2, 3]
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_filter_by_characteristic(db_session):
+    value = (
+        db_session.query(models.ProductCharacteristic)
+        .filter_by(product_id=2, characteristic_id=2)
+        .one()
+    )
+    value.characteristic_value = 'Красный'
+    db_session.commit()
+
+    assert _filtered(db_session, '2:Синий') == [1, 3]
+    # any of the values of a characteristic, all the characteristics
+    assert _filtered(db_session, '2:Синий', '2:Красный') == [1, 2, 3]
+    assert _filtered(db_session, '1:3 м.', '2:Красный') == [2]
+    assert _filtered(db_session, '1:3 м.', '2:Зелёный') == []
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_filter_by_characteristic_without_products(db_session):
+    filters = crud.get_characteristic_filters(db_session, {2: ['Зелёный']})
+
+    # the index answers, the products aren't queried
+    assert [str(expression) for expression in filters] == ['false']
+
+
+def test_characteristic_filters_validation():
+    filters = schemas.ProductFilters(filter_by_characteristic=['2:b', '1:a:b', '2:b'])
+
+    assert filters.filter_by_characteristic == ['1:a:b', '2:b']
+    assert filters.characteristic_values() == {1: ['a:b'], 2: ['b']}
+    with pytest.raises(ValueError):
+        schemas.ProductFilters(filter_by_characteristic=['blue'])
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_filter_by_many_characteristics(db_session, monkeypatch):
+    monkeypatch.setattr('app.db.crud.listing.INDEXED_IDS_LIMIT', 1)
+
+    filters = crud.get_characteristic_filters(db_session, {1: ['3 м.'], 2: ['Синий']})
+
+    # too many products for an id list: the database checks the values
+    assert all('product_characteristic' in str(expression) for expression in filters)
+    assert _filtered(db_session, '1:3 м.', '2:Синий') == [1, 2, 3]
@@ -0,0 +1,67 @@
+# pylint: disable=W0621
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine
+
+from app.db import crud, models
+
+from .conftest import create_session
+
+THREADS = 8
+INCREMENTS = 25
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    engine = create_engine(
+        f'sqlite:///{tmp_path / "test.db"}',
+        connect_args={'check_same_thread': False, 'timeout': 30},
+    )
+    models.Base.metadata.create_all(bind=engine)
+    with create_session(engine) as db:
+        db.add(models.ProductCategory(id=1, name='Скакалки', description=''))
+        db.add(
+            models.Product(
+                id=1, name='Скакалка', sku='ABC123', description='', price=1399.00
+            )
+        )
+        db.add(models.ProductInventory(product_id=1, quantity=100))
+    yield engine
+    engine.dispose()
+
+
+def run_in_threads(engine, change_quantity):
+    def worker(number):
+        for _ in range(INCREMENTS):
+            with create_session(engine) as db:
+                change_quantity(db, 1 if number % 2 else 2)
+
+    with ThreadPoolExecutor(THREADS) as executor:
+        list(executor.map(worker, range(THREADS)))
+
+    with create_session(engine) as db:
+        return db.get(models.ProductInventory, 1).quantity
+
+
+def expected_quantity():
+    return 100 + INCREMENTS * sum(1 if number % 2 else 2 for number in range(THREADS))
+
+
+def test_concurrent_adjust_product_quantity(engine):
+    quantity = run_in_threads(
+        engine,
+        lambda db, delta: crud.adjust_product_quantity(db, product_id=1, delta=delta),
+    )
+
+    assert quantity == expected_quantity()
+
+
+def test_concurrent_increase_quantity(engine):
+    # the ORM method reads the row first, but only writes the increment
+    quantity = run_in_threads(
+        engine,
+        lambda db, delta: db.get(models.Product, 1).increase_quantity(delta),
+    )
+
+    assert quantity == expected_quantity()
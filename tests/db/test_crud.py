@@ -1,9 +1,12 @@
 # pylint: disable=too-many-lines
+from datetime import datetime, timedelta
 from decimal import Decimal
 
 import pytest
+import sqlalchemy as sa
 
 from app.db import crud, models, schemas
+from app.db.debug import StatementCounter
 
 
 # Product stuff
@@ -33,6 +36,36 @@ def test_get_unknown_product_category_by_id(db_session):
     assert product_category is None
 
 
+@pytest.mark.usefixtures('product_category')
+def test_get_product_category_by_id_cached(db_session):
+    crud.get_product_category_by_id(db_session, category_id=1)
+    db_session.expunge_all()
+    hits = crud.reference_cache.stats()['hits']
+
+    with StatementCounter(db_session.get_bind()) as counter:
+        product_category = crud.get_product_category_by_id(db_session, category_id=1)
+
+    assert counter.count == 0
+    assert product_category is not None
+    assert product_category in db_session
+    assert product_category.name == 'Скакалки'
+    assert crud.reference_cache.stats()['hits'] == hits + 1
+
+
+@pytest.mark.usefixtures('product_category')
+def test_product_category_cache_invalidation(db_session):
+    product_category = crud.get_product_category_by_id(db_session, category_id=1)
+    assert product_category is not None
+    product_category.name = 'Скакалки и ручки'
+    db_session.commit()
+    crud.invalidate_reference(product_category)
+    db_session.expunge_all()
+
+    product_category = crud.get_product_category_by_id(db_session, category_id=1)
+    assert product_category is not None
+    assert product_category.name == 'Скакалки и ручки'
+
+
 def test_create_product_category(db_session):
     product_category_schema = schemas.ProductCategoryCreate(
         name='Скакалки', description='Самые лучшие скакалки'
@@ -75,6 +108,34 @@ def test_get_unknown_characteristic_by_id(db_session):
     assert characteristic is None
 
 
+@pytest.mark.usefixtures('characteristic')
+def test_get_characteristic_by_id_cached(db_session):
+    crud.get_characteristic_by_id(db_session, characteristic_id=1)
+    db_session.expunge_all()
+
+    with StatementCounter(db_session.get_bind()) as counter:
+        characteristic = crud.get_characteristic_by_id(db_session, characteristic_id=1)
+
+    assert counter.count == 0
+    assert characteristic is not None
+    assert characteristic.name == 'Длина троса'
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_get_characteristics_by_ids(db_session):
+    crud.get_characteristic_by_id(db_session, characteristic_id=1)
+
+    with StatementCounter(db_session.get_bind()) as counter:
+        characteristics = crud.get_characteristics_by_ids(db_session, [1, 2, 2, 200])
+
+    # the cached one is not queried, the others are queried at once
+    assert counter.count == 1
+    assert {key: value.name for key, value in characteristics.items()} == {
+        1: 'Длина троса',
+        2: 'Цвет',
+    }
+
+
 def test_create_characteristic(db_session):
     characteristic_schema = schemas.CharacteristicCreate(name='Цвет ручек')
     crud.create_characteristic(db_session, characteristic_schema)
@@ -198,8 +259,97 @@ def test_get_filtered_products_query_price(
     assert product_list[0].name == first_product_name
 
 
+@pytest.mark.parametrize(
+    ('sort', 'product_ids'),
+    [
+        (schemas.ProductSort.OLDEST, [1, 2, 3]),
+        (schemas.ProductSort.NEWEST, [3, 2, 1]),
+        (schemas.ProductSort.CHEAPEST, [3, 1, 2]),
+        (schemas.ProductSort.MOST_EXPENSIVE, [2, 1, 3]),
+        (schemas.ProductSort.NAME, [3, 2, 1]),
+        (schemas.ProductSort.NAME_DESC, [1, 2, 3]),
+        (schemas.ProductSort.CATEGORY_CHEAPEST, [1, 2, 3]),
+        (schemas.ProductSort.CATEGORY_NAME, [2, 1, 3]),
+    ],
+)
+@pytest.mark.usefixtures('products')
+def test_get_filtered_products_query_sort(db_session, sort, product_ids):
+    product_filters = schemas.ProductFilters(sort=sort)
+    query = crud.get_filtered_products_query(db_session, product_filters)
+
+    assert [product.id for product in query] == product_ids
+
+
+@pytest.mark.parametrize(
+    ('min_price', 'max_price', 'product_ids'),
+    [
+        (1000, None, [1, 2]),
+        (None, 1100, [1, 3]),
+        (1000, 1100, [1]),
+        (1100, 1000, []),
+    ],
+)
+@pytest.mark.usefixtures('products')
+def test_get_filtered_products_query_price_range(
+    db_session, min_price, max_price, product_ids
+):
+    product_filters = schemas.ProductFilters(min_price=min_price, max_price=max_price)
+    query = crud.get_filtered_products_query(db_session, product_filters)
+
+    assert [product.id for product in query] == product_ids
+
+
+@pytest.mark.usefixtures('products')
+def test_add_product_characteristics(db_session, n_plus_one):
+    for characteristic_id in range(1, 6):
+        db_session.add(
+            models.Characteristic(id=characteristic_id, name=f'{characteristic_id}')
+        )
+    db_session.flush()
+
+    with n_plus_one() as counter:
+        crud.add_product_characteristics(
+            db_session,
+            [
+                schemas.ProductCharacteristic(
+                    characteristic_id=characteristic_id, characteristic_value='1'
+                )
+                for characteristic_id in range(1, 6)
+            ],
+            product_id=1,
+        )
+
+    assert counter.count == 1
+    assert len(db_session.get(models.Product, 1).characteristics) == 5
+
+
+@pytest.mark.parametrize('page_size', [1, 3])
+@pytest.mark.usefixtures('products_characteristics')
+def test_get_filtered_products_query_statements(db_session, page_size):
+    query = crud.get_filtered_products_query(db_session, schemas.ProductFilters())
+
+    with StatementCounter(db_session.get_bind()) as counter:
+        page = [
+            schemas.ProductExt.from_orm(product) for product in query.limit(page_size)
+        ]
+
+    assert len(page) == page_size
+    assert all(len(product.characteristics or ()) == 2 for product in page)
+    # products with their categories + characteristics with their names
+    assert counter.count == 2
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_get_product_by_id_statements(db_session):
+    with StatementCounter(db_session.get_bind()) as counter:
+        product = schemas.ProductExt.from_orm(crud.get_product_by_id(db_session, 1))
+
+    assert product.category and product.category.name == 'Скакалки'
+    assert counter.count == 2
+
+
 # Order stuff
-def test_create_order_user(db_session):
+def test_upsert_order_user_creates_user(db_session):
     user_schema = schemas.User(
         login='qwertyqwerty@rambler.ru',
         first_name='Иван',
@@ -207,7 +357,7 @@ def test_create_order_user(db_session):
         last_name='Иванов',
         telephone_number='8 (800) 555-35-35',
     )
-    crud.create_order_user(db_session, user_schema)
+    user_id = crud.upsert_order_user(db_session, user_schema)
 
     created_user = (
         db_session.query(models.User)
@@ -216,7 +366,38 @@ def test_create_order_user(db_session):
     )
 
     assert created_user is not None
-    assert created_user.id == 1
+    assert created_user.is_registered is False
+    assert db_session.scalar(sa.select(user_id)) == created_user.id
+
+
+@pytest.mark.usefixtures('user')
+def test_upsert_order_user_updates_details(db_session):
+    new_user_info = schemas.User(
+        login='qwertyqwerty@rambler.ru',
+        first_name='Иван',
+        second_name=None,
+        last_name='Иванов',
+        telephone_number='8 (800) 555-36-36',
+    )
+    user_id = crud.upsert_order_user(db=db_session, order_user=new_user_info)
+
+    assert db_session.scalar(sa.select(user_id)) == 1
+    updated_user = db_session.query(models.User).populate_existing().get(1)
+    assert updated_user.second_name is None
+    assert updated_user.telephone_number == '8 (800) 555-36-36'
+    assert db_session.query(models.User).count() == 1
+
+
+@pytest.mark.usefixtures('user')
+def test_upsert_order_user_unchanged(db_session):
+    user_info = schemas.User.from_orm(db_session.query(models.User).get(1))
+
+    with StatementCounter(db_session.get_bind()) as counter:
+        crud.upsert_order_user(db=db_session, order_user=user_info)
+    changes = db_session.connection().exec_driver_sql('SELECT changes()').scalar()
+
+    assert counter.count == 1
+    assert changes == 0
 
 
 @pytest.mark.usefixtures('user')
@@ -231,7 +412,7 @@ def test_get_unknown_user_by_login(db_session):
     assert user is None
 
 
-def test_create_shipping_address(db_session):
+def test_upsert_shipping_address(db_session):
     shipping_address_schema = schemas.ShippingAddress(
         country='Россия',
         city='Тверь',
@@ -239,7 +420,7 @@ def test_create_shipping_address(db_session):
         address='Мой адрес',
         apartment='кв. 10',
     )
-    crud.create_shipping_address(db_session, shipping_address_schema)
+    address_id = crud.upsert_shipping_address(db_session, shipping_address_schema)
 
     created_address = (
         db_session.query(models.ShippingAddress)
@@ -249,6 +430,25 @@ def test_create_shipping_address(db_session):
 
     assert created_address is not None
     assert created_address.postcode == '171390'
+    assert db_session.scalar(sa.select(address_id)) == 1
+
+
+@pytest.mark.usefixtures('shipping_address')
+def test_upsert_known_shipping_address(db_session):
+    shipping_address_schema = schemas.ShippingAddress(
+        country='Россия',
+        city=' Москва',
+        postcode='119991',
+        address='Мой   адрес',
+        apartment='кв. 1',
+    )
+
+    with StatementCounter(db_session.get_bind()) as counter:
+        address_id = crud.upsert_shipping_address(db_session, shipping_address_schema)
+
+    assert counter.count == 1
+    assert db_session.scalar(sa.select(address_id)) == 1
+    assert db_session.query(models.ShippingAddress).count() == 1
 
 
 @pytest.mark.usefixtures('user', 'shipping_address')
@@ -256,7 +456,6 @@ def test_create_order(db_session):
     crud.create_order(
         db=db_session,
         total=Decimal('1999.00'),
-        is_paid=False,
         user_id=1,
         shipping_address_id=1,
     )
@@ -265,6 +464,8 @@ def test_create_order(db_session):
 
     assert created_order is not None
     assert created_order.total == Decimal('1999.00')
+    assert created_order.is_paid is False
+    assert created_order.payment_status == models.Order.PENDING_PAYMENT
     assert created_order.user.login == 'qwertyqwerty@rambler.ru'
     assert created_order.shipping_address.country == 'Россия'
 
@@ -286,21 +487,125 @@ def test_add_order_item(db_session):
     assert created_order_item.quantity == 7
 
 
-@pytest.mark.usefixtures('user')
-def test_update_user_information(db_session):
-    new_user_info = schemas.User(
-        login='newemail@rambler.ru',
-        first_name='Иван',
-        second_name='Иваныч',
-        last_name='Иванов',
-        telephone_number='8 (800) 555-36-36',
+def _order_items(*quantities):
+    return [
+        schemas.OrderItems(
+            product=schemas.Item(id=product_id),
+            quantity=quantity,
+            price_per_item=Decimal('1000.00'),
+        )
+        for product_id, quantity in quantities
+    ]
+
+
+def _stock(db_session):
+    return dict(
+        db_session.query(
+            models.ProductInventory.product_id, models.ProductInventory.quantity
+        ).all()
     )
-    crud.update_user_information(db=db_session, user_id=1, user_info=new_user_info)
 
-    updated_user = db_session.query(models.User).filter(models.User.id == 1).first()
-    assert updated_user is not None
-    assert updated_user.login == 'newemail@rambler.ru'
-    assert updated_user.telephone_number == '8 (800) 555-36-36'
+
+@pytest.mark.usefixtures('products_inventory')
+def test_reserve_order_items(db_session):
+    items = _order_items((1, 2), (2, 1), (1, 3))
+
+    assert crud.reserve_order_items(db_session, order_id=1, items=items)
+
+    assert _stock(db_session) == {1: 0, 2: 0, 3: 0}
+    order_items = db_session.query(models.OrderItems).all()
+    assert [(item.product_id, item.quantity) for item in order_items] == [
+        (1, 2),
+        (2, 1),
+        (1, 3),
+    ]
+
+
+@pytest.mark.parametrize(
+    'quantities',
+    [((1, 1), (2, 2)), ((1, 1), (100, 1)), ((1, 3), (1, 3))],
+    ids=['insufficient_stock', 'unknown_product', 'same_product_twice'],
+)
+@pytest.mark.usefixtures('products_inventory')
+def test_reserve_order_items_failed(db_session, quantities):
+    assert not crud.reserve_order_items(
+        db_session, order_id=1, items=_order_items(*quantities)
+    )
+    assert db_session.query(models.OrderItems).count() == 0
+
+
+@pytest.mark.usefixtures('products_inventory')
+def test_get_product_ids_by_sku(db_session):
+    assert crud.get_product_ids_by_sku(db_session, ['FOSAF1', 'ABC123', 'XXX']) == {
+        'ABC123': 1,
+        'FOSAF1': 3,
+    }
+
+
+@pytest.mark.usefixtures('products_inventory')
+def test_lock_inventory(db_session):
+    assert crud.lock_inventory(db_session, {3: 1, 1: 1, 42: 1}) == [1, 3]
+
+
+@pytest.mark.usefixtures('products_inventory')
+def test_adjust_product_quantity(db_session):
+    inventory = crud.adjust_product_quantity(db_session, product_id=1, delta=-2)
+
+    assert inventory is not None
+    assert (inventory.product_id, inventory.quantity) == (1, 3)
+    assert _stock(db_session)[1] == 3
+
+
+@pytest.mark.usefixtures('products_inventory')
+@pytest.mark.parametrize(('product_id', 'delta'), [(2, -2), (42, 1)])
+def test_adjust_product_quantity_failed(db_session, product_id, delta):
+    assert crud.adjust_product_quantity(db_session, product_id, delta) is None
+    assert _stock(db_session) == {1: 5, 2: 1, 3: 0}
+
+
+@pytest.mark.usefixtures('products_inventory')
+def test_increase_quantity_is_an_sql_expression(db_session):
+    product = db_session.get(models.Product, 1)
+    product.product_inventory.quantity  # pylint: disable=pointless-statement
+    # a concurrent change made after the row was loaded
+    crud.adjust_product_quantity(db_session, product_id=1, delta=10)
+
+    product.increase_quantity(3)
+    product.decrease_quantity(1)
+    db_session.flush()
+
+    assert product.product_inventory.quantity == 17
+
+
+@pytest.mark.usefixtures('products_inventory')
+def test_adjust_inventory(db_session, mocker):
+    mocker.patch('app.db.crud.inventory.INVENTORY_BATCH_SIZE', 2)
+
+    inventory = crud.adjust_inventory(db_session, {3: 10, 1: -5, 2: 0})
+
+    assert inventory is not None
+    assert [(row.product_id, row.quantity) for row in inventory] == [
+        (1, 0),
+        (2, 1),
+        (3, 10),
+    ]
+    assert _stock(db_session) == {1: 0, 2: 1, 3: 10}
+
+
+@pytest.mark.usefixtures('products_inventory')
+@pytest.mark.parametrize('deltas', [{1: -6}, {1: 1, 2: -2}, {1: 1, 42: 1}])
+def test_adjust_inventory_failed(db_session, deltas):
+    assert crud.adjust_inventory(db_session, deltas) is None
+
+
+@pytest.mark.usefixtures('products_inventory')
+def test_get_short_stock(db_session, mocker):
+    mocker.patch('app.db.crud.inventory.INVENTORY_BATCH_SIZE', 2)
+
+    short = crud.get_short_stock(db_session, {1: -6, 2: -1, 3: -1, 42: -1})
+
+    assert short == [1, 3]
+    assert _stock(db_session) == {1: 5, 2: 1, 3: 0}
 
 
 @pytest.mark.usefixtures('order')
@@ -309,7 +614,137 @@ def test_get_order_by_id(db_session):
     assert order.total == Decimal('1000.00')  # type: ignore
 
 
+@pytest.mark.usefixtures('user', 'shipping_address', 'products', 'order')
+def test_get_order_by_id_with_items(db_session, n_plus_one):
+    for product_id in (1, 2, 3):
+        db_session.add(
+            models.OrderItems(
+                order_id=1, product_id=product_id, quantity=1, price_per_item=1
+            )
+        )
+    db_session.commit()
+
+    with n_plus_one() as counter:
+        order = schemas.ProcessedOrder.from_orm(
+            crud.get_order_by_id(db_session, order_id=1, with_items=True)
+        )
+
+    assert order.user.login == 'qwertyqwerty@rambler.ru'
+    assert [item.product.id for item in order.items] == [1, 2, 3]
+    # the order with its user and address + the items with their products
+    assert counter.count == 2
+
+
 @pytest.mark.usefixtures('order')
 def test_get_unknown_order_by_id(db_session):
     order = crud.get_order_by_id(db_session, order_id=100)
     assert order is None
+
+
+@pytest.mark.usefixtures('user', 'shipping_address')
+def test_get_pending_payments(db_session):
+    for total in ('10.00', '20.00', '30.00'):
+        crud.create_order(
+            db_session, total=Decimal(total), user_id=1, shipping_address_id=1
+        )
+    db_session.query(models.Order).filter(models.Order.id == 2).update(
+        {'payment_status': models.Order.PAID}
+    )
+
+    pending = crud.get_pending_payments(db_session, limit=10)
+    assert [tuple(row) for row in pending] == [
+        (1, Decimal('10.00')),
+        (3, Decimal('30.00')),
+    ]
+    assert [row.id for row in crud.get_pending_payments(db_session, 10, [1])] == [3]
+    assert [row.id for row in crud.get_pending_payments(db_session, 1)] == [1]
+
+
+@pytest.mark.usefixtures('user', 'shipping_address')
+def test_claim_payment(db_session):
+    db_order = crud.create_order(
+        db_session, total=Decimal('10.00'), user_id=1, shipping_address_id=1
+    )
+
+    assert crud.claim_payment(db_session, db_order.id, timeout=60)
+    # claimed: neither polled nor claimed again
+    assert not crud.claim_payment(db_session, db_order.id, timeout=60)
+    assert crud.get_pending_payments(db_session, limit=10) == []
+    db_session.refresh(db_order)
+    assert db_order.payment_status == models.Order.CHARGING
+
+    # until the claim expires
+    db_order.next_payment_attempt_at = datetime.now() - timedelta(seconds=1)
+    db_session.flush()
+    assert [row.id for row in crud.get_pending_payments(db_session, 10)] == [1]
+    assert crud.claim_payment(db_session, db_order.id, timeout=60)
+
+    assert crud.record_payment(db_session, order_id=db_order.id, paid=True)
+    assert not crud.claim_payment(db_session, db_order.id, timeout=0)
+
+
+@pytest.mark.usefixtures('user', 'shipping_address')
+@pytest.mark.parametrize(
+    'paid, status',
+    [(True, models.Order.PAID), (False, models.Order.PAYMENT_FAILED)],
+)
+def test_record_payment(db_session, paid, status):
+    db_order = crud.create_order(
+        db_session, total=Decimal('10.00'), user_id=1, shipping_address_id=1
+    )
+
+    assert crud.record_payment(db_session, order_id=db_order.id, paid=paid)
+    # only the first outcome counts
+    assert not crud.record_payment(db_session, order_id=db_order.id, paid=not paid)
+
+    db_session.refresh(db_order)
+    assert db_order.is_paid is paid
+    assert db_order.payment_status == status
+
+
+@pytest.mark.usefixtures('user', 'shipping_address')
+def test_record_payment_error(db_session):
+    db_order = crud.create_order(
+        db_session, total=Decimal('10.00'), user_id=1, shipping_address_id=1
+    )
+
+    crud.record_payment_error(db_session, db_order.id, max_attempts=3, retry_delay=60)
+    # not retried before its delay
+    assert crud.get_pending_payments(db_session, limit=10) == []
+    db_session.refresh(db_order)
+    assert db_order.payment_attempts == 1
+    assert db_order.next_payment_attempt_at > datetime.now() + timedelta(seconds=50)
+
+    crud.record_payment_error(db_session, db_order.id, max_attempts=3, retry_delay=0)
+    assert [row.id for row in crud.get_pending_payments(db_session, 10)] == [1]
+    crud.record_payment_error(db_session, db_order.id, max_attempts=3, retry_delay=0)
+    db_session.refresh(db_order)
+    assert db_order.payment_attempts == 3
+    assert db_order.payment_status == models.Order.PAYMENT_FAILED
+    assert not db_order.is_paid
+
+
+def test_claim_idempotency_key(db_session):
+    now = datetime.now()
+
+    assert crud.claim_idempotency_key(db_session, 'key', 'hash', now - timedelta(1))
+    assert not crud.claim_idempotency_key(db_session, 'key', 'hash', now - timedelta(1))
+
+    crud.store_idempotent_response(db_session, 'key', 200, b'{}')
+    stored = crud.get_idempotency_key(db_session, 'key')
+    assert stored is not None
+    assert (stored.request_hash, stored.status_code, stored.response) == (
+        'hash',
+        200,
+        b'{}',
+    )
+
+
+def test_claim_expired_idempotency_key(db_session):
+    crud.claim_idempotency_key(db_session, 'key', 'hash', datetime.now())
+
+    assert crud.claim_idempotency_key(db_session, 'key', 'other', datetime.now())
+    db_session.expire_all()
+    stored = crud.get_idempotency_key(db_session, 'key')
+    assert stored is not None
+    assert stored.request_hash == 'other'
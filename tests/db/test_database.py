@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from app.config import Settings, get_settings
+from app.db import database
+
+
+def test_get_engine_is_created_once():
+    assert database.get_engine() is database.get_engine()
+    with database.get_session()() as db:
+        assert db.get_bind() is database.get_engine()
+
+
+def test_dispose_engine_recreates_engine():
+    engine = database.get_engine()
+    database.dispose_engine()
+    assert database.get_engine() is not engine
+
+
+def test_in_memory_sqlite_uses_static_pool():
+    engine = database.create_db_engine(Settings(SQLALCHEMY_DATABASE_URI='sqlite://'))
+    assert isinstance(engine.pool, StaticPool)
+
+
+def test_file_sqlite_uses_configured_queue_pool(tmp_path):
+    engine = database.create_db_engine(
+        Settings(
+            SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "test.db"}',
+            SQLALCHEMY_POOL_SIZE=3,
+            SQLALCHEMY_MAX_OVERFLOW=0,
+            SQLITE_SERIALIZE_WRITES=False,
+        )
+    )
+    assert isinstance(engine.pool, QueuePool)
+    assert engine.pool.size() == 3
+    assert engine.pool._max_overflow == 0  # pylint: disable=protected-access
+
+
+def file_settings(tmp_path, **kwargs):
+    return Settings(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "test.db"}', **kwargs
+    )
+
+
+def test_sqlite_pragmas(tmp_path):
+    engine = database.create_db_engine(
+        file_settings(tmp_path, SQLITE_BUSY_TIMEOUT=1234)
+    )
+
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert connection.exec_driver_sql('PRAGMA synchronous').scalar() == 1
+        assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == 1234
+        assert connection.exec_driver_sql('PRAGMA cache_size').scalar() == -64000
+        assert connection.exec_driver_sql('PRAGMA temp_store').scalar() == 2
+
+
+def test_sqlite_single_writer_and_read_only_pool(tmp_path):
+    settings = file_settings(tmp_path, SQLALCHEMY_POOL_SIZE=3)
+    writer = database.create_db_engine(settings)
+    reader = database.create_db_engine(settings, read_only=True)
+
+    assert writer.pool.size() == 1
+    assert writer.pool._max_overflow == 0  # pylint: disable=protected-access
+    assert reader.pool.size() == 3
+    with writer.begin() as connection:
+        connection.exec_driver_sql('CREATE TABLE counter (value INTEGER)')
+        connection.exec_driver_sql('INSERT INTO counter VALUES (0)')
+    with reader.connect() as connection:
+        assert connection.exec_driver_sql('SELECT value FROM counter').scalar() == 0
+        with pytest.raises(OperationalError, match='readonly'):
+            connection.exec_driver_sql('UPDATE counter SET value = 1')
+
+
+def test_sqlite_concurrent_read_then_write_transactions(tmp_path):
+    # deferred transactions reading before they write fail at once with
+    # "database is locked" (or lose updates); immediate ones wait their turn
+    settings = file_settings(tmp_path, SQLITE_BUSY_TIMEOUT=10_000)
+    engines = [database.create_db_engine(settings) for _ in range(4)]
+    with engines[0].begin() as connection:
+        connection.exec_driver_sql('CREATE TABLE counter (value INTEGER)')
+        connection.exec_driver_sql('INSERT INTO counter VALUES (0)')
+
+    def increment(engine):
+        with engine.begin() as connection:
+            value = connection.execute(text('SELECT value FROM counter')).scalar()
+            connection.execute(text('UPDATE counter SET value = :v'), {'v': value + 1})
+
+    threads = [
+        threading.Thread(target=increment, args=(engine,))
+        for engine in engines
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with engines[0].connect() as connection:
+        assert connection.exec_driver_sql('SELECT value FROM counter').scalar() == 20
+
+
+def test_read_engine(tmp_path, monkeypatch):
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "test.db"}')
+    get_settings.cache_clear()
+    try:
+        assert database.get_read_engine() is not database.get_engine()
+        with database.get_read_session()() as db:
+            assert db.execute(text('PRAGMA query_only')).scalar() == 1
+    finally:
+        database.dispose_engine()
+        get_settings.cache_clear()
+
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+    try:
+        assert database.get_read_engine() is database.get_engine()
+    finally:
+        database.dispose_engine()
+        get_settings.cache_clear()
@@ -0,0 +1,98 @@
+import logging
+
+import pytest
+import sqlalchemy as sa
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+
+from app.db import crud, models, schemas
+from app.db.debug import (
+    NPlusOneError,
+    NPlusOneMiddleware,
+    StatementCounter,
+    log_slow_queries,
+    record_request_statements,
+    statement_shape,
+)
+
+
+def test_statement_shape():
+    assert statement_shape('SELECT *\n  FROM product WHERE id IN (?, ?,?)') == (
+        'SELECT * FROM product WHERE id IN (?)'
+    )
+    assert statement_shape('SELECT * FROM product WHERE id IN (%(id_1_1)s)') == (
+        'SELECT * FROM product WHERE id IN (?)'
+    )
+    assert statement_shape('SELECT * FROM product WHERE id = $1') == (
+        'SELECT * FROM product WHERE id = $1'
+    )
+
+
+@pytest.mark.usefixtures('user', 'shipping_address', 'products', 'order')
+def test_lazy_loads_are_detected(db_session):
+    for product_id in (1, 2, 3):
+        db_session.add(
+            models.OrderItems(
+                order_id=1, product_id=product_id, quantity=1, price_per_item=1
+            )
+        )
+    db_session.commit()
+
+    with StatementCounter(db_session.get_bind()) as counter:
+        schemas.ProcessedOrder.from_orm(crud.get_order_by_id(db_session, order_id=1))
+
+    counter.check_n_plus_one(threshold=3)
+    with pytest.raises(NPlusOneError, match='3 x SELECT product'):
+        counter.check_n_plus_one(threshold=2)
+
+
+@pytest.mark.usefixtures('products')
+def test_log_slow_queries(db_session, caplog):
+    log_slow_queries(db_session.get_bind(), threshold=0)
+
+    with caplog.at_level(logging.WARNING, logger='app.db.debug'):
+        crud.get_product_by_sku(db_session, 'ABC123')
+
+    message = caplog.records[-1].getMessage()
+    assert message.startswith('Slow query')
+    assert "'ABC123'" in message
+    # the plan
+    assert 'USING INDEX' in message
+
+
+def test_log_slow_queries_forgets_failed_statements(db_session):
+    log_slow_queries(db_session.get_bind(), threshold=60)
+    connection = db_session.connection()
+
+    for _ in range(3):
+        with pytest.raises(OperationalError):
+            connection.execute(sa.text('SELECT * FROM no_such_table'))
+
+    assert not connection.info.get('slow_query_start')
+
+
+@pytest.mark.usefixtures('products')
+def test_n_plus_one_middleware(db_session, caplog):
+    record_request_statements(db_session.get_bind())
+    app = FastAPI()
+    app.add_middleware(NPlusOneMiddleware, threshold=2)
+
+    @app.get('/products/{count}')
+    def get_products(count: int) -> list[str]:
+        names = [
+            db_session.get(models.Product, ident).name for ident in range(1, count + 1)
+        ]
+        db_session.expunge_all()
+        return names
+
+    with caplog.at_level(logging.WARNING, logger='app.db.debug'):
+        TestClient(app).get('/products/2')
+        assert not caplog.records
+        TestClient(app).get('/products/3')
+
+    assert (
+        caplog.records[-1]
+        .getMessage()
+        .startswith('N+1 queries in GET /products/3: 3 x SELECT product.id')
+    )
@@ -0,0 +1,112 @@
+import pytest
+import sqlalchemy as sa
+
+from app.db import crud, models, schemas
+
+
+def _category_counts(db_session):
+    return dict(
+        db_session.execute(
+            sa.select(
+                models.CategoryFacet.category_id, models.CategoryFacet.product_count
+            ).where(models.CategoryFacet.product_count > 0)
+        ).all()
+    )
+
+
+def _characteristic_counts(db_session):
+    return {
+        (characteristic_id, value): product_count
+        for characteristic_id, value, product_count in db_session.execute(
+            sa.select(
+                models.CharacteristicFacet.characteristic_id,
+                models.CharacteristicFacet.characteristic_value,
+                models.CharacteristicFacet.product_count,
+            ).where(models.CharacteristicFacet.product_count > 0)
+        )
+    }
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_facets_count_new_products(db_session):
+    assert _category_counts(db_session) == {1: 2, 2: 1}
+    assert _characteristic_counts(db_session) == {(1, '3 м.'): 3, (2, 'Синий'): 3}
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_facets_follow_changes(db_session):
+    product = db_session.get(models.Product, 1)
+    product.category = db_session.get(models.ProductCategory, 2)
+    value = db_session.query(models.ProductCharacteristic).filter_by(
+        product_id=2, characteristic_id=2
+    )
+    value.one().characteristic_value = 'Красный'
+    db_session.delete(
+        db_session.query(models.ProductCharacteristic)
+        .filter_by(product_id=3, characteristic_id=1)
+        .one()
+    )
+    db_session.commit()
+
+    assert _category_counts(db_session) == {1: 1, 2: 2}
+    assert _characteristic_counts(db_session) == {
+        (1, '3 м.'): 2,
+        (2, 'Синий'): 2,
+        (2, 'Красный'): 1,
+    }
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_facets_count_core_inserts(db_session):
+    db_session.add(models.Characteristic(id=3, name='Материал'))
+    db_session.flush()
+    crud.add_product_characteristics(
+        db_session,
+        [
+            schemas.ProductCharacteristic(
+                characteristic_id=3, characteristic_value='ПВХ'
+            )
+        ],
+        product_id=1,
+    )
+    db_session.commit()
+
+    assert _characteristic_counts(db_session)[3, 'ПВХ'] == 1
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_facets_forget_rolled_back_changes(db_session):
+    db_session.delete(db_session.get(models.Product, 3))
+    db_session.flush()
+    db_session.rollback()
+
+    db_session.commit()
+    assert _category_counts(db_session) == {1: 2, 2: 1}
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_reconcile_facets(db_session):
+    # written behind the session's back
+    db_session.execute(
+        sa.delete(models.ProductCharacteristic).where(
+            models.ProductCharacteristic.product_id == 1
+        )
+    )
+    db_session.execute(sa.update(models.CategoryFacet).values(product_count=10))
+    crud.reconcile_facets(db_session)
+    db_session.commit()
+
+    assert _category_counts(db_session) == {1: 2, 2: 1}
+    assert _characteristic_counts(db_session) == {(1, '3 м.'): 2, (2, 'Синий'): 2}
+
+
+@pytest.mark.usefixtures('products_characteristics')
+def test_get_facets(db_session):
+    assert [tuple(facet) for facet in crud.get_category_facets(db_session)] == [
+        (2, 'Массажёры', 1),
+        (1, 'Скакалки', 2),
+    ]
+    assert [tuple(facet) for facet in crud.get_characteristic_facets(db_session)] == [
+        (1, 'Длина троса', '3 м.', 3),
+        (2, 'Цвет', 'Синий', 3),
+    ]
@@ -0,0 +1,162 @@
+import pytest
+
+from app.db import crud, keyset, models, schemas
+
+
+def _scroll(db_session, product_filters, size):
+    query = crud.get_filtered_products_query(db_session, product_filters)
+    keys = crud.get_product_sort_keys(product_filters)
+
+    pages, cursor = [], None
+    while True:
+        items, cursor, _ = keyset.paginate(query, keys, size=size, cursor=cursor)
+        pages.append([item.id for item in items])
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize(
+    ('sort_by_price', 'size', 'pages'),
+    [
+        (False, 2, [[1, 2], [3]]),
+        (False, 3, [[1, 2, 3]]),
+        (True, 1, [[2], [1], [3]]),
+    ],
+)
+@pytest.mark.usefixtures('products')
+def test_paginate_forward(db_session, sort_by_price, size, pages):
+    product_filters = schemas.ProductFilters(sort_by_price=sort_by_price)
+    assert _scroll(db_session, product_filters, size) == pages
+
+
+@pytest.mark.parametrize(
+    ('sort', 'size', 'pages'),
+    [
+        (schemas.ProductSort.NAME_DESC, 2, [[1, 2], [3]]),
+        (schemas.ProductSort.CATEGORY_NAME, 1, [[2], [1], [3]]),
+        (schemas.ProductSort.CHEAPEST, 2, [[3, 1], [2]]),
+    ],
+)
+@pytest.mark.usefixtures('products')
+def test_paginate_sorted(db_session, sort, size, pages):
+    product_filters = schemas.ProductFilters(sort=sort)
+    assert _scroll(db_session, product_filters, size) == pages
+
+
+@pytest.fixture()
+def product_without_category(products, db_session):  # pylint: disable=W0613
+    db_session.add(
+        models.Product(
+            id=4, name='Скакалка', sku='NOCAT1', description='', price=899.00
+        )
+    )
+    db_session.flush()
+
+
+@pytest.mark.parametrize(
+    ('sort', 'size', 'pages'),
+    [
+        (schemas.ProductSort.CATEGORY_CHEAPEST, 2, [[4, 1], [2, 3]]),
+        (schemas.ProductSort.CATEGORY_CHEAPEST, 1, [[4], [1], [2], [3]]),
+        (schemas.ProductSort.CATEGORY_NAME, 3, [[4, 2, 1], [3]]),
+        (schemas.ProductSort.OLDEST, 2, [[1, 2], [3, 4]]),
+    ],
+)
+@pytest.mark.usefixtures('product_without_category')
+def test_paginate_without_category(db_session, sort, size, pages):
+    product_filters = schemas.ProductFilters(sort=sort)
+
+    # NULL sorts first on sqlite, the cursors carry it
+    assert _scroll(db_session, product_filters, size) == pages
+    assert crud.count_filtered_products(db_session, product_filters) == 4
+
+
+@pytest.mark.usefixtures('product_without_category')
+def test_paginate_backward_to_the_nulls(db_session):
+    product_filters = schemas.ProductFilters(sort=schemas.ProductSort.CATEGORY_CHEAPEST)
+    query = crud.get_filtered_products_query(db_session, product_filters)
+    keys = crud.get_product_sort_keys(product_filters)
+
+    _, cursor, _ = keyset.paginate(query, keys, size=1)
+    _, cursor, prev_cursor = keyset.paginate(query, keys, size=1, cursor=cursor)
+    items, _, prev_of_first = keyset.paginate(query, keys, size=1, cursor=prev_cursor)
+
+    assert [item.id for item in items] == [4]
+    assert prev_of_first is None
+
+
+@pytest.mark.parametrize('nulls_high', [False, True])
+@pytest.mark.parametrize('descending', [False, True])
+def test_after_places_the_nulls(db_session, nulls_high, descending):
+    # the rows after each one, in the order of each dialect
+    rows = [(None, 1), (None, 2), (1, 3), (1, 4), (2, 5)]
+    if nulls_high:
+        rows = rows[2:] + rows[:2]
+    if descending:
+        rows.reverse()
+    keys = [(models.Product.category_id, descending), (models.Product.id, descending)]
+    for category_id, product_id in rows:
+        db_session.add(
+            models.Product(
+                id=product_id,
+                name=str(product_id),
+                sku=str(product_id),
+                description='',
+                price=1,
+                category_id=category_id,
+            )
+        )
+    db_session.flush()
+
+    for position, values in enumerate(rows):
+        after = []
+        for condition in keyset._after(  # pylint: disable=protected-access
+            keys, list(values), nulls_high
+        ):
+            after.extend(db_session.query(models.Product.id).filter(condition))
+        expected = {product_id for _, product_id in rows[position + 1 :]}
+        assert {product_id for (product_id,) in after} == expected, values
+
+
+@pytest.mark.usefixtures('products')
+def test_paginate_backward(db_session):
+    product_filters = schemas.ProductFilters(sort_by_price=True)
+    query = crud.get_filtered_products_query(db_session, product_filters)
+    keys = crud.get_product_sort_keys(product_filters)
+
+    first, next_cursor, prev_cursor = keyset.paginate(query, keys, size=2)
+    assert prev_cursor is None
+    last, next_of_last, prev_cursor = keyset.paginate(
+        query, keys, size=2, cursor=next_cursor
+    )
+    assert [item.id for item in last] == [3]
+    assert next_of_last is None
+
+    items, _, prev_of_first = keyset.paginate(query, keys, size=2, cursor=prev_cursor)
+    assert items == first
+    assert prev_of_first is None
+
+
+@pytest.mark.parametrize(
+    'cursor',
+    [
+        'not a cursor',
+        keyset.encode_cursor([1], backwards=False),
+        keyset.encode_cursor(['cheap', 1], backwards=False),
+    ],
+    ids=['malformed', 'other_sort_order', 'wrong_type'],
+)
+def test_decode_cursor_failed(cursor):
+    keys = crud.get_product_sort_keys(schemas.ProductFilters(sort_by_price=True))
+    with pytest.raises(ValueError):
+        keyset.decode_cursor(cursor, keys)
+
+
+@pytest.mark.usefixtures('products')
+def test_count_filtered_products_is_cached(db_session, mocker):
+    product_filters = schemas.ProductFilters(filter_by_category_name='Скакалки')
+    assert crud.count_filtered_products(db_session, product_filters) == 2
+
+    query_mock = mocker.patch('app.db.crud.get_filtered_products_query')
+    assert crud.count_filtered_products(db_session, product_filters) == 2
+    query_mock.assert_not_called()
@@ -0,0 +1,186 @@
+import logging
+
+import sqlalchemy as sa
+
+from app.db import migrations
+from app.db.init_db import init_db
+
+
+def _index_names(engine, table):
+    return {index['name'] for index in sa.inspect(engine).get_indexes(table)}
+
+
+def test_upgrade_new_database(tmp_path):
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "new.db"}')
+
+    assert migrations.upgrade(engine) == []
+
+    with engine.connect() as connection:
+        assert migrations.get_version(connection) == len(migrations.MIGRATIONS)
+    assert 'ix_order_items_order_id' in _index_names(engine, 'order_items')
+    assert migrations.upgrade(engine) == []
+
+
+def test_upgrade_database_without_migrations(tmp_path):
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    migrations.upgrade(engine)
+    with engine.begin() as connection:
+        connection.execute(sa.text('DROP TABLE schema_version'))
+        connection.execute(sa.text('DROP INDEX ix_product_price_id'))
+        connection.execute(sa.text('DROP INDEX ix_order_items_order_id'))
+
+    applied = migrations.upgrade(engine)
+
+    assert applied == [migration.description for migration in migrations.MIGRATIONS]
+    assert 'ix_product_price_id' in _index_names(engine, 'product')
+    assert 'ix_order_items_order_id' in _index_names(engine, 'order_items')
+
+
+def test_init_db_logs_the_migrations(tmp_path, mocker, caplog, capsys):
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    migrations.upgrade(engine)
+    with engine.begin() as connection:
+        connection.execute(sa.text('DROP TABLE schema_version'))
+    mocker.patch('app.db.init_db.get_engine', return_value=engine)
+
+    with caplog.at_level(logging.INFO, logger='app.db.init_db'):
+        applied = init_db()
+
+    assert applied == [migration.description for migration in migrations.MIGRATIONS]
+    assert f'Applied migration: {applied[0]}' in caplog.text
+    assert not capsys.readouterr().out
+
+
+def test_deduplicate_shipping_addresses(tmp_path):
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    migrations.upgrade(engine)
+    with engine.begin() as connection:
+        # the database as it was before the addresses were hashed
+        connection.execute(sa.text('DROP INDEX ix_shipping_address_content_hash'))
+        connection.execute(sa.text('ALTER TABLE shipping_address DROP content_hash'))
+        connection.execute(sa.update(migrations.schema_version).values(version=1))
+        connection.execute(
+            sa.text(
+                'INSERT INTO shipping_address (id, country, city, postcode, address) '
+                "VALUES (1, 'Россия', 'Москва', '119991', 'Мой адрес'), "
+                "(2, 'Россия', 'Москва', '119991', ' Мой  адрес'), "
+                "(3, 'Россия', 'Тверь', '171390', 'Мой адрес')"
+            )
+        )
+        connection.execute(
+            sa.text(
+                'INSERT INTO "order" (id, creation_date, total, is_paid, '
+                'is_processed, payment_status, shipping_address_id) '
+                "VALUES (1, '2022-05-01', 1, 1, 0, 'paid', 1), "
+                "(2, '2022-05-01', 1, 1, 0, 'paid', 2), "
+                "(3, '2022-05-01', 1, 1, 0, 'paid', 3)"
+            )
+        )
+
+    assert 'Deduplicate the shipping addresses' in migrations.upgrade(engine)
+
+    with engine.connect() as connection:
+        addresses = connection.execute(
+            sa.text('SELECT id, address, content_hash FROM shipping_address')
+        ).all()
+        order_addresses = connection.execute(
+            sa.text('SELECT shipping_address_id FROM "order" ORDER BY id')
+        ).scalars()
+        assert [address[:2] for address in addresses] == [
+            (1, 'Мой адрес'),
+            (3, 'Мой адрес'),
+        ]
+        assert all(address.content_hash for address in addresses)
+        assert list(order_addresses) == [1, 1, 3]
+    assert 'ix_shipping_address_content_hash' in _index_names(
+        engine, 'shipping_address'
+    )
+    # the same table as a new database has
+    columns = sa.inspect(engine).get_columns('shipping_address')
+    assert not next(c['nullable'] for c in columns if c['name'] == 'content_hash')
+    assert _index_names(engine, 'shipping_address') == {
+        'ix_shipping_address_id',
+        'ix_shipping_address_content_hash',
+    }
+    assert 'shipping_address' in {
+        foreign_key['referred_table']
+        for foreign_key in sa.inspect(engine).get_foreign_keys('order')
+    }
+
+
+def test_add_payment_status(tmp_path):
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    migrations.upgrade(engine)
+    with engine.begin() as connection:
+        # orders used to be paid (or not) while they were created
+        connection.execute(sa.text('DROP INDEX ix_order_payment_status'))
+        connection.execute(sa.text('ALTER TABLE "order" DROP payment_status'))
+        connection.execute(sa.update(migrations.schema_version).values(version=2))
+        connection.execute(
+            sa.text(
+                'INSERT INTO "order" (id, creation_date, total, is_paid, is_processed) '
+                "VALUES (1, '2022-05-01', 1, 1, 0), (2, '2022-05-01', 1, 0, 0)"
+            )
+        )
+
+    assert 'Payment status of the orders' in migrations.upgrade(engine)
+
+    with engine.connect() as connection:
+        statuses = connection.execute(
+            sa.text('SELECT payment_status FROM "order" ORDER BY id')
+        ).scalars()
+        assert list(statuses) == ['paid', 'payment_failed']
+    assert 'ix_order_payment_status' in _index_names(engine, 'order')
+
+
+def test_count_facets(tmp_path):
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    migrations.upgrade(engine)
+    with engine.begin() as connection:
+        # the catalogue as it was before the facets were counted
+        connection.execute(sa.text('DROP TABLE category_facet'))
+        connection.execute(sa.update(migrations.schema_version).values(version=3))
+        connection.execute(
+            sa.text(
+                "INSERT INTO product_category (id, name, description) "
+                "VALUES (1, 'Скакалки', '')"
+            )
+        )
+        connection.execute(
+            sa.text(
+                'INSERT INTO product (id, name, sku, description, price, category_id) '
+                "VALUES (1, 'Скакалка', 'A1', '', 1, 1), (2, 'Скакалка', 'A2', '', 1, 1)"
+            )
+        )
+
+    assert 'Facet counts of the catalogue' in migrations.upgrade(engine)
+
+    with engine.connect() as connection:
+        counts = connection.execute(
+            sa.text('SELECT category_id, product_count FROM category_facet')
+        ).all()
+        assert counts == [(1, 2)]
+
+
+def test_add_payment_retries(tmp_path):
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    migrations.upgrade(engine)
+    with engine.begin() as connection:
+        connection.execute(sa.text('ALTER TABLE "order" DROP payment_attempts'))
+        connection.execute(sa.text('ALTER TABLE "order" DROP next_payment_attempt_at'))
+        connection.execute(sa.update(migrations.schema_version).values(version=5))
+        connection.execute(
+            sa.text(
+                'INSERT INTO "order" (id, creation_date, total, is_paid, '
+                "is_processed, payment_status) "
+                "VALUES (1, '2022-05-01', 1, 0, 0, 'pending_payment')"
+            )
+        )
+
+    assert 'Payment retries of the orders' in migrations.upgrade(engine)
+
+    with engine.connect() as connection:
+        row = connection.execute(
+            sa.text('SELECT payment_attempts, next_payment_attempt_at FROM "order"')
+        ).one()
+        assert tuple(row) == (0, None)
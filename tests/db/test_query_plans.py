@@ -0,0 +1,161 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.orm import selectinload
+
+from app.db import crud, keyset, models, schemas
+
+
+def _query_plan(db_session, query):
+    statement = query.statement.compile(
+        dialect=db_session.get_bind().dialect,
+        compile_kwargs={'literal_binds': True},
+    )
+    return [
+        row[-1]
+        for row in db_session.execute(f'EXPLAIN QUERY PLAN {statement}').fetchall()
+    ]
+
+
+def _is_full_scan(step):
+    # "SCAN t" without an index walks the whole table, a temp b-tree means a full sort
+    return (
+        step.startswith('SCAN ') and 'INDEX' not in step and 'VIRTUAL TABLE' not in step
+    ) or 'TEMP B-TREE' in step
+
+
+@pytest.mark.parametrize(
+    'build_query',
+    [
+        lambda db: db.query(models.Product).filter(models.Product.id == 1),
+        lambda db: crud.get_filtered_products_query(
+            db, schemas.ProductFilters(sort_by_price=True)
+        ),
+        lambda db: crud.get_filtered_products_query(
+            db, schemas.ProductFilters(filter_by_category_name='Скакалки')
+        ),
+        lambda db: crud.get_filtered_products_query(
+            db,
+            schemas.ProductFilters(
+                filter_by_category_name='Скакалки', sort_by_price=True
+            ),
+        ),
+        lambda db: crud.get_filtered_products_query(
+            db, schemas.ProductFilters(filter_by_name='скакалка')
+        ),
+        lambda db: db.query(models.ProductCharacteristic).filter(
+            models.ProductCharacteristic.product_id.in_([1, 2])
+        ),
+        lambda db: db.query(models.ProductCharacteristic).filter(
+            models.ProductCharacteristic.characteristic_id == 1,
+            models.ProductCharacteristic.characteristic_value == '3 м.',
+        ),
+        lambda db: db.query(models.ProductInventory).filter(
+            models.ProductInventory.product_id.in_([1, 2])
+        ),
+        lambda db: db.query(models.User).filter(models.User.login == 'qwerty'),
+        lambda db: db.query(models.Order)
+        .options(selectinload(models.Order.items))
+        .filter(models.Order.user_id == 1),
+        lambda db: db.query(models.Order).filter(models.Order.shipping_address_id == 1),
+        lambda db: db.query(models.OrderItems).filter(models.OrderItems.order_id == 1),
+        lambda db: db.query(models.OrderItems).filter(
+            models.OrderItems.product_id == 1
+        ),
+    ],
+    ids=[
+        'product_by_id',
+        'products_by_price',
+        'products_in_category',
+        'products_in_category_by_price',
+        'products_by_name',
+        'characteristics_of_products',
+        'products_with_characteristic',
+        'inventory_of_products',
+        'user_by_login',
+        'orders_of_user',
+        'orders_to_address',
+        'items_of_order',
+        'orders_of_product',
+    ],
+)
+def test_hot_queries_use_indexes(db_session, build_query):
+    plan = _query_plan(db_session, build_query(db_session))
+    assert not [step for step in plan if _is_full_scan(step)], plan
+
+
+def _index_columns(table):
+    return {tuple(column.name for column in index.columns) for index in table.indexes}
+
+
+@pytest.mark.parametrize('sort', list(schemas.ProductSort))
+def test_product_sorts_have_indexes(sort):
+    keys = crud.get_product_sort_keys(schemas.ProductFilters(sort=sort))
+    columns = tuple(column.key for column, _ in keys)
+    indexes = _index_columns(models.Product.__table__)
+
+    # in the whole catalogue and within a category
+    assert columns in indexes or columns == ('id',)
+    assert columns in indexes or ('category_id', *columns) in indexes
+
+
+@pytest.mark.parametrize('sort', list(schemas.ProductSort))
+@pytest.mark.parametrize(
+    'filters',
+    [{}, {'filter_by_category_name': 'Скакалки'}],
+    ids=['catalogue', 'in_category'],
+)
+def test_sorted_listings_read_an_index_in_order(db_session, sort, filters):
+    product_filters = schemas.ProductFilters(sort=sort, **filters)
+    query = crud.get_filtered_products_query(db_session, product_filters)
+
+    # the pages are read in order, no sort of the whole listing
+    plan = _query_plan(db_session, query)
+    assert not [step for step in plan if 'TEMP B-TREE' in step], plan
+
+
+@pytest.mark.parametrize(
+    ('sort', 'filters'),
+    [
+        (schemas.ProductSort.CHEAPEST, {}),
+        (schemas.ProductSort.MOST_EXPENSIVE, {}),
+        (schemas.ProductSort.CHEAPEST, {'filter_by_category_name': 'Скакалки'}),
+        (
+            schemas.ProductSort.CATEGORY_CHEAPEST,
+            {'filter_by_category_name': 'Скакалки'},
+        ),
+    ],
+)
+def test_price_ranges_use_indexes(db_session, sort, filters):
+    product_filters = schemas.ProductFilters(
+        sort=sort, min_price=Decimal(100), max_price=Decimal(500), **filters
+    )
+    query = crud.get_filtered_products_query(db_session, product_filters)
+
+    plan = _query_plan(db_session, query)
+    assert not [step for step in plan if _is_full_scan(step)], plan
+
+
+@pytest.mark.parametrize(
+    ('sort', 'category_id'),
+    [
+        (schemas.ProductSort.MOST_EXPENSIVE, None),
+        (schemas.ProductSort.CATEGORY_NAME, 1),
+        (schemas.ProductSort.CATEGORY_NAME, None),
+        (schemas.ProductSort.CATEGORY_CHEAPEST, None),
+    ],
+)
+@pytest.mark.parametrize('nulls_high', [False, True])
+def test_keyset_pages_seek_the_index(db_session, sort, category_id, nulls_high):
+    product_filters = schemas.ProductFilters(sort=sort)
+    keys = crud.get_product_sort_keys(product_filters)
+    values = {'price': 1000, 'category_id': category_id, 'name': 'Скакалка', 'id': 2}
+
+    # every range starts at the cursor rather than filtering the rows before it
+    for condition in keyset._after(  # pylint: disable=protected-access
+        keys, [values[column.key] for column, _ in keys], nulls_high
+    ):
+        query = crud.get_filtered_products_query(db_session, product_filters)
+        plan = _query_plan(db_session, query.filter(condition))
+        assert plan[0].startswith('SEARCH product USING INDEX'), plan
+        assert not [step for step in plan if _is_full_scan(step)], plan
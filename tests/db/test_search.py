@@ -0,0 +1,83 @@
+import pytest
+
+from app.db import crud, models, schemas
+
+
+def _search(db_session, **filters):
+    query = crud.get_filtered_products_query(
+        db_session, schemas.ProductFilters(**filters)
+    )
+    return [product.id for product in query]
+
+
+@pytest.mark.parametrize(
+    ('search', 'result'),
+    [
+        ('скакалка', [1, 2]),
+        ('СКОРОСТНАЯ', [1, 2]),
+        ('самая скор', [2]),
+        ('мышцы', [3]),
+        ('Синий', [1, 2, 3]),
+        ('qwerty', []),
+    ],
+    ids=['name', 'case', 'prefix', 'description', 'characteristic', 'nothing'],
+)
+@pytest.mark.usefixtures('products_characteristics')
+def test_search_products(db_session, search, result):
+    assert sorted(_search(db_session, search=search)) == result
+
+
+@pytest.mark.usefixtures('products')
+def test_search_products_ranking(db_session):
+    # a match in the name outweighs a match in the description
+    db_session.add(
+        models.Product(
+            id=4,
+            name='Коврик',
+            sku='MAT001',
+            description='Для прыжков со скакалкой',
+            price=2000,
+            category_id=2,
+        )
+    )
+    db_session.commit()
+
+    assert _search(db_session, search='скакал')[-1] == 4
+    assert _search(db_session, search='скакал', sort_by_price=True) == [4, 2, 1]
+
+
+@pytest.mark.usefixtures('products')
+def test_search_index_follows_updates(db_session):
+    product = crud.get_product_by_id(db_session, product_id=3)
+    assert product is not None
+    product.name = 'Массажный мяч'
+    crud.add_product_characteristic(
+        db_session,
+        schemas.ProductCharacteristic(
+            characteristic_id=1, characteristic_value='Красный'
+        ),
+        product_id=3,
+    )
+    db_session.commit()
+
+    assert _search(db_session, search='roller') == []
+    assert _search(db_session, search='мяч красный') == [3]
+    assert _search(db_session, filter_by_name='мяч') == [3]
+
+
+@pytest.mark.usefixtures('products')
+def test_search_index_ignores_rolled_back_changes(db_session):
+    product = crud.get_product_by_id(db_session, product_id=3)
+    assert product is not None
+    product.name = 'Массажный мяч'
+    db_session.flush()
+    db_session.rollback()
+
+    assert _search(db_session, search='мяч') == []
+    assert _search(db_session, search='roller') == [3]
+
+
+@pytest.mark.usefixtures('products')
+def test_short_terms_fall_back_to_like(db_session):
+    assert _search(db_session, filter_by_name='Fo') == [3]
+    assert _search(db_session, search='Fo') == [3]
@@ -5,7 +5,10 @@ from decimal import Decimal
 import pytest
 from fastapi.testclient import TestClient
 
+from app import response_cache
+from app.config import get_settings
 from app.db import models
+from app.db.database import dispose_engine, get_engine
 from app.main import app
 
 
@@ -15,6 +18,25 @@ def client():
     return test_client
 
 
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    """An empty database for the app: the routers' queries are mocked, the
+    response cache still reads its generation from it."""
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path}/test.db')
+    get_settings.cache_clear()
+    dispose_engine()
+    models.Base.metadata.create_all(bind=get_engine())
+    yield get_engine()
+    dispose_engine()
+    get_settings.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def _clear_response_cache():
+    yield
+    response_cache.get_response_cache.cache_clear()
+
+
 @pytest.fixture()
 def get_product_category_by_name_mock(mocker):
     return mocker.patch('app.db.crud.get_product_category_by_name')
@@ -67,11 +89,27 @@ def create_product_mock(mocker):
     return mocker.patch('app.db.crud.create_product')
 
 
+@pytest.fixture()
+def adjust_product_quantity_mock(mocker):
+    return mocker.patch('app.db.crud.adjust_product_quantity')
+
+
 @pytest.fixture()
 def get_order_by_id_mock(mocker):
     return mocker.patch('app.db.crud.get_order_by_id')
 
 
+@pytest.fixture()
+def record_payment_mock(mocker):
+    return mocker.patch('app.db.crud.record_payment')
+
+
+@pytest.fixture()
+def payment_secret(monkeypatch):
+    monkeypatch.setattr(get_settings(), 'PAYMENT_WEBHOOK_SECRET', 'secret')
+    return 'secret'
+
+
 @pytest.fixture()
 def add_product_json():
     return {
@@ -131,6 +169,7 @@ def order(user, shipping_address):
         total=Decimal('1000.00'),
         is_paid=0,
         is_processed=0,
+        payment_status=models.Order.PENDING_PAYMENT,
         user_id=1,
         shipping_address_id=1,
         user=user,
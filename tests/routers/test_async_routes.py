@@ -0,0 +1,221 @@
+# pylint: disable=W0621
+import asyncio
+from http import HTTPStatus
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_pagination import add_pagination
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.config import get_settings
+from app.db import models
+from app.dependencies import get_async_db, get_session_slots, get_writer_slot
+from app.exceptions import ProductNotFound
+from app.routers import bulk, orders, products
+from app.routers.async_routes import as_async_router
+
+
+@pytest.fixture()
+def async_client(tmp_path):
+    db_file = tmp_path / 'test.db'
+    models.Base.metadata.create_all(bind=create_engine(f'sqlite:///{db_file}'))
+    session_local = sessionmaker(
+        autoflush=False,
+        bind=create_async_engine(f'sqlite+aiosqlite:///{db_file}'),
+        class_=AsyncSession,
+    )
+
+    async def get_test_db():
+        db = session_local()
+        try:
+            yield db
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        finally:
+            await db.close()
+
+    app = FastAPI()
+    app.include_router(as_async_router(products.router), prefix='/api')
+    app.include_router(as_async_router(bulk.router), prefix='/api')
+    app.include_router(as_async_router(orders.router), prefix='/api')
+    add_pagination(app)
+    app.dependency_overrides[get_async_db] = get_test_db
+    with TestClient(app) as client:
+        yield client
+
+
+def test_async_routes(async_client, add_product_json):
+    response = async_client.post(
+        '/api/products/categories',
+        json={'name': 'Скакалки', 'description': 'Самые лучшие скакалки'},
+    )
+    assert response.status_code == HTTPStatus.CREATED, response.text
+    response = async_client.post(
+        '/api/products/characteristic', json={'name': 'Длина троса'}
+    )
+    assert response.status_code == HTTPStatus.CREATED, response.text
+    response = async_client.post('/api/products/', json=add_product_json)
+    assert response.status_code == HTTPStatus.CREATED, response.text
+    product_id = response.json()['id']
+
+    response = async_client.get(f'/api/products/{product_id}')
+    assert response.status_code == HTTPStatus.OK, response.text
+    data = response.json()
+    assert data['category']['name'] == 'Скакалки'
+    assert data['characteristics'][0]['characteristic']['name'] == 'Длина троса'
+
+    response = async_client.get('/api/products/', params={'search': 'Бисер'})
+    assert response.json()['total'] == 1
+    response = async_client.get('/api/products/cursor', params={'size': 1})
+    assert [item['id'] for item in response.json()['items']] == [product_id]
+
+    response = async_client.patch(
+        f'/api/products/{product_id}/inventory', params={'inc_value': 2}
+    )
+    assert response.json()['quantity'] == 2
+
+    response = async_client.post(
+        '/api/orders/',
+        json={
+            'total': '1399.00',
+            'user': {
+                'login': 'qwertyqwerty@rambler.ru',
+                'first_name': 'Иван',
+                'last_name': 'Иванов',
+            },
+            'shipping_address': {
+                'country': 'Россия',
+                'city': 'Москва',
+                'postcode': '119991',
+                'address': 'Мой адрес',
+            },
+            'items': [
+                {'product': {'id': product_id}, 'quantity': 2, 'price_per_item': 1399}
+            ],
+        },
+    )
+    assert response.status_code == HTTPStatus.OK, response.text
+    assert response.json()['items'][0]['quantity'] == 2
+
+
+def test_async_routes_errors(async_client):
+    response = async_client.get('/api/products/1')
+
+    assert response.status_code == ProductNotFound.status_code, response.text
+    assert response.json()['detail'] == ProductNotFound.detail
+
+
+def test_async_routes_statements(async_client, tmp_path, n_plus_one):
+    async_client.post(
+        '/api/products/categories', json={'name': 'Скакалки', 'description': ''}
+    )
+    for number in range(5):
+        async_client.post(
+            '/api/products/characteristic', json={'name': f'Характеристика {number}'}
+        )
+    characteristics = [
+        {'characteristic_id': characteristic_id, 'characteristic_value': '1'}
+        for characteristic_id in range(1, 6)
+    ]
+    product_ids = []
+    for number in range(5):
+        with n_plus_one():
+            response = async_client.post(
+                '/api/products/',
+                json={
+                    'name': f'Скакалка {number}',
+                    'sku': f'SKU{number}',
+                    'description': '',
+                    'price': 1399,
+                    'category_id': 1,
+                    'characteristics': characteristics,
+                },
+            )
+        assert response.status_code == HTTPStatus.CREATED, response.text
+        product_ids.append(response.json()['id'])
+        async_client.patch(
+            f'/api/products/{product_ids[-1]}/inventory', params={'inc_value': 5}
+        )
+
+    with n_plus_one():
+        response = async_client.get('/api/products/', params={'size': 5})
+    assert all(len(item['characteristics']) == 5 for item in response.json()['items'])
+
+    with n_plus_one():
+        response = async_client.post(
+            '/api/orders/',
+            json={
+                'total': '6995.00',
+                'user': {
+                    'login': 'qwertyqwerty@rambler.ru',
+                    'first_name': 'Иван',
+                    'last_name': 'Иванов',
+                },
+                'shipping_address': {
+                    'country': 'Россия',
+                    'city': 'Москва',
+                    'postcode': '119991',
+                    'address': 'Мой адрес',
+                },
+                'items': [
+                    {
+                        'product': {'id': product_id},
+                        'quantity': 1,
+                        'price_per_item': 1399,
+                    }
+                    for product_id in product_ids
+                ],
+            },
+        )
+    assert response.status_code == HTTPStatus.OK, response.text
+    order_id = response.json()['id']
+
+    with create_engine(f'sqlite:///{tmp_path / "test.db"}').begin() as connection:
+        connection.execute(
+            models.Order.__table__.update().values(
+                is_paid=True, payment_status=models.Order.PAID
+            )
+        )
+    with n_plus_one():
+        response = async_client.patch(f'/api/orders/{order_id}')
+    assert response.status_code == HTTPStatus.OK, response.text
+    assert len(response.json()['items']) == 5
+
+
+def test_async_writes_queue_for_the_writer(tmp_path, monkeypatch, mocker):
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "test.db"}')
+    get_settings.cache_clear()
+    session = mocker.AsyncMock()
+    mocker.patch('app.dependencies.get_async_session', return_value=lambda: session)
+
+    async def write_then_read():
+        writer_slot = get_writer_slot()
+        assert writer_slot is not None
+        write = get_async_db(mocker.Mock(method='POST'))
+        assert await write.__anext__() is session
+        assert writer_slot.value == 0
+        with pytest.raises(StopAsyncIteration):
+            await write.__anext__()
+        assert writer_slot.value == 1
+        session.commit.assert_awaited_once()
+
+    try:
+        asyncio.run(write_then_read())
+    finally:
+        get_settings.cache_clear()
+
+
+def test_session_slots_per_event_loop():
+    async def hold_a_slot():
+        slots = get_session_slots()
+        async with slots:
+            assert get_session_slots() is slots
+        return slots
+
+    # a semaphore of the first loop would not wake the tasks of the second
+    assert asyncio.run(hold_a_slot()) is not asyncio.run(hold_a_slot())
@@ -0,0 +1,169 @@
+# pylint: disable=W0621
+from http import HTTPStatus
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import response_cache
+from app.db import models
+
+
+class FakeRedis:
+    """The subset of the redis client used by the cache backend."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):  # pylint: disable=unused-argument
+        self.data[key] = value
+
+
+@pytest.fixture()
+def catalogue_product(get_product_by_id_mock, product, product_category):
+    product.category = product_category
+    get_product_by_id_mock.return_value = product
+    return product
+
+
+def generation(engine):
+    with Session(engine) as db:
+        return response_cache.generation(db)
+
+
+@pytest.mark.usefixtures('catalogue_product')
+def test_product_served_from_cache(client, get_product_by_id_mock):
+    first = client.get('/api/products/1')
+    second = client.get('/api/products/1')
+
+    assert first.status_code == second.status_code == HTTPStatus.OK, first.text
+    assert first.content == second.content
+    assert first.json()['category']['name'] == 'Скакалки'
+    assert first.headers['etag'] == second.headers['etag']
+    get_product_by_id_mock.assert_called_once()
+
+
+@pytest.mark.usefixtures('catalogue_product')
+def test_conditional_get(client):
+    tag = client.get('/api/products/1').headers['etag']
+
+    response = client.get('/api/products/1', headers={'If-None-Match': tag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers['etag'] == tag
+    assert not response.content
+
+    response = client.get('/api/products/1', headers={'If-None-Match': '"other"'})
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_catalogue_writes_invalidate(client, catalogue_product, database):
+    tag = client.get('/api/products/1').headers['etag']
+
+    # writes outside the catalogue or rolled back leave the cache alone
+    with database.begin() as connection:
+        connection.execute(
+            models.User.__table__.insert(),
+            {'login': 'a@b.c', 'first_name': 'Иван', 'last_name': 'Иванов'},
+        )
+    with pytest.raises(ZeroDivisionError):
+        with database.begin() as connection:
+            connection.execute(
+                models.ProductCategory.__table__.insert(),
+                {'name': 'Массажёры', 'description': ''},
+            )
+            raise ZeroDivisionError
+    assert client.get('/api/products/1').headers['etag'] == tag
+    assert generation(database) == 0
+
+    catalogue_product.name = 'Бирюзовая скакалка'
+    with database.begin() as connection:
+        connection.execute(
+            models.ProductInventory.__table__.update().values(quantity=1)
+        )
+    response = client.get('/api/products/1', headers={'If-None-Match': tag})
+
+    assert generation(database) == 1
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['name'] == 'Бирюзовая скакалка'
+
+
+def test_reads_during_a_commit_are_not_cached_as_new(
+    client, catalogue_product, database, mocker
+):
+    client.get('/api/products/1')
+    do_commit = database.dialect.do_commit
+    reads = []
+
+    def commit_with_concurrent_read(dbapi_connection):
+        # a GET served while the writer commits still sees the old rows
+        reads.append(client.get('/api/products/1').json()['name'])
+        catalogue_product.name = 'Бирюзовая скакалка'
+        do_commit(dbapi_connection)
+
+    mocker.patch.object(
+        database.dialect, 'do_commit', side_effect=commit_with_concurrent_read
+    )
+    with database.begin() as connection:
+        connection.execute(
+            models.ProductInventory.__table__.update().values(quantity=1)
+        )
+
+    assert reads == ['Бисерная скакалка']
+    assert client.get('/api/products/1').json()['name'] == 'Бирюзовая скакалка'
+
+
+def test_writes_of_other_processes_invalidate(client, catalogue_product, database):
+    tag = client.get('/api/products/1').headers['etag']
+
+    # the admin panel writes through its own engine, the entries stay in memory
+    admin_engine = create_engine(database.url)
+    with admin_engine.begin() as connection:
+        connection.execute(
+            models.Product.__table__.update().values(name='Бирюзовая скакалка')
+        )
+    admin_engine.dispose()
+    catalogue_product.name = 'Бирюзовая скакалка'
+
+    response = client.get('/api/products/1', headers={'If-None-Match': tag})
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['name'] == 'Бирюзовая скакалка'
+
+
+def test_redis_backend_shares_entries():
+    redis = FakeRedis()
+    api_cache = response_cache.RedisCacheBackend(redis, ttl=60)
+    admin_cache = response_cache.RedisCacheBackend(redis, ttl=60)
+
+    api_cache.set('0:/api/products/1', b'{}')
+
+    assert admin_cache.get('0:/api/products/1') == b'{}'
+    assert admin_cache.get('1:/api/products/1') is None
+
+
+def test_products_listing_served_from_redis(client, mocker, catalogue_product):
+    mocker.patch(
+        'app.response_cache.get_response_cache',
+        return_value=response_cache.RedisCacheBackend(FakeRedis(), ttl=60),
+    )
+    query = mocker.Mock()
+    query.count.return_value = 1
+    query.limit.return_value.offset.return_value.all.return_value = [catalogue_product]
+    get_query_mock = mocker.patch(
+        'app.db.crud.get_filtered_products_query', return_value=query
+    )
+
+    first = client.get('/api/products/', params={'filter_by_name': 'Бисер'})
+    second = client.get('/api/products/', params={'filter_by_name': 'Бисер'})
+    other_page = client.get(
+        '/api/products/', params={'filter_by_name': 'Бисер', 'page': 2}
+    )
+
+    assert first.status_code == HTTPStatus.OK, first.text
+    assert first.json()['total'] == 1
+    assert [item['sku'] for item in first.json()['items']] == ['ABC123']
+    assert second.content == first.content
+    assert other_page.json()['page'] == 2
+    assert get_query_mock.call_count == 2
@@ -1,16 +1,26 @@
+# pylint: disable=too-many-lines
+from decimal import Decimal
 from http import HTTPStatus
 
+import pytest
 from sqlalchemy.exc import IntegrityError
 
+from app.db import models, schemas
 from app.exceptions import (
     CategoryAlreadyRegistered,
     CategoryNotFound,
     CharacteristicAlreadyRegistered,
+    InvalidCursor,
+    InventoryNotFound,
+    NegativeStock,
     OrderAlreadyCompleted,
     OrderNotFound,
     OrderNotPaid,
+    PaymentAlreadyRecorded,
     ProductAlreadyRegistered,
     ProductNotFound,
+    UnsortedSearchCursor,
+    WrongPaymentSecret,
     WrongPrice,
 )
 
@@ -141,17 +151,187 @@ def test_get_product_failed(client, get_product_by_id_mock):
     assert data['detail'] == ProductNotFound.detail
 
 
-def test_increase_product_quantity(client, get_product_by_id_mock, product):
+def test_get_product_without_category(client, get_product_by_id_mock, product):
     get_product_by_id_mock.return_value = product
 
+    response = client.get('/api/products/1')
+
+    assert response.status_code == HTTPStatus.OK, response.text
+    assert response.json()['category'] is None
+
+
+def test_get_products_by_cursor_failed(client):
+    response = client.get('/api/products/cursor', params={'cursor': 'qwerty'})
+
+    assert response.status_code == InvalidCursor.status_code, response.text
+    data = response.json()
+    assert data['detail'] == InvalidCursor.detail
+
+
+def test_get_products_by_cursor_search(client, mocker):
+    mocker.patch('app.db.keyset.paginate', return_value=([], None, None))
+
+    # the relevance order of the matches has no cursor
+    response = client.get('/api/products/cursor', params={'search': 'скакалка'})
+    assert response.status_code == UnsortedSearchCursor.status_code, response.text
+    assert response.json()['detail'] == UnsortedSearchCursor.detail
+
+    response = client.get(
+        '/api/products/cursor', params={'search': 'скакалка', 'sort': 'price'}
+    )
+    assert response.status_code == HTTPStatus.OK, response.text
+
+
+def test_get_products_by_characteristic(client, mocker):
+    get_filtered_products_query_mock = mocker.patch(
+        'app.db.crud.get_filtered_products_query'
+    )
+    mocker.patch('app.db.keyset.paginate', return_value=([], None, None))
+
+    response = client.get(
+        '/api/products/cursor',
+        params={'filter_by_characteristic': ['2:Синий', '1:3 м.']},
+    )
+
+    assert response.status_code == HTTPStatus.OK, response.text
+    product_filters = get_filtered_products_query_mock.call_args.args[1]
+    assert product_filters.characteristic_values() == {1: ['3 м.'], 2: ['Синий']}
+
+
+def test_get_products_by_characteristic_failed(client):
+    response = client.get(
+        '/api/products/', params={'filter_by_characteristic': 'Синий'}
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY, response.text
+
+
+def test_get_products_sorted_in_price_range(client, mocker):
+    get_filtered_products_query_mock = mocker.patch(
+        'app.db.crud.get_filtered_products_query'
+    )
+    mocker.patch('app.db.keyset.paginate', return_value=([], None, None))
+
+    response = client.get(
+        '/api/products/cursor',
+        params={'sort': 'category,name', 'min_price': '500', 'max_price': '1000.5'},
+    )
+
+    assert response.status_code == HTTPStatus.OK, response.text
+    product_filters = get_filtered_products_query_mock.call_args.args[1]
+    assert product_filters.sort == schemas.ProductSort.CATEGORY_NAME
+    assert (product_filters.min_price, product_filters.max_price) == (
+        Decimal('500'),
+        Decimal('1000.5'),
+    )
+
+
+@pytest.mark.parametrize(
+    'params', [{'sort': 'sku'}, {'min_price': -1}, {'max_price': 'qwerty'}]
+)
+def test_get_products_sorted_in_price_range_failed(client, params):
+    response = client.get('/api/products/', params=params)
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY, response.text
+
+
+def test_get_facets(client, mocker):
+    mocker.patch(
+        'app.db.crud.get_category_facets',
+        return_value=[{'category_id': 1, 'name': 'Скакалки', 'product_count': 2}],
+    )
+    mocker.patch(
+        'app.db.crud.get_characteristic_facets',
+        return_value=[
+            {
+                'characteristic_id': 2,
+                'name': 'Цвет',
+                'characteristic_value': 'Синий',
+                'product_count': 3,
+            }
+        ],
+    )
+
+    response = client.get('/api/products/facets')
+
+    assert response.status_code == HTTPStatus.OK, response.text
+    assert response.json() == {
+        'categories': [{'category_id': 1, 'name': 'Скакалки', 'product_count': 2}],
+        'characteristics': [
+            {
+                'characteristic_id': 2,
+                'name': 'Цвет',
+                'characteristic_value': 'Синий',
+                'product_count': 3,
+            }
+        ],
+    }
+
+
+def test_import_products(client, mocker):
+    import_products_mock = mocker.patch(
+        'app.db.bulk_import.import_products',
+        return_value=schemas.ImportReport(
+            imported=1,
+            errors=[schemas.ImportRowError(row=2, error=WrongPrice.detail)],
+        ),
+    )
+    feed = 'sku,price\r\nABC123,1399\r\nDCE123,0\r\n'
+
+    response = client.post(
+        '/api/products/import',
+        files={'feed': ('feed.csv', feed.encode(), 'text/csv')},
+    )
+
+    assert response.status_code == HTTPStatus.OK, response.text
+    assert response.json() == {
+        'imported': 1,
+        'errors': [{'row': 2, 'error': WrongPrice.detail}],
+    }
+    rows = list(import_products_mock.call_args.args[1])
+    assert rows == [
+        (2, {'sku': 'ABC123', 'price': '1399', 'characteristics': []}),
+        (3, {'sku': 'DCE123', 'price': '0', 'characteristics': []}),
+    ]
+
+
+def test_import_products_not_utf8(client, mocker):
+    import_products_mock = mocker.patch(
+        'app.db.bulk_import.import_products', return_value=schemas.ImportReport()
+    )
+    feed = 'sku,name\r\nABC123,Скакалка\r\nDCE123,Скакалка\r\n'.encode()
+    feed = feed.replace('Скакалка'.encode(), 'Скакалка'.encode('cp1251'), 1)
+
+    response = client.post(
+        '/api/products/import',
+        files={'feed': ('feed.csv', feed, 'text/csv')},
+    )
+
+    assert response.status_code == HTTPStatus.OK, response.text
+    (number, error), row = list(import_products_mock.call_args.args[1])
+    assert (number, str(error)) == (2, 'invalid UTF-8')
+    assert row == (3, {'sku': 'DCE123', 'name': 'Скакалка', 'characteristics': []})
+
+
+def test_increase_product_quantity(client, adjust_product_quantity_mock, mocker):
+    adjust_product_quantity_mock.return_value = models.ProductInventory(
+        id=1, product_id=1, quantity=7
+    )
+
     response = client.patch('/api/products/1/inventory', params={'inc_value': 4})
 
     assert response.status_code == HTTPStatus.OK, response.text
     data = response.json()
     assert data['quantity'] == 7
+    adjust_product_quantity_mock.assert_called_once_with(
+        mocker.ANY, product_id=1, delta=4
+    )
 
 
-def test_increase_product_quantity_failed(client, get_product_by_id_mock):
+def test_increase_product_quantity_failed(
+    client, adjust_product_quantity_mock, get_product_by_id_mock
+):
+    adjust_product_quantity_mock.return_value = None
     get_product_by_id_mock.return_value = None
 
     response = client.patch('/api/products/1/inventory', params={'inc_value': 4})
@@ -161,6 +341,100 @@ def test_increase_product_quantity_failed(client, get_product_by_id_mock):
     assert data['detail'] == ProductNotFound.detail
 
 
+def test_increase_product_quantity_without_inventory(
+    client, adjust_product_quantity_mock, get_product_by_id_mock, product, mocker
+):
+    adjust_product_quantity_mock.return_value = None
+    get_product_by_id_mock.return_value = product
+    mocker.patch('app.db.crud.lock_inventory', return_value=[])
+
+    response = client.patch('/api/products/1/inventory', params={'inc_value': 4})
+
+    assert response.status_code == InventoryNotFound.status_code, response.text
+    data = response.json()
+    assert data['detail'] == InventoryNotFound.detail
+
+
+def test_increase_product_quantity_negative_stock(
+    client, adjust_product_quantity_mock, get_product_by_id_mock, product, mocker
+):
+    adjust_product_quantity_mock.return_value = None
+    get_product_by_id_mock.return_value = product
+    mocker.patch('app.db.crud.lock_inventory', return_value=[1])
+
+    response = client.patch('/api/products/1/inventory', params={'inc_value': -4})
+
+    assert response.status_code == NegativeStock.status_code, response.text
+    data = response.json()
+    assert data['detail'] == NegativeStock.detail
+
+
+def test_adjust_inventory(client, mocker):
+    get_product_ids_by_sku_mock = mocker.patch(
+        'app.db.crud.get_product_ids_by_sku', return_value={'ABC123': 1}
+    )
+    mocker.patch('app.db.crud.lock_inventory', return_value=[1, 2])
+    adjust_inventory_mock = mocker.patch(
+        'app.db.crud.adjust_inventory',
+        return_value=[
+            models.ProductInventory(id=1, product_id=1, quantity=2),
+            models.ProductInventory(id=2, product_id=2, quantity=5),
+        ],
+    )
+
+    response = client.patch(
+        '/api/products/inventory',
+        json=[
+            {'sku': 'ABC123', 'delta': 3},
+            {'product_id': 2, 'delta': 5},
+            {'product_id': 1, 'delta': -1},
+        ],
+    )
+
+    assert response.status_code == HTTPStatus.OK, response.text
+    assert [row['quantity'] for row in response.json()] == [2, 5]
+    get_product_ids_by_sku_mock.assert_called_once_with(mocker.ANY, {'ABC123'})
+    assert adjust_inventory_mock.call_args.args[1] == {1: 2, 2: 5}
+
+
+def test_adjust_inventory_unknown_sku(client, mocker):
+    mocker.patch('app.db.crud.get_product_ids_by_sku', return_value={})
+
+    response = client.patch(
+        '/api/products/inventory', json=[{'sku': 'ABC123', 'delta': 3}]
+    )
+
+    assert response.status_code == ProductNotFound.status_code, response.text
+    assert response.json()['detail'] == ProductNotFound.detail
+
+
+def test_adjust_inventory_negative_stock(client, mocker):
+    mocker.patch('app.db.crud.lock_inventory', return_value=[1, 2, 3])
+    mocker.patch('app.db.crud.adjust_inventory', return_value=None)
+    get_short_stock_mock = mocker.patch(
+        'app.db.crud.get_short_stock', return_value=[1, 3]
+    )
+
+    response = client.patch(
+        '/api/products/inventory',
+        json=[
+            {'product_id': 1, 'delta': -3},
+            {'product_id': 2, 'delta': 1},
+            {'product_id': 3, 'delta': -1},
+        ],
+    )
+
+    assert response.status_code == NegativeStock.status_code, response.text
+    assert response.json()['detail'] == f'{NegativeStock.detail} (products 1, 3)'
+    assert get_short_stock_mock.call_args.args[1] == {1: -3, 2: 1, 3: -1}
+
+
+def test_adjust_inventory_without_product(client):
+    response = client.patch('/api/products/inventory', json=[{'delta': 3}])
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY, response.text
+
+
 def test_complete_order_not_order(client, get_order_by_id_mock):
     get_order_by_id_mock.return_value = None
 
@@ -201,3 +475,77 @@ def test_complete_order(client, get_order_by_id_mock, order):
     assert response.status_code == HTTPStatus.OK, response.text
     data = response.json()
     assert data['is_processed'] == 1
+
+
+def test_get_order_payment(client, get_order_by_id_mock, order):
+    get_order_by_id_mock.return_value = order
+
+    response = client.get('/api/orders/1/payment')
+
+    assert response.status_code == HTTPStatus.OK, response.text
+    assert response.json() == {
+        'id': 1,
+        'payment_status': models.Order.PENDING_PAYMENT,
+        'is_paid': False,
+    }
+
+
+def test_get_order_payment_not_order(client, get_order_by_id_mock):
+    get_order_by_id_mock.return_value = None
+
+    response = client.get('/api/orders/1/payment')
+
+    assert response.status_code == OrderNotFound.status_code, response.text
+
+
+@pytest.mark.usefixtures('payment_secret')
+@pytest.mark.parametrize('headers', [{}, {'X-Payment-Secret': 'wrong'}])
+def test_notify_order_payment_wrong_secret(client, record_payment_mock, headers):
+    response = client.post(
+        '/api/orders/1/payment', json={'paid': True}, headers=headers
+    )
+
+    assert response.status_code == WrongPaymentSecret.status_code, response.text
+    record_payment_mock.assert_not_called()
+
+
+def test_notify_order_payment_disabled(client, record_payment_mock):
+    response = client.post(
+        '/api/orders/1/payment', json={'paid': True}, headers={'X-Payment-Secret': ''}
+    )
+
+    assert response.status_code == WrongPaymentSecret.status_code, response.text
+    record_payment_mock.assert_not_called()
+
+
+def test_notify_order_payment(
+    client, get_order_by_id_mock, record_payment_mock, payment_secret, order
+):
+    get_order_by_id_mock.return_value = order
+    record_payment_mock.return_value = True
+
+    response = client.post(
+        '/api/orders/1/payment',
+        json={'paid': True},
+        headers={'X-Payment-Secret': payment_secret},
+    )
+
+    assert response.status_code == HTTPStatus.OK, response.text
+    assert response.json() == {'id': 1, 'payment_status': 'paid', 'is_paid': True}
+    assert record_payment_mock.call_args.kwargs == {'order_id': 1, 'paid': True}
+
+
+def test_notify_order_payment_recorded(
+    client, get_order_by_id_mock, record_payment_mock, payment_secret, order
+):
+    get_order_by_id_mock.return_value = order
+    record_payment_mock.return_value = False
+
+    response = client.post(
+        '/api/orders/1/payment',
+        json={'paid': False},
+        headers={'X-Payment-Secret': payment_secret},
+    )
+
+    assert response.status_code == PaymentAlreadyRecorded.status_code, response.text
+    assert response.json()['detail'] == PaymentAlreadyRecorded.detail
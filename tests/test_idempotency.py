@@ -0,0 +1,121 @@
+# pylint: disable=W0621
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import get_settings
+from app.db import models
+from app.db.database import dispose_engine, get_engine, get_session
+from app.exceptions import IdempotencyKeyReused, InsufficientStock
+from app.idempotency import REPLAYED_HEADER
+from app.main import app
+
+
+@pytest.fixture()
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "test.db"}')
+    get_settings.cache_clear()
+    models.Base.metadata.create_all(bind=get_engine())
+    with get_session()() as db:
+        db.add(models.ProductCategory(id=1, name='Скакалки', description=''))
+        db.add(
+            models.Product(
+                id=1, name='Скакалка', sku='ABC123', description='', price=1399
+            )
+        )
+        db.add(models.ProductInventory(product_id=1, quantity=10))
+        db.commit()
+    yield TestClient(app)
+    dispose_engine()
+    get_settings.cache_clear()
+
+
+def order_json(quantity=2):
+    return {
+        'total': '2798.00',
+        'user': {
+            'login': 'qwertyqwerty@rambler.ru',
+            'first_name': 'Иван',
+            'last_name': 'Иванов',
+        },
+        'shipping_address': {
+            'country': 'Россия',
+            'city': 'Москва',
+            'postcode': '119991',
+            'address': 'Мой адрес',
+        },
+        'items': [{'product': {'id': 1}, 'quantity': quantity, 'price_per_item': 1399}],
+    }
+
+
+def order_count_and_stock():
+    with get_session()() as db:
+        return (
+            db.query(models.Order).count(),
+            db.get(models.ProductInventory, 1).quantity,
+        )
+
+
+def test_retry_is_replayed(client):
+    headers = {'Idempotency-Key': 'order-1'}
+
+    first = client.post('/api/orders/', json=order_json(), headers=headers)
+    retry = client.post('/api/orders/', json=order_json(), headers=headers)
+
+    assert first.status_code == retry.status_code == HTTPStatus.OK, retry.text
+    assert retry.content == first.content
+    assert REPLAYED_HEADER not in first.headers
+    assert retry.headers[REPLAYED_HEADER] == 'true'
+    assert order_count_and_stock() == (1, 8)
+
+
+def test_requests_without_key_are_not_deduplicated(client):
+    client.post('/api/orders/', json=order_json())
+    client.post('/api/orders/', json=order_json())
+
+    assert order_count_and_stock() == (2, 6)
+
+
+def test_key_reused_for_another_request(client):
+    headers = {'Idempotency-Key': 'order-1'}
+    client.post('/api/orders/', json=order_json(), headers=headers)
+
+    response = client.post('/api/orders/', json=order_json(quantity=1), headers=headers)
+
+    assert response.status_code == IdempotencyKeyReused.status_code, response.text
+    assert response.json()['detail'] == IdempotencyKeyReused.detail
+    assert order_count_and_stock() == (1, 8)
+
+
+def test_failed_request_frees_the_key(client):
+    headers = {'Idempotency-Key': 'order-1'}
+
+    response = client.post(
+        '/api/orders/', json=order_json(quantity=11), headers=headers
+    )
+    assert response.status_code == InsufficientStock.status_code, response.text
+
+    with get_session()() as db:
+        db.get(models.ProductInventory, 1).quantity = 20
+        db.commit()
+    response = client.post(
+        '/api/orders/', json=order_json(quantity=11), headers=headers
+    )
+    assert response.status_code == HTTPStatus.OK, response.text
+    assert order_count_and_stock() == (1, 9)
+
+
+def test_concurrent_duplicates(client):
+    def post(_):
+        return client.post(
+            '/api/orders/', json=order_json(), headers={'Idempotency-Key': 'order-1'}
+        )
+
+    with ThreadPoolExecutor(4) as executor:
+        responses = list(executor.map(post, range(4)))
+
+    assert {response.status_code for response in responses} == {HTTPStatus.OK}
+    assert len({response.content for response in responses}) == 1
+    assert order_count_and_stock() == (1, 8)
@@ -0,0 +1,146 @@
+# pylint: disable=W0621
+import json
+import logging
+from http import HTTPStatus
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app import metrics
+from app.config import get_settings
+from app.db import crud, instrumentation, models
+from app.db.database import dispose_engine, get_engine, get_session
+from app.main import app
+
+
+@pytest.fixture()
+def registry(monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, 'registry', registry)
+    return registry
+
+
+@pytest.fixture()
+def client(tmp_path, monkeypatch, registry):  # pylint: disable=unused-argument
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "test.db"}')
+    get_settings.cache_clear()
+    models.Base.metadata.create_all(bind=get_engine())
+    with get_session()() as db:
+        db.add(models.ProductCategory(id=1, name='Скакалки', description=''))
+        db.add_all(
+            models.Product(
+                id=i,
+                name='Скакалка',
+                sku=f'SKU{i}',
+                description='',
+                price=1399,
+                category_id=1,
+            )
+            for i in (1, 2, 3)
+        )
+        db.commit()
+    yield TestClient(app)
+    dispose_engine()
+    get_settings.cache_clear()
+
+
+def test_request_metrics(client, registry):
+    response = client.get('/api/products/', params={'size': 2})
+    assert response.status_code == HTTPStatus.OK, response.text
+
+    labels = ('GET', '/api/products/')
+    assert registry.requests[('GET', '/api/products/', '200')] == 1
+    # the page and its count
+    assert sum(registry.db_statements.series[labels][1]) >= 2
+    assert sum(registry.db_rows.series[labels][1]) >= 3
+    assert sum(registry.db_time.series[labels][1]) > 0
+    assert sum(registry.serialization_time.series[labels][1]) > 0
+    assert labels in registry.pool_wait.series
+
+    text = client.get('/metrics').text
+    assert (
+        'http_requests_total{method="GET",route="/api/products/",status="200"} 1'
+        in text
+    )
+    assert 'db_statements_per_request_count{method="GET",route="/api/products/"} 1' in (
+        text
+    )
+
+
+def test_route_templates(client, registry):
+    client.get('/api/products/1')
+    client.get('/api/products/2')
+    client.get('/api/products/42')
+    client.get('/no/such/page')
+
+    assert registry.requests == {
+        ('GET', '/api/products/{product_id}', '200'): 2,
+        ('GET', '/api/products/{product_id}', '404'): 1,
+        ('GET', 'unmatched', '404'): 1,
+    }
+
+
+@pytest.mark.usefixtures('registry')
+def test_metrics_log(caplog):
+    log_app = FastAPI()
+    log_app.add_middleware(metrics.MetricsMiddleware, log=True)
+
+    @log_app.get('/items/{item_id}')
+    def get_item(item_id: int):
+        return {'id': item_id}
+
+    with caplog.at_level(logging.INFO, logger='app.metrics'):
+        TestClient(log_app).get('/items/1')
+
+    line = json.loads(caplog.records[-1].getMessage())
+    assert line['route'] == '/items/{item_id}'
+    assert line['status'] == 200
+    assert line['db_statements'] == 0
+
+
+def test_histogram_render():
+    histogram = metrics.Histogram('duration_seconds', 'Duration.', (0.1, 1))
+    for value in (0.05, 0.5, 0.7, 5):
+        histogram.observe(('GET', '/a"b'), value)
+
+    assert list(histogram.render(('method', 'route'))) == [
+        '# HELP duration_seconds Duration.',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{method="GET",route="/a\\"b",le="0.1"} 1',
+        'duration_seconds_bucket{method="GET",route="/a\\"b",le="1"} 3',
+        'duration_seconds_bucket{method="GET",route="/a\\"b",le="+Inf"} 4',
+        'duration_seconds_sum{method="GET",route="/a\\"b"} 6.25',
+        'duration_seconds_count{method="GET",route="/a\\"b"} 4',
+    ]
+
+
+def test_cache_metrics(client):
+    crud.reference_cache.clear()
+    with get_session()() as db:
+        crud.get_product_category_by_id(db, category_id=1)
+        crud.get_product_category_by_id(db, category_id=1)
+    stats = crud.reference_cache.stats()
+
+    text = client.get('/metrics').text
+    assert f'cache_hits_total{{cache="reference"}} {stats["hits"]}' in text
+    assert f'cache_misses_total{{cache="reference"}} {stats["misses"]}' in text
+    assert 'cache_entries{cache="reference"} 1' in text
+
+
+def test_failed_statements_are_forgotten():
+    engine = create_engine('sqlite://')
+    instrumentation.instrument_engine(engine)
+    token = metrics._current.set(  # pylint: disable=protected-access
+        metrics.RequestStats()
+    )
+    try:
+        with engine.connect() as connection:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    connection.execute(text('SELECT * FROM no_such_table'))
+            assert not connection.info.get('metrics_start')
+    finally:
+        metrics._current.reset(token)  # pylint: disable=protected-access
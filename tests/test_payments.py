@@ -0,0 +1,171 @@
+# pylint: disable=W0621
+import asyncio
+from decimal import Decimal
+
+import pytest
+
+from app import payments
+from app.config import get_settings
+from app.db import models
+from app.db.database import dispose_engine, get_engine, get_session
+
+
+@pytest.fixture()
+def orders(tmp_path, monkeypatch):
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "test.db"}')
+    get_settings.cache_clear()
+    models.Base.metadata.create_all(bind=get_engine())
+    with get_session()() as db:
+        db.add_all(
+            models.Order(id=order_id, total=Decimal(order_id), is_paid=False)
+            for order_id in (1, 2, 3)
+        )
+        db.commit()
+    yield
+    dispose_engine()
+    get_settings.cache_clear()
+
+
+class ScriptedGateway:
+    def __init__(self, outcomes, latency=0):
+        # order id -> outcomes of the successive charges (an exception is raised)
+        self.outcomes = outcomes
+        self.latency = latency
+        self.charges = []
+
+    async def charge(self, order_id, amount):
+        self.charges.append((order_id, amount))
+        await asyncio.sleep(self.latency)
+        outcome = self.outcomes[order_id].pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def payment_statuses():
+    with get_session()() as db:
+        return {
+            order.id: (order.payment_status, order.is_paid)
+            for order in db.query(models.Order)
+        }
+
+
+def run_workers(gateway, settled, max_attempts=5, processes=1):
+    async def run():
+        # the workers of each API process
+        pools = [
+            payments.PaymentWorkers(
+                gateway,
+                workers=2,
+                poll_interval=0.01,
+                retry_delay=0,
+                max_attempts=max_attempts,
+            )
+            for _ in range(processes)
+        ]
+        for workers in pools:
+            workers.start()
+        try:
+            for _ in range(200):
+                if settled():
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            for workers in pools:
+                await workers.stop()
+
+    asyncio.run(run())
+
+
+@pytest.mark.usefixtures('orders')
+def test_payment_workers():
+    gateway = ScriptedGateway({1: [True], 2: [False], 3: [True]})
+
+    run_workers(
+        gateway,
+        lambda: all(
+            status not in models.Order.UNSETTLED
+            for status, _ in payment_statuses().values()
+        ),
+    )
+
+    assert payment_statuses() == {
+        1: (models.Order.PAID, True),
+        2: (models.Order.PAYMENT_FAILED, False),
+        3: (models.Order.PAID, True),
+    }
+    assert sorted(gateway.charges) == [
+        (1, Decimal(1)),
+        (2, Decimal(2)),
+        (3, Decimal(3)),
+    ]
+
+
+@pytest.mark.usefixtures('orders')
+def test_orders_charged_once_by_two_processes():
+    # both poll the same orders, the slow gateway keeps the charges overlapping
+    gateway = ScriptedGateway({1: [True], 2: [False], 3: [True]}, latency=0.05)
+
+    run_workers(
+        gateway,
+        lambda: all(
+            status not in models.Order.UNSETTLED
+            for status, _ in payment_statuses().values()
+        ),
+        processes=2,
+    )
+
+    assert sorted(gateway.charges) == [
+        (1, Decimal(1)),
+        (2, Decimal(2)),
+        (3, Decimal(3)),
+    ]
+    assert payment_statuses()[2] == (models.Order.PAYMENT_FAILED, False)
+
+
+@pytest.mark.usefixtures('orders')
+def test_payment_workers_retry_failed_charges():
+    gateway = ScriptedGateway({1: [ConnectionError(), True], 2: [True], 3: [True]})
+
+    run_workers(
+        gateway,
+        lambda: payment_statuses()[1] == (models.Order.PAID, True),
+    )
+
+    assert [order_id for order_id, _ in gateway.charges].count(1) == 2
+
+
+@pytest.mark.usefixtures('orders')
+def test_payment_workers_give_up_after_max_attempts():
+    # orders 1 and 2 keep failing, they must not hold up order 3
+    gateway = ScriptedGateway(
+        {1: [ConnectionError()] * 3, 2: [ConnectionError()] * 3, 3: [True]}
+    )
+
+    run_workers(
+        gateway,
+        lambda: all(
+            status not in models.Order.UNSETTLED
+            for status, _ in payment_statuses().values()
+        ),
+        max_attempts=3,
+    )
+
+    assert payment_statuses() == {
+        1: (models.Order.PAYMENT_FAILED, False),
+        2: (models.Order.PAYMENT_FAILED, False),
+        3: (models.Order.PAID, True),
+    }
+    charged = [order_id for order_id, _ in gateway.charges]
+    assert (charged.count(1), charged.count(2), charged.count(3)) == (3, 3, 1)
+
+
+@pytest.mark.parametrize('success_rate, paid', [(1, True), (0, False)])
+def test_fake_gateway(success_rate, paid):
+    gateway = payments.FakeGateway(latency=0, success_rate=success_rate)
+
+    assert asyncio.run(gateway.charge(1, Decimal(1))) is paid
+    # charged again, the order gets its first outcome
+    gateway.success_rate = 1 - success_rate
+    assert asyncio.run(gateway.charge(1, Decimal(1))) is paid
+    assert asyncio.run(gateway.charge(2, Decimal(1))) is not paid
@@ -0,0 +1,167 @@
+# pylint: disable=W0621
+import asyncio
+import sqlite3
+from http import HTTPStatus
+
+import pytest
+import sqlalchemy as sa
+from fastapi.testclient import TestClient
+
+from app import payments, response_cache
+from app.config import get_settings
+from app.db import models
+from app.db.database import (
+    dispose_async_engine,
+    dispose_engine,
+    get_async_read_session,
+    get_engine,
+    get_read_session,
+    get_replica_set,
+    get_routing_session,
+    get_session,
+)
+from app.db.replicas import LAST_WRITE_HEADER, ReadYourWritesMiddleware
+from app.main import app
+
+
+def configure(monkeypatch, primary, replica):
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f'sqlite:///{primary}')
+    monkeypatch.setenv('SQLALCHEMY_REPLICA_URIS', f'["sqlite:///{replica}"]')
+    monkeypatch.setenv('RESPONSE_CACHE_TTL', '0')
+    get_settings.cache_clear()
+    response_cache.get_response_cache.cache_clear()
+
+
+def add_product(product_id):
+    with get_session()() as db:
+        db.add(
+            models.Product(
+                id=product_id,
+                name=f'Скакалка {product_id}',
+                sku=f'SKU{product_id}',
+                description='',
+                price=1399,
+                category_id=1,
+            )
+        )
+        db.add(models.ProductInventory(product_id=product_id, quantity=1))
+        db.commit()
+
+
+@pytest.fixture()
+def lagging_replica(tmp_path, monkeypatch):
+    """A replica which has product 1, but not product 2 yet."""
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    configure(monkeypatch, primary, replica)
+    models.Base.metadata.create_all(bind=get_engine())
+    with get_session()() as db:
+        db.add(models.ProductCategory(id=1, name='Скакалки', description=''))
+        db.commit()
+    add_product(1)
+    with sqlite3.connect(primary) as source, sqlite3.connect(replica) as target:
+        source.backup(target)
+    add_product(2)
+    yield
+    dispose_engine()
+    get_settings.cache_clear()
+    response_cache.get_response_cache.cache_clear()
+
+
+def product_ids(db):
+    return db.execute(sa.select(models.Product.id)).scalars().all()
+
+
+@pytest.mark.usefixtures('lagging_replica')
+def test_reads_go_to_the_replica():
+    with get_read_session()() as db:
+        assert product_ids(db) == [1]
+
+
+@pytest.mark.usefixtures('lagging_replica')
+def test_session_reads_its_writes():
+    with get_routing_session()() as db:
+        assert product_ids(db) == [1]
+        db.add(models.ProductCategory(id=2, name='Коврики', description=''))
+        db.flush()
+
+        assert product_ids(db) == [1, 2]
+        db.commit()
+
+
+@pytest.mark.usefixtures('lagging_replica')
+def test_async_reads_go_to_the_replica():
+    async def read():
+        try:
+            async with get_async_read_session()() as db:
+                return await db.run_sync(product_ids)
+        finally:
+            await dispose_async_engine()
+
+    assert asyncio.run(read()) == [1]
+
+
+@pytest.mark.usefixtures('lagging_replica')
+def test_client_reads_its_writes():
+    client = TestClient(ReadYourWritesMiddleware(app))
+    assert client.get('/api/products/2').status_code == HTTPStatus.NOT_FOUND
+
+    response = client.patch('/api/products/1/inventory', params={'inc_value': 1})
+    assert response.status_code == HTTPStatus.OK, response.text
+    stamp = response.headers[LAST_WRITE_HEADER]
+
+    # the cookie, or the header, sends the client's reads to the primary
+    assert client.get('/api/products/2').status_code == HTTPStatus.OK
+    other_client = TestClient(ReadYourWritesMiddleware(app))
+    assert other_client.get('/api/products/2').status_code == HTTPStatus.NOT_FOUND
+    response = other_client.get('/api/products/2', headers={LAST_WRITE_HEADER: stamp})
+    assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.usefixtures('lagging_replica')
+def test_client_reads_its_writes_past_the_response_cache(monkeypatch):
+    monkeypatch.setenv('RESPONSE_CACHE_TTL', '60')
+    get_settings.cache_clear()
+    response_cache.get_response_cache.cache_clear()
+    client = TestClient(ReadYourWritesMiddleware(app))
+    other_client = TestClient(ReadYourWritesMiddleware(app))
+
+    response = client.patch('/api/products/1/inventory', params={'inc_value': 1})
+    assert response.status_code == HTTPStatus.OK, response.text
+    # read from the replica, and cached under the generation of the write
+    assert other_client.get('/api/products/').json()['total'] == 1
+
+    assert client.get('/api/products/').json()['total'] == 2
+    assert other_client.get('/api/products/').json()['total'] == 1
+
+
+@pytest.mark.usefixtures('lagging_replica')
+def test_payments_poll_the_primary():
+    async def poll():
+        try:
+            return await payments.run_in_session(product_ids, read_only=True)
+        finally:
+            await dispose_async_engine()
+
+    assert asyncio.run(poll()) == [1, 2]
+
+
+def test_failover_to_the_primary(tmp_path, monkeypatch, caplog):
+    configure(monkeypatch, tmp_path / 'primary.db', tmp_path / 'missing' / 'replica.db')
+    try:
+        models.Base.metadata.create_all(bind=get_engine())
+        with get_session()() as db:
+            db.add(models.ProductCategory(id=1, name='Скакалки', description=''))
+            db.commit()
+        add_product(1)
+
+        with get_read_session()() as db:
+            assert product_ids(db) == [1]
+
+        assert 'is down' in caplog.text
+        (replica,) = get_replica_set().binds
+        assert replica in get_replica_set().down_until
+        assert get_replica_set().pick() is None
+    finally:
+        dispose_engine()
+        get_settings.cache_clear()
+        response_cache.get_response_cache.cache_clear()
@@ -0,0 +1,186 @@
+# pylint: disable=W0621
+import random
+from datetime import datetime
+from decimal import Decimal
+
+import orjson
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi_pagination import Page
+from pydantic import BaseModel, ValidationError, parse_obj_as
+
+from app import serializers
+from app.db import models, schemas
+
+
+def pydantic_json(response_model, content):
+    """What FastAPI returns for ``content`` with this response_model."""
+    return JSONResponse(jsonable_encoder(parse_obj_as(response_model, content))).body
+
+
+def fast_json(response_model, content):
+    return orjson.dumps(serializers.compile_serializer(response_model)(content))
+
+
+def make_product(product_id, name='Бисерная скакалка', price=Decimal('1399.00')):
+    category = models.ProductCategory(
+        id=1, name='Скакалки', description='Самые "лучшие"\nскакалки'
+    )
+    characteristic = models.Characteristic(id=1, name='Длина троса')
+    return models.Product(
+        id=product_id,
+        name=name,
+        sku=f'SKU{product_id}',
+        description='Прыгай как Тайсон! \\ / \t   😀',
+        price=price,
+        category_id=1,
+        category=category,
+        characteristics=[
+            models.ProductCharacteristic(
+                characteristic_value='3 м.', characteristic=characteristic
+            ),
+            models.ProductCharacteristic(characteristic_value='без характеристики'),
+        ],
+    )
+
+
+def make_order(second_name='Иваныч', is_processed=False):
+    return models.Order(
+        id=1,
+        creation_date=datetime(2022, 5, 1, 12, 30),
+        total=Decimal('2798.50'),
+        is_paid=True,
+        is_processed=is_processed,
+        user=models.User(
+            login='qwertyqwerty@rambler.ru',
+            first_name='Иван',
+            second_name=second_name,
+            last_name='Иванов',
+            telephone_number=None,
+        ),
+        shipping_address=models.ShippingAddress(
+            country='Россия',
+            city='Москва',
+            postcode='119991',
+            address='Мой адрес',
+            apartment=None,
+        ),
+        items=[
+            models.OrderItems(
+                product=models.Product(id=product_id),
+                quantity=quantity,
+                price_per_item=Decimal('1399.25'),
+            )
+            for product_id, quantity in ((1, 2), (7, 1))
+        ],
+    )
+
+
+@pytest.mark.parametrize(
+    'price',
+    [
+        Decimal('1399.00'),
+        Decimal('0.0001'),
+        Decimal('99.99999999'),
+        Decimal('1234567.891'),
+        Decimal('9999999999999998'),
+        Decimal('1399'),
+        1399.5,
+    ],
+)
+def test_product(price):
+    product = make_product(1, price=price)
+
+    assert fast_json(schemas.ProductExt, product) == pydantic_json(
+        schemas.ProductExt, product
+    )
+
+
+def test_product_without_characteristics():
+    product = make_product(1)
+    product.characteristics = []
+
+    assert fast_json(schemas.ProductExt, product) == pydantic_json(
+        schemas.ProductExt, product
+    )
+
+
+def test_pages():
+    items = [make_product(i, name=f'Скакалка {i}') for i in range(1, 101)]
+    page = {'items': items, 'total': 1000, 'page': 3, 'size': 100}
+    cursor_page = {
+        'items': items,
+        'size': 100,
+        'next_cursor': 'eyJrIjpbMTAwXSwiYiI6ZmFsc2V9',
+        'previous_cursor': None,
+        'total': None,
+    }
+
+    assert fast_json(Page[schemas.ProductExt], page) == pydantic_json(
+        Page[schemas.ProductExt], page
+    )
+    assert fast_json(schemas.CursorPage[schemas.ProductExt], cursor_page) == (
+        pydantic_json(schemas.CursorPage[schemas.ProductExt], cursor_page)
+    )
+
+
+@pytest.mark.parametrize('second_name', ['Иваныч', None])
+def test_orders(second_name):
+    order = make_order(second_name=second_name, is_processed=True)
+
+    assert fast_json(schemas.Order, order) == pydantic_json(schemas.Order, order)
+    assert fast_json(schemas.ProcessedOrder, order) == pydantic_json(
+        schemas.ProcessedOrder, order
+    )
+
+
+def test_random_strings():
+    rng = random.Random(13)
+    alphabet = [chr(code) for code in range(0x250)] + [' ', '😀', '﻿']
+    for _ in range(500):
+        name = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+        product = make_product(1, name=name)
+        assert fast_json(schemas.ProductExt, product) == pydantic_json(
+            schemas.ProductExt, product
+        )
+
+
+@pytest.mark.parametrize('price', [Decimal('0.00001'), Decimal('12345678901234567.5')])
+def test_render_falls_back_to_pydantic(price):
+    product = make_product(1, price=price)
+
+    with pytest.raises(serializers.Incompatible):
+        fast_json(schemas.ProductExt, product)
+    assert serializers.render(schemas.ProductExt, product) == pydantic_json(
+        schemas.ProductExt, product
+    )
+
+
+def test_product_without_category():
+    product = make_product(1)
+    product.category = None
+
+    assert fast_json(schemas.ProductExt, product) == pydantic_json(
+        schemas.ProductExt, product
+    )
+
+
+@pytest.mark.parametrize('field', ['sku', 'name', 'price'])
+def test_required_field_is_none(field):
+    product = make_product(1)
+    setattr(product, field, None)
+
+    with pytest.raises(serializers.Incompatible):
+        fast_json(schemas.ProductExt, product)
+    # as FastAPI's own rendering would, rather than inventing values
+    with pytest.raises(ValidationError):
+        serializers.render(schemas.ProductExt, product)
+
+
+def test_unsupported_field_type():
+    class Event(BaseModel):
+        at: datetime
+
+    with pytest.raises(TypeError):
+        serializers.compile_serializer(Event)